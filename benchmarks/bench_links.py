@@ -0,0 +1,253 @@
+#!/usr/bin/env python
+# coding: utf8
+"""
+    bench_links
+    -----------
+
+    Reproducible pylink benchmarks. Every link talks to a local stand-in
+    (in-process TCP, UDP, Unix socket and memory echo servers, a
+    pseudo-terminal echo device for SerialLink and a scripted modem for
+    GSMLink), so runs only depend on the machine and can be compared
+    between releases::
+
+      $ python benchmarks/bench_links.py --output after.json
+      $ python benchmarks/bench_links.py --compare before.json
+
+    Results are written as JSON: a ``meta`` object (versions, platform,
+    date) and a ``results`` list with the latency percentiles (ms) and
+    throughput (bytes/s) of each case.
+
+    :copyright: Copyright 2012 Salem Harrache and contributors, see AUTHORS.
+    :license: BSD.
+
+"""
+import argparse
+import json
+import os
+import platform
+import socket
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import pylink
+from pylink import link_from_url
+from pylink.testing import EchoServer, MemoryEcho, SerialEcho, FakeModem
+from pylink import codecs
+
+PAYLOADS = (16, 256, 4096)
+SERIAL_PAYLOADS = (16, 256, 1024)
+TIMEOUTS = (0.01, 0.05, 0.2)
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(q * (len(values) - 1))))]
+
+
+def summarize(name, durations, nbytes=0, **case):
+    total = sum(durations)
+    result = dict(case, name=name, iterations=len(durations),
+                  p50_ms=percentile(durations, 0.5) * 1000,
+                  p99_ms=percentile(durations, 0.99) * 1000,
+                  mean_ms=total / len(durations) * 1000)
+    if nbytes:
+        result['throughput_Bps'] = nbytes * len(durations) / total
+    return result
+
+
+def bench_roundtrip(transport, url, payloads, iterations):
+    '''write(payload) then read(len(payload)) on an echo peer.'''
+    link = link_from_url(url)
+    link.open()
+    results = []
+    for size in payloads:
+        payload = b'x' * size
+        durations = []
+        for i in range(iterations):
+            begin = time.perf_counter()
+            link.write(payload)
+            received = link.read(size)
+            durations.append(time.perf_counter() - begin)
+            assert len(received) == size, (transport, size, len(received))
+        results.append(summarize('roundtrip', durations, 2 * size,
+                                 transport=transport, payload=size))
+    link.close()
+    return results
+
+
+def bench_read_until(url, iterations):
+    '''write a line then read_until the terminator on an echo peer.'''
+    link = link_from_url(url)
+    payload = b'x' * 62 + b'\r\n'
+    durations = []
+    for i in range(iterations):
+        begin = time.perf_counter()
+        link.write(payload)
+        link.read_until(b'\r\n')
+        durations.append(time.perf_counter() - begin)
+    link.close()
+    return [summarize('read_until', durations, 2 * len(payload),
+                      transport='tcp', payload=len(payload))]
+
+
+def bench_timeouts(url, iterations):
+    '''Overshoot of a read on a silent link past its timeout.'''
+    link = link_from_url(url)
+    link.open()
+    results = []
+    for timeout in TIMEOUTS:
+        durations = []
+        for i in range(max(3, iterations // 50)):
+            begin = time.perf_counter()
+            link.read(1, timeout=timeout / link.timeout,
+                      first_timeout=timeout)
+            durations.append(time.perf_counter() - begin - timeout)
+        results.append(summarize('timeout_overshoot', durations,
+                                 transport='tcp', timeout=timeout))
+    link.close()
+    return results
+
+
+def bench_link_from_url(urls, iterations):
+    '''Cost of building (not opening) a link from its url.'''
+    results = []
+    for transport, url in urls:
+        durations = []
+        for i in range(iterations):
+            begin = time.perf_counter()
+            link_from_url(url)
+            durations.append(time.perf_counter() - begin)
+        results.append(summarize('link_from_url', durations,
+                                 transport=transport))
+    return results
+
+
+def bench_open_close(url, iterations):
+    '''Connect and close a TCP link.'''
+    durations = []
+    for i in range(max(10, iterations // 10)):
+        link = link_from_url(url)
+        begin = time.perf_counter()
+        link.open()
+        link.close()
+        durations.append(time.perf_counter() - begin)
+    return [summarize('open_close', durations, transport='tcp')]
+
+
+def bench_codecs(iterations, frames=64, payload=256):
+    '''Decode a buffer of `frames` frames of each codec, without I/O.'''
+    data = bytes(bytearray(range(256))) * (payload // 256)
+    cases = [('length', codecs.LengthPrefixed(2)),
+             ('slip', codecs.SLIP()), ('cobs', codecs.COBS()),
+             ('stx-etx', codecs.STXETX()),
+             ('slip+crc16', codecs.Checked(codecs.SLIP(), 'crc16')),
+             ('slip+crc16-modbus', codecs.Checked(codecs.SLIP(),
+                                                  'crc16-modbus')),
+             ('slip+crc32', codecs.Checked(codecs.SLIP(), 'crc32'))]
+    results = []
+    for name, codec in cases:
+        frame = codec.encode(data.replace(b'\x02', b'').replace(b'\x03', b'')
+                             if name == 'stx-etx' else data)
+        stream = frame * frames
+        durations = []
+        for i in range(max(10, iterations // 10)):
+            buffer = bytearray(stream)
+            begin = time.perf_counter()
+            while True:
+                result = codec.decode(buffer)
+                if result is None:
+                    break
+                del buffer[:result[1]]
+            durations.append(time.perf_counter() - begin)
+        results.append(summarize('decode', durations, len(stream),
+                                 transport=name, payload=payload))
+    return results
+
+
+def run(iterations):
+    tcp = EchoServer(socket.SOCK_STREAM)
+    udp = EchoServer(socket.SOCK_DGRAM)
+    directory = tempfile.mkdtemp()
+    unix = EchoServer(host=os.path.join(directory, 'echo.sock'))
+    memory = MemoryEcho('bench')
+    serial = SerialEcho()
+    modem = FakeModem()
+    serial_url = 'serial:%s:115200' % serial.port
+    gsm_url = 'gsm:0102030405:serial:%s:115200' % modem.port
+    try:
+        results = []
+        results += bench_roundtrip('tcp', tcp.url, PAYLOADS, iterations)
+        results += bench_roundtrip('udp', udp.url, PAYLOADS, iterations)
+        results += bench_roundtrip('unix', unix.url, PAYLOADS, iterations)
+        results += bench_roundtrip('memory', memory.url, PAYLOADS,
+                                   iterations)
+        results += bench_roundtrip('serial', serial_url, SERIAL_PAYLOADS,
+                                   iterations)
+        results += bench_roundtrip('gsm', gsm_url, SERIAL_PAYLOADS,
+                                   iterations)
+        results += bench_read_until(tcp.url, iterations)
+        results += bench_timeouts(tcp.url, iterations)
+        results += bench_open_close(tcp.url, iterations)
+        results += bench_link_from_url([('tcp', tcp.url), ('udp', udp.url),
+                                        ('serial', serial_url),
+                                        ('gsm', gsm_url)], iterations)
+        results += bench_codecs(iterations)
+    finally:
+        for stand_in in (tcp, udp, unix, memory, serial, modem):
+            stand_in.close()
+        os.rmdir(directory)
+    return results
+
+
+def key(result):
+    return tuple((name, result.get(name))
+                 for name in ('name', 'transport', 'payload', 'timeout'))
+
+
+def compare(results, baseline):
+    previous = dict((key(result), result) for result in baseline['results'])
+    for result in results:
+        old = previous.get(key(result))
+        label = ' '.join('%s=%s' % item for item in key(result)
+                         if item[1] is not None)
+        if old is None:
+            print('%-50s p50 %8.3f ms (new)' % (label, result['p50_ms']))
+        else:
+            print('%-50s p50 %8.3f ms (was %8.3f, x%.2f)' % (
+                label, result['p50_ms'], old['p50_ms'],
+                result['p50_ms'] / old['p50_ms'] if old['p50_ms'] else 0))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[1])
+    parser.add_argument('-n', '--iterations', type=int, default=500)
+    parser.add_argument('--quick', action='store_true',
+                        help='few iterations, for a smoke run')
+    parser.add_argument('-o', '--output', help='write the JSON results here')
+    parser.add_argument('--compare', help='JSON results of a previous run')
+    args = parser.parse_args()
+    iterations = 20 if args.quick else args.iterations
+    report = {
+        'meta': {'pylink': pylink.__version__,
+                 'python': platform.python_version(),
+                 'platform': platform.platform(),
+                 'date': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                 'iterations': iterations},
+        'results': run(iterations),
+    }
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(report, output, indent=2, sort_keys=True)
+    if args.compare:
+        with open(args.compare) as baseline:
+            compare(report['results'], json.load(baseline))
+    elif not args.output:
+        json.dump(report, sys.stdout, indent=2, sort_keys=True)
+        print('')
+
+
+if __name__ == '__main__':
+    main()
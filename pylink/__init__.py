@@ -12,47 +12,58 @@
 VERSION = '0.3.1'
 __version__ = VERSION
 
-from .link import TCPLink, SerialLink, UDPLink, GSMLink
+import sys
+
 from .logger import LOGGER, active_logger
+from .trace import active_trace
+from .schemes import (URL_PARAMETERS, register_scheme, unregister_scheme,
+                      build_link)
+
+# Public names imported from their module on first access, so that
+# importing pylink does not load pyserial nor asyncio
+_LAZY = {
+    'TCPLink': 'link', 'SerialLink': 'link', 'UDPLink': 'link',
+    'GSMLink': 'link', 'ReconnectingTCPLink': 'link',
+    'UnixSocketLink': 'link', 'DialError': 'link',
+    'AsyncTCPLink': 'aio', 'AsyncSerialLink': 'aio', 'AsyncUDPLink': 'aio',
+    'AsyncGSMLink': 'aio',
+    'LinkSelector': 'selector',
+    'RecordingLink': 'replay', 'ReplayLink': 'replay',
+    'CachingLink': 'cache',
+    'MemoryLink': 'memory', 'MemoryListener': 'memory',
+}
+
+
+def __getattr__(name):
+    module = _LAZY.get(name)
+    if module is None:
+        raise AttributeError("module %r has no attribute %r"
+                             % (__name__, name))
+    value = getattr(__import__(module, globals(), level=1), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_LAZY))
+
+
+if sys.version_info < (3, 7):
+    # No module __getattr__ before Python 3.7
+    for _name in _LAZY:
+        __getattr__(_name)
 
 
 def link_from_url(url):
-    '''Get link from url'''
-    link = None
-    bad_url = False
-    args = url.split(':')
-    try:
-        if len(args) > 1:
-            mode = args[0].lower()
-            if mode == "gsm":
-                phone = args[1]
-                parent_link = link_from_url(':'.join(args[2:]))
-                link = GSMLink(phone, parent_link)
-            if mode == "tcp" or mode == "udp":
-                host = args[1]
-                port = int(args[2])
-                if mode == "tcp":
-                    link = TCPLink(host, port)
-                else:
-                    link = UDPLink(host, port)
-            elif mode == "serial":
-                if len(args) == 2:
-                    port = args[1]
-                    link = SerialLink(port)
-                elif len(args) == 3:
-                    port = args[1]
-                    baudrate = int(args[2])
-                    link = SerialLink(port, baudrate)
-                elif len(args) == 4:
-                    port = args[1]
-                    baudrate = int(args[2])
-                    bytesize = int(args[3][0])
-                    parity = args[3][1]
-                    stopbits = int(args[3][2])
-                    link = SerialLink(port, baudrate, bytesize, parity,
-                                      stopbits)
-    except IndexError:
-        bad_url = True
-    if link is None or bad_url:
-        raise ValueError('Bad url link sepecified')
-    return link
+    '''Get link from url. Link parameters can follow as query parameters
+    (see :data:`URL_PARAMETERS`, a scheme may take more), e.g.
+    ``tcp:localhost:7?nodelay=1&buffered=1``. For a GSM url, they apply to
+    the modem link. Other schemes can be added with
+    :func:`register_scheme`.'''
+    return build_link(url)
+
+
+def alink_from_url(url):
+    '''Get asyncio link from url (the link is opened by ``await
+    link.open()`` or ``async with link``)'''
+    return build_link(url, asynchronous=True)
@@ -0,0 +1,498 @@
+# -*- coding: utf-8 -*-
+'''
+    pylink.aio
+    ----------
+
+    Asyncio links. They mirror the blocking links of :mod:`pylink.link`
+    (``await link.open()``, ``await link.write()``, ``await link.read()``)
+    so that thousands of links can share a single event loop.
+
+    :copyright: Copyright 2012 Salem Harrache and contributors, see AUTHORS.
+    :license: BSD, see LICENSE for details.
+
+'''
+from __future__ import unicode_literals
+import asyncio
+import os
+import sys
+
+from .logger import LOGGER
+from .compat import format_string, monotonic
+from .link import Link, DialError, DIAL_RESULT, _terminator_finder
+from .codecs import LengthPrefixed
+
+
+class _LinkProtocol(asyncio.Protocol, asyncio.DatagramProtocol):
+    '''Feed the bytes received by an asyncio transport to an `AsyncLink`.'''
+    def __init__(self, link):
+        self.link = link
+
+    def data_received(self, data):
+        self.link._feed(data)
+
+    def datagram_received(self, data, address):
+        self.link._feed(data)
+
+    def error_received(self, exc):
+        LOGGER.error('%s : %s' % (self.link, exc))
+
+    def eof_received(self):
+        self.link._feed_eof()
+
+    def connection_lost(self, exc):
+        self.link._feed_eof()
+
+    def pause_writing(self):
+        self.link._writable.clear()
+
+    def resume_writing(self):
+        self.link._writable.set()
+
+
+class AsyncLink(object):
+    '''Abstract base class for all asyncio links. Links are also
+    asynchronous context managers which open and close the link.'''
+    MAX_STRING_SIZE = Link.MAX_STRING_SIZE
+    FIRST_READ_FACTOR = Link.FIRST_READ_FACTOR
+    binary = Link.binary
+
+    #: Reading from the transport is paused while more than this many bytes
+    #: are waiting in the receive buffer.
+    HIGH_WATER = 64 * 1024
+
+    byte_to_hex = Link.byte_to_hex
+    log = Link.log
+    is_text = Link.is_text
+    is_bytes = Link.is_bytes
+    decode = Link.decode
+    __unicode__ = Link.__unicode__
+    __str__ = Link.__str__
+    __repr__ = Link.__repr__
+
+    def __init__(self, timeout=1, binary=False):
+        self.timeout = timeout
+        self.binary = binary
+        self._rbuffer = bytearray()
+        self._waiter = None
+        self._eof = False
+        self._paused = False
+        self._writable = asyncio.Event()
+        self._writable.set()
+
+    async def open(self):
+        '''Open the link.'''
+        pass
+
+    async def close(self):
+        '''Close the link.'''
+        pass
+
+    async def __aenter__(self):
+        await self.open()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    def settimeout(self, timeout):
+        self.timeout = timeout
+
+    def _feed(self, data):
+        self._rbuffer += data
+        if len(self._rbuffer) > self.HIGH_WATER and not self._paused:
+            self._paused = True
+            self._pause_reading()
+        self._wakeup()
+
+    def _feed_eof(self):
+        self._eof = True
+        self._wakeup()
+
+    def _wakeup(self):
+        if self._waiter is not None and not self._waiter.done():
+            self._waiter.set_result(None)
+
+    def _pause_reading(self):
+        pass
+
+    def _resume_reading(self):
+        pass
+
+    def _reset(self):
+        self._rbuffer = bytearray()
+        self._eof = False
+        self._paused = False
+        self._writable.set()
+
+    def _deadline(self, timeout):
+        if timeout is None:
+            timeout = self.timeout or 0
+        return monotonic() + timeout
+
+    async def _fill(self, deadline):
+        '''Wait for new bytes in the receive buffer. Return False when
+        nothing arrived before `deadline` or when the peer closed the link.'''
+        await self.open()
+        if self._eof:
+            return False
+        size = len(self._rbuffer)
+        self._waiter = asyncio.get_event_loop().create_future()
+        try:
+            await asyncio.wait_for(self._waiter,
+                                   max(deadline - monotonic(), 0))
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            self._waiter = None
+        return len(self._rbuffer) > size
+
+    def _take(self, size):
+        data = bytes(self._rbuffer[:size])
+        del self._rbuffer[:size]
+        if self._paused and len(self._rbuffer) <= self.HIGH_WATER // 2:
+            self._paused = False
+            self._resume_reading()
+        return data
+
+    def _framed(self, data):
+        if len(data) != 0:
+            self.log("Read", data)
+        return self.decode(data)
+
+    async def write(self, data):
+        '''Write all `data` to the link.'''
+        await self.open()
+        await self._writable.wait()
+        self._send(format_string(data))
+        self.log("Write", data)
+
+    def _send(self, data):
+        raise NotImplementedError
+
+    async def read(self, size=None, timeout=None, first_timeout=None):
+        '''Read data from the link, with the same rules as the blocking
+        links: return as soon as `size` bytes arrived, or after `timeout` of
+        silence (`first_timeout` while nothing was received).'''
+        size = size or self.MAX_STRING_SIZE
+        timeout = (timeout or 1) * (self.timeout or 1)
+        if first_timeout is None:
+            first_timeout = timeout * self.FIRST_READ_FACTOR
+        if self._rbuffer:
+            deadline = monotonic() + timeout
+        else:
+            deadline = monotonic() + first_timeout
+        while len(self._rbuffer) < size:
+            if not await self._fill(deadline):
+                break
+            deadline = monotonic() + timeout
+        return self._framed(self._take(size))
+
+    async def read_exactly(self, size, timeout=None):
+        '''Read exactly `size` bytes, see :meth:`Link.read_exactly`.'''
+        deadline = self._deadline(timeout)
+        while len(self._rbuffer) < size and await self._fill(deadline):
+            pass
+        return self._framed(self._take(size))
+
+    async def read_until(self, terminator=b'\n', size=None, timeout=None):
+        '''Read until `terminator`, see :meth:`Link.read_until`.'''
+        find = _terminator_finder(self._rbuffer, terminator)
+        deadline = self._deadline(timeout)
+        while True:
+            end = find()
+            if end >= 0:
+                break
+            if size is not None and len(self._rbuffer) >= size:
+                end = size
+                break
+            if not await self._fill(deadline):
+                end = len(self._rbuffer)
+                break
+        if size is not None:
+            end = min(end, size)
+        return self._framed(self._take(end))
+
+    async def read_frame(self, length_prefix=1, timeout=None, codec=None):
+        '''Read a frame, see :meth:`Link.read_frame`.'''
+        if codec is None:
+            codec = LengthPrefixed(length_prefix)
+        deadline = self._deadline(timeout)
+        while True:
+            result = codec.decode(self._rbuffer)
+            if result is not None:
+                self._take(result[1])
+                if result[0] is not None:
+                    return self._framed(result[0])
+                LOGGER.error('%s : invalid frame of %d bytes dropped'
+                             % (self, result[1]))
+            elif not await self._fill(deadline):
+                return None
+
+
+class AsyncTCPLink(AsyncLink):
+    '''AsyncTCPLink class allows TCP/IP protocol communication over an
+    asyncio transport. The host name is resolved by the event loop when the
+    link is opened, and its addresses are tried in parallel, staggered by
+    `connect_delay` seconds (Python 3.8 and later).'''
+    #: Delay before trying the next address of a host, in seconds.
+    connect_delay = 0.25
+
+    def __init__(self, host, port, timeout=1, binary=False):
+        super(AsyncTCPLink, self).__init__(timeout, binary)
+        self.host = host
+        self.port = port
+        self._transport = None
+
+    @property
+    def address(self):
+        '''Return a tuple of (`host`, `port`).'''
+        return (self.host, self.port)
+
+    @property
+    def url(self):
+        '''Make a connection url from `host` and `port`.'''
+        return self._format_url('tcp')
+
+    def _format_url(self, scheme):
+        host, port = self.address
+        if ':' in host:
+            host = '[%s]' % host
+        return '%s:%s:%d' % (scheme, host, port)
+
+    async def open(self):
+        '''Open the connection.'''
+        if self._transport is None:
+            self._reset()
+            loop = asyncio.get_event_loop()
+            options = {}
+            if sys.version_info >= (3, 8):
+                options = {'happy_eyeballs_delay': self.connect_delay,
+                           'interleave': 1}
+            self._transport, _ = await loop.create_connection(
+                lambda: _LinkProtocol(self), self.host, self.port, **options)
+            LOGGER.info('new %s was initialized' % self)
+
+    async def close(self):
+        '''Close the connection.'''
+        if self._transport is not None:
+            self._transport.close()
+            self._transport = None
+            LOGGER.info('Connection %s was closed' % self)
+
+    def _send(self, data):
+        self._transport.write(data)
+
+    def _pause_reading(self):
+        self._transport.pause_reading()
+
+    def _resume_reading(self):
+        if self._transport is not None:
+            self._transport.resume_reading()
+
+
+class AsyncUDPLink(AsyncTCPLink):
+    '''AsyncUDPLink class allows UDP/IP protocol communication over an
+    asyncio datagram transport connected to the peer.'''
+
+    @property
+    def url(self):
+        '''Make a connection url from `host` and `port`.'''
+        return self._format_url('udp')
+
+    async def open(self):
+        '''Open the datagram endpoint.'''
+        if self._transport is None:
+            self._reset()
+            loop = asyncio.get_event_loop()
+            self._transport, _ = await loop.create_datagram_endpoint(
+                lambda: _LinkProtocol(self), remote_addr=self.address)
+            LOGGER.info('new %s was initialized' % self)
+
+    def _send(self, data):
+        self._transport.sendto(data)
+
+    def _pause_reading(self):
+        # Datagram transports cannot be paused, extra datagrams are buffered
+        pass
+
+    def _resume_reading(self):
+        pass
+
+
+class AsyncSerialLink(AsyncLink):
+    '''AsyncSerialLink class allows serial communication on an event loop.
+    The pyserial port is used in non-blocking mode and its file descriptor
+    is watched with the loop readers/writers (POSIX only).'''
+    def __init__(self, port, baudrate=19200, bytesize=8, parity='N',
+                 stopbits=1, timeout=1, binary=False):
+        super(AsyncSerialLink, self).__init__(timeout, binary)
+        self.port = port
+        self.baudrate = baudrate
+        self.bytesize = bytesize
+        self.parity = parity
+        self.stopbits = stopbits
+        self._serial = None
+
+    @property
+    def url(self):
+        '''Make a connection url.'''
+        return 'serial:%s:%d:%d%s%d' % (self.port, self.baudrate,
+                                        self.bytesize, self.parity,
+                                        self.stopbits)
+
+    async def open(self):
+        '''Open the serial connection.'''
+        if self._serial is None:
+            import serial
+            self._reset()
+            self._serial = serial.Serial(self.port, self.baudrate, timeout=0,
+                                         bytesize=self.bytesize,
+                                         parity=self.parity,
+                                         stopbits=self.stopbits)
+            self._serial.reset_output_buffer()
+            self._resume_reading()
+            LOGGER.info('new %s was initialized' % self)
+
+    async def close(self):
+        '''Close the serial connection.'''
+        if self._serial is not None:
+            self._pause_reading()
+            self._serial.close()
+            self._serial = None
+            LOGGER.info('Connection %s was closed' % self)
+
+    def _on_readable(self):
+        try:
+            data = os.read(self._serial.fileno(), self.MAX_STRING_SIZE)
+        except (BlockingIOError, InterruptedError):
+            return
+        except OSError as e:
+            # e.g. EIO once the device is unplugged
+            LOGGER.error('%s : read failed (%s)' % (self, e))
+            data = b''
+        if data:
+            self._feed(data)
+        else:
+            # End of the device, stop watching it
+            self._pause_reading()
+            self._feed_eof()
+
+    def _pause_reading(self):
+        asyncio.get_event_loop().remove_reader(self._serial.fileno())
+
+    def _resume_reading(self):
+        if self._serial is not None and not self._eof:
+            asyncio.get_event_loop().add_reader(self._serial.fileno(),
+                                                self._on_readable)
+
+    async def write(self, data):
+        '''Write all `data` to the serial connection.'''
+        await self.open()
+        data = memoryview(format_string(data))
+        loop = asyncio.get_event_loop()
+        fd = self._serial.fileno()
+        while data:
+            try:
+                data = data[os.write(fd, data):]
+            except (BlockingIOError, InterruptedError):
+                writable = loop.create_future()
+                loop.add_writer(fd, writable.set_result, None)
+                try:
+                    await writable
+                finally:
+                    loop.remove_writer(fd)
+        self.log("Write", data.obj)
+
+
+class AsyncGSMLink(AsyncLink):
+    '''Asyncio GSM link, dialing through another asyncio link.'''
+    def __init__(self, phone, link, timeout=1):
+        self.link = link
+        self.phone = phone
+        self.is_open = False
+        self.timeout = timeout
+
+    @property
+    def binary(self):
+        '''The data is converted by the modem link.'''
+        return self.link.binary
+
+    async def _call(self):
+        '''Dial `phone`, return the final result code of the modem (None
+        if it sent none).'''
+        LOGGER.info("GSM : Call %s" % self.phone)
+        await self.link.write("ATD%s\r\n" % self.phone)
+        result = None
+        for i in range(100):
+            # The received bytes stay buffered until a result code is
+            # complete, it may arrive in several reads
+            deadline = monotonic() + 1
+            result = DIAL_RESULT.search(self.link._rbuffer)
+            while result is None and monotonic() < deadline and \
+                    await self.link._fill(deadline):
+                result = DIAL_RESULT.search(self.link._rbuffer)
+            if result is not None:
+                break
+            self.log("GSM", "call in progress")
+        if result is None:
+            return None
+        # Before the buffer moves under the match
+        code = result.group().strip().decode('ascii', 'replace')
+        response = self.link._take(result.end())
+        self.link.log("Read", response)
+        if not code.startswith("CONNECT"):
+            LOGGER.error("GSM : <%s>" % repr(response))
+            return code
+        self.log("GSM", "Client is ready (%s)" % self.decode(response))
+        await self.link.read()
+        return code
+
+    async def _hangup(self):
+        await self.link.write("+++")
+        await self.link.read(6)
+        await self.link.write("ATH\r\n")
+        await self.link.read(6)
+        LOGGER.info("GSM : Hang-up")
+
+    async def open(self):
+        '''Open the gsm connection.'''
+        if not self.is_open:
+            await self.link.open()
+            code = await self._call()
+            self.is_open = code is not None and code.startswith("CONNECT")
+            if not self.is_open:
+                await self.link.close()
+                raise DialError(self.phone, code)
+
+    async def close(self):
+        '''Close the gsm connection.'''
+        if self.is_open:
+            await self._hangup()
+            self.is_open = False
+        await self.link.close()
+
+    @property
+    def url(self):
+        '''Connection url.'''
+        return 'gsm:%s:%s' % (self.phone, str(self.link))
+
+    def settimeout(self, timeout):
+        self.timeout = timeout
+        self.link.settimeout(timeout)
+
+    async def write(self, data):
+        '''Write all `data` to the gsm connection.'''
+        await self.link.write(data)
+
+    async def read(self, size=None, timeout=None, first_timeout=None):
+        '''Read data from the gsm connection.'''
+        return await self.link.read(size, timeout, first_timeout)
+
+    async def read_exactly(self, size, timeout=None):
+        return await self.link.read_exactly(size, timeout)
+
+    async def read_until(self, terminator=b'\n', size=None, timeout=None):
+        return await self.link.read_until(terminator, size, timeout)
+
+    async def read_frame(self, length_prefix=1, timeout=None, codec=None):
+        return await self.link.read_frame(length_prefix, timeout, codec)
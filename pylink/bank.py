@@ -0,0 +1,184 @@
+# -*- coding: utf-8 -*-
+'''
+    pylink.bank
+    -----------
+
+    A bank of GSM modems placing data calls in parallel: each dial request
+    goes to the next free modem, so that a poll cycle over many stations
+    runs as many calls at once as there are modems::
+
+        >>> bank = GSMModemBank(["serial:/dev/ttyUSB0:9600:8N1",
+        ...                      "serial:/dev/ttyUSB1:9600:8N1"])
+        >>> futures = [bank.submit(phone, poll) for phone in phones]
+        >>> results = [future.result() for future in futures]
+        >>> bank.close()
+
+    :copyright: Copyright 2012 Salem Harrache and contributors, see AUTHORS.
+    :license: BSD, see LICENSE for details.
+
+'''
+from __future__ import unicode_literals
+import queue
+import threading
+from concurrent.futures import Future
+
+from . import link_from_url
+from .link import GSMLink, DialError
+from .logger import LOGGER
+from .compat import monotonic
+
+
+class _Modem(object):
+    '''State of one modem of the bank.'''
+    def __init__(self, url):
+        self.url = url
+        self.failures = 0
+        self.calls = 0
+        self.disabled_until = 0
+
+    @property
+    def available(self):
+        return monotonic() >= self.disabled_until
+
+
+class _Request(object):
+    def __init__(self, phone, function, args, kwargs):
+        self.phone = phone
+        self.function = function
+        self.args = args
+        self.kwargs = kwargs
+        self.future = Future()
+        self.attempts = 0
+
+
+class GSMModemBank(object):
+    '''Run GSM data calls on several modems at once.
+
+    - `modem_urls`: urls of the modem links (``serial:...``), one worker
+      thread is started for each modem.
+    - `max_failures`: consecutive failed dials imputable to the modem
+      (ERROR, NO DIALTONE, no result code, port errors...) after which it
+      is taken out of rotation for `cooldown` seconds. BUSY, NO ANSWER and
+      NO CARRIER blame the called station, they do not count.
+    - `retries`: how many times a failed dial is queued again, for any
+      modem, before its future gets the error.
+    - `timeout`: timeout of the `GSMLink` (and its modem link) given to the
+      call functions.
+    - `factory`: builds a modem link from an url, :func:`link_from_url` by
+      default.
+    '''
+    def __init__(self, modem_urls, max_failures=3, cooldown=300, retries=1,
+                 timeout=1, factory=link_from_url):
+        self.max_failures = max_failures
+        self.cooldown = cooldown
+        self.retries = retries
+        self.timeout = timeout
+        self.factory = factory
+        self.modems = [_Modem(url) for url in modem_urls]
+        if not self.modems:
+            raise ValueError('GSMModemBank needs at least one modem')
+        self._requests = queue.Queue()
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._workers = []
+        for modem in self.modems:
+            worker = threading.Thread(target=self._work, args=(modem,),
+                                      name='pylink-modem %s' % modem.url)
+            worker.daemon = True
+            worker.start()
+            self._workers.append(worker)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def submit(self, phone, function, *args, **kwargs):
+        '''Queue a call to `phone`. The first free modem dials it, then runs
+        ``function(link, *args, **kwargs)`` with the opened `GSMLink` and
+        hangs up. Return a `concurrent.futures.Future` of the function
+        result, or of the error.'''
+        if self._stop.is_set():
+            raise ValueError('GSMModemBank is closed')
+        request = _Request(phone, function, args, kwargs)
+        self._requests.put(request)
+        return request.future
+
+    def map(self, function, phones):
+        '''Call every phone of `phones` with `function`, and yield the
+        results in order (see :meth:`submit`).'''
+        futures = [self.submit(phone, function) for phone in phones]
+        for future in futures:
+            yield future.result()
+
+    def status(self):
+        '''Return the state of each modem as a list of dicts.'''
+        with self._lock:
+            return [{'url': modem.url, 'calls': modem.calls,
+                     'failures': modem.failures,
+                     'available': modem.available} for modem in self.modems]
+
+    def close(self, wait=True):
+        '''Stop the workers once the queued calls are done, and wait for
+        them if `wait` is True.'''
+        if not self._stop.is_set():
+            self._stop.set()
+            for _ in self._workers:
+                self._requests.put(None)
+        if wait:
+            for worker in self._workers:
+                worker.join()
+
+    def _work(self, modem):
+        while True:
+            with self._lock:
+                pause = modem.disabled_until - monotonic()
+            if pause > 0 and not self._stop.wait(pause):
+                continue
+            request = self._requests.get()
+            if request is None:
+                return
+            if request.attempts == 0 \
+                    and not request.future.set_running_or_notify_cancel():
+                continue
+            request.attempts += 1
+            self._serve(modem, request)
+
+    def _serve(self, modem, request):
+        link = GSMLink(request.phone, self.factory(modem.url))
+        link.settimeout(self.timeout)
+        try:
+            link.open()
+        except Exception as e:
+            self._failed(modem, request, e)
+            return
+        with self._lock:
+            modem.failures = 0
+            modem.calls += 1
+        try:
+            result = request.function(link, *request.args, **request.kwargs)
+        except BaseException as e:
+            request.future.set_exception(e)
+        else:
+            request.future.set_result(result)
+        finally:
+            link.close()
+
+    def _failed(self, modem, request, error):
+        LOGGER.error('Bank : call %s on %s failed (%s)'
+                     % (request.phone, modem.url, error))
+        # A busy or unanswered station says nothing about the modem
+        station = isinstance(error, DialError) and not error.modem_failure
+        with self._lock:
+            if not station:
+                modem.failures += 1
+            if modem.failures >= self.max_failures:
+                modem.failures = 0
+                modem.disabled_until = monotonic() + self.cooldown
+                LOGGER.error('Bank : %s out of rotation for %ss'
+                             % (modem.url, self.cooldown))
+        if request.attempts <= self.retries and not self._stop.is_set():
+            self._requests.put(request)
+        else:
+            request.future.set_exception(error)
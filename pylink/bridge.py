@@ -0,0 +1,379 @@
+# -*- coding: utf-8 -*-
+'''
+    pylink.bridge
+    -------------
+
+    Share one device link (usually a serial port, which only one process
+    can open) with many TCP clients::
+
+        $ python -m pylink.bridge serial:/dev/ttyUSB0:38400 \\
+              tcp-listen:0.0.0.0:4001
+
+    The requests of the clients are sent to the device one transaction at
+    a time, in arrival order, and each reply goes back to the client that
+    asked for it.
+
+    :copyright: Copyright 2012 Salem Harrache and contributors, see AUTHORS.
+    :license: BSD, see LICENSE for details.
+
+'''
+from __future__ import unicode_literals
+import argparse
+import selectors
+import socket
+from collections import deque
+
+from . import link_from_url
+from .logger import LOGGER
+from .schemes import BAD_URL, parse_url, _parse_host
+from .compat import monotonic
+
+
+def parse_listen_url(url):
+    '''Return the (`host`, `port`) of a ``tcp-listen:host:port`` url.'''
+    scheme, address, _ = parse_url(url)
+    if scheme != 'tcp-listen':
+        raise ValueError(BAD_URL)
+    return _parse_host(address, {}, None)[0]
+
+
+class _Client(object):
+    '''A connected TCP client of the bridge.'''
+    def __init__(self, sock, address):
+        self.sock = sock
+        self.address = address
+        # Request bytes waiting for the device, and reply bytes waiting
+        # for the socket
+        self.inbox = bytearray()
+        self.outbox = bytearray()
+        self.queued = False
+        self.closed = False
+
+    def __str__(self):
+        return '%s:%s' % self.address[:2]
+
+
+class Bridge(object):
+    '''Forward the requests of TCP clients to the `device` link, one
+    transaction at a time.
+
+    - `device`: the shared link, or its url.
+    - `listen`: the (`host`, `port`) or ``tcp-listen:host:port`` url to
+      accept the clients on. Port 0 picks a free port, see :attr:`address`.
+    - `reply_timeout`: how long the device may take to start answering a
+      request, in seconds.
+    - `reply_idle`: silence of the device ending a reply, in seconds.
+    - `broadcast`: send the data the device sends outside of any
+      transaction (alarms, periodic measurements) to every client. It is
+      dropped otherwise.
+
+    Everything a client sends while waiting for its turn is one request.
+    A device link found dead (e.g. a TCP device which closed the
+    connection) is opened again, with a growing delay between attempts
+    (see :attr:`Link.REOPEN_DELAY`); the requests wait meanwhile.
+    A single thread runs the forwarding loop (:meth:`run`) on a selector:
+    client data is received into one reusable buffer and sent back without
+    intermediate copies, and slow clients get their replies queued
+    (`max_backlog` bytes at most) instead of stalling the others.
+    '''
+    #: Size of the receive buffer shared by the clients.
+    CHUNK_SIZE = 65536
+
+    def __init__(self, device, listen, reply_timeout=1, reply_idle=0.05,
+                 broadcast=False, max_backlog=1 << 20):
+        if not hasattr(device, 'fileno'):
+            device = link_from_url(device)
+        if not isinstance(listen, tuple):
+            listen = parse_listen_url(listen)
+        self.device = device
+        self.reply_timeout = reply_timeout
+        self.reply_idle = reply_idle
+        self.broadcast = broadcast
+        self.max_backlog = max_backlog
+        self.clients = []
+        self._queue = deque()
+        self._current = None
+        self._running = False
+        self._device_fd = None
+        self._reopen_at = None
+        self._reopen_delay = 0
+        self._buffer = bytearray(self.CHUNK_SIZE)
+        self._selector = selectors.DefaultSelector()
+        family = socket.AF_INET6 if ':' in listen[0] else socket.AF_INET
+        self._server = socket.socket(family, socket.SOCK_STREAM)
+        self._server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._server.bind(listen)
+        self._server.listen(64)
+        self._server.setblocking(0)
+        self._selector.register(self._server, selectors.EVENT_READ,
+                                self._accept)
+        self._wakeup_r, self._wakeup_w = socket.socketpair()
+        self._wakeup_r.setblocking(0)
+        self._wakeup_w.setblocking(0)
+        self._selector.register(self._wakeup_r, selectors.EVENT_READ,
+                                self._wakeup)
+
+    @property
+    def address(self):
+        '''The (`host`, `port`) the clients connect to.'''
+        return self._server.getsockname()[:2]
+
+    def run(self, timeout=None):
+        '''Forward the traffic until :meth:`stop` is called, or for
+        `timeout` seconds.'''
+        self._open_device()
+        LOGGER.info('Bridge : %s shared on %s:%s'
+                    % ((self.device,) + self.address))
+        end = None if timeout is None else monotonic() + timeout
+        self._running = True
+        try:
+            while self._running:
+                wait = self._next_wait()
+                if end is not None:
+                    left = max(0, end - monotonic())
+                    wait = left if wait is None else min(wait, left)
+                for key, mask in self._selector.select(wait):
+                    key.data(key.fileobj, mask)
+                self._step()
+                if end is not None and monotonic() >= end:
+                    break
+        finally:
+            self._unregister_device()
+            self._running = False
+
+    def stop(self):
+        '''Make :meth:`run` return, from any thread.'''
+        self._running = False
+        try:
+            self._wakeup_w.send(b'\0')
+        except (BlockingIOError, InterruptedError):
+            pass
+
+    def close(self):
+        '''Disconnect the clients and stop listening. The device link is
+        closed too.'''
+        for client in list(self.clients):
+            self._drop(client)
+        self._selector.close()
+        self._server.close()
+        self._wakeup_r.close()
+        self._wakeup_w.close()
+        self.device.close()
+
+    def _wakeup(self, sock, mask):
+        try:
+            sock.recv(4096)
+        except (BlockingIOError, InterruptedError):
+            pass
+
+    def _accept(self, sock, mask):
+        try:
+            conn, address = sock.accept()
+        except (BlockingIOError, InterruptedError):
+            return
+        conn.setblocking(0)
+        conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        client = _Client(conn, address)
+        self.clients.append(client)
+        self._selector.register(conn, selectors.EVENT_READ,
+                                lambda sock, mask: self._client_event(
+                                    client, mask))
+        LOGGER.info('Bridge : client %s connected' % client)
+
+    def _client_event(self, client, mask):
+        if mask & selectors.EVENT_WRITE:
+            self._send(client, b'')
+        if not mask & selectors.EVENT_READ or client.closed:
+            return
+        try:
+            size = client.sock.recv_into(self._buffer)
+        except (BlockingIOError, InterruptedError):
+            return
+        except socket.error as e:
+            LOGGER.error('Bridge : client %s failed (%s)' % (client, e))
+            size = 0
+        if not size:
+            self._drop(client)
+            return
+        client.inbox += memoryview(self._buffer)[:size]
+        if not client.queued:
+            client.queued = True
+            self._queue.append(client)
+
+    def _open_device(self):
+        self.device.open()
+        self._device_fd = self.device.fileno()
+        self._selector.register(self._device_fd, selectors.EVENT_READ,
+                                self._device_readable)
+        self._reopen_at = None
+
+    def _unregister_device(self):
+        if self._device_fd is not None:
+            self._selector.unregister(self._device_fd)
+            self._device_fd = None
+
+    def _device_lost(self, reason):
+        '''Stop watching the dead device, and schedule its reopening.'''
+        LOGGER.error('Bridge : device %s lost (%s)' % (self.device, reason))
+        self._unregister_device()
+        try:
+            self.device.close()
+        except Exception as e:
+            LOGGER.error('Bridge : close of %s failed (%s)'
+                         % (self.device, e))
+        if self._current is not None:
+            LOGGER.error('Bridge : no reply for client %s'
+                         % self._current[0])
+            self._current = None
+        self._reopen_at = monotonic() + self._reopen_delay
+        self._reopen_delay = min(max(2 * self._reopen_delay,
+                                     self.device.REOPEN_DELAY),
+                                 self.device.MAX_REOPEN_DELAY)
+
+    def _reopen_device(self):
+        try:
+            self._open_device()
+        except Exception as e:
+            self._device_lost('reopen failed: %s' % e)
+            return
+        self._reopen_delay = 0
+        LOGGER.info('Bridge : device %s reopened' % self.device)
+
+    def _device_readable(self, fileno, mask):
+        device = self.device
+        try:
+            data = device._take(len(device._rbuffer)) + \
+                device._recv_chunk(device.MAX_STRING_SIZE, 0)
+        except (OSError, ValueError) as e:
+            self._device_lost(e)
+            return
+        if not data:
+            # Readable without data: the end of the connection
+            if not device.is_alive():
+                self._device_lost('end of connection')
+            return
+        device.log('Read', data)
+        current = self._current
+        if current is not None:
+            current[1] = monotonic()
+            self._send(current[0], data)
+        elif self.broadcast:
+            for client in list(self.clients):
+                self._send(client, data)
+        else:
+            LOGGER.error('Bridge : unsolicited data dropped <%s>'
+                         % device.byte_to_hex(data))
+
+    def _send(self, client, data):
+        '''Send `data` to `client`, queueing what the socket does not take
+        at once.'''
+        if client.closed:
+            return
+        if data:
+            if client.outbox:
+                client.outbox += data
+                data = b''
+            else:
+                data = memoryview(data)
+        if not data:
+            data = client.outbox
+        try:
+            sent = client.sock.send(data) if data else 0
+        except (BlockingIOError, InterruptedError):
+            sent = 0
+        except socket.error as e:
+            LOGGER.error('Bridge : client %s failed (%s)' % (client, e))
+            self._drop(client)
+            return
+        if data is client.outbox:
+            del client.outbox[:sent]
+        else:
+            client.outbox += data[sent:]
+        if len(client.outbox) > self.max_backlog:
+            LOGGER.error('Bridge : client %s too slow' % client)
+            self._drop(client)
+            return
+        events = selectors.EVENT_READ
+        if client.outbox:
+            events |= selectors.EVENT_WRITE
+        self._selector.modify(client.sock, events,
+                              self._selector.get_key(client.sock).data)
+
+    def _drop(self, client):
+        if client.closed:
+            return
+        client.closed = True
+        self.clients.remove(client)
+        self._selector.unregister(client.sock)
+        client.sock.close()
+        LOGGER.info('Bridge : client %s disconnected' % client)
+
+    def _next_wait(self):
+        '''Time left until the current transaction ends or the device is
+        reopened, or None.'''
+        if self._reopen_at is not None:
+            return max(0, self._reopen_at - monotonic())
+        if self._current is not None:
+            client, last_reply, started = self._current
+            if last_reply is None:
+                return max(0, started + self.reply_timeout - monotonic())
+            return max(0, last_reply + self.reply_idle - monotonic())
+        return 0 if self._queue else None
+
+    def _step(self):
+        '''End the current transaction when it is over, and start the next
+        one.'''
+        if self._reopen_at is not None:
+            if monotonic() >= self._reopen_at:
+                self._reopen_device()
+            return
+        if self._current is not None:
+            if self._next_wait() > 0:
+                return
+            client, last_reply, _ = self._current
+            if last_reply is None:
+                LOGGER.error('Bridge : no reply for client %s' % client)
+            self._current = None
+        while self._queue:
+            client = self._queue.popleft()
+            client.queued = False
+            if client.closed or not client.inbox:
+                continue
+            request = bytes(client.inbox)
+            del client.inbox[:]
+            self._current = [client, None, monotonic()]
+            try:
+                self.device.write(request)
+                self.device.flush()
+            except OSError as e:
+                self._device_lost(e)
+            return
+
+
+def main(argv=None):
+    '''Command line entry point.'''
+    parser = argparse.ArgumentParser(
+        prog='python -m pylink.bridge',
+        description='Share a device link with many TCP clients.')
+    parser.add_argument('device', help='device link url, e.g. '
+                        'serial:/dev/ttyUSB0:38400')
+    parser.add_argument('listen', help='tcp-listen:host:port')
+    parser.add_argument('--reply-timeout', type=float, default=1,
+                        help='seconds the device may take to answer')
+    parser.add_argument('--reply-idle', type=float, default=0.05,
+                        help='silence ending a reply, in seconds')
+    parser.add_argument('--broadcast', action='store_true',
+                        help='send unsolicited device data to all clients')
+    args = parser.parse_args(argv)
+    bridge = Bridge(args.device, args.listen, args.reply_timeout,
+                    args.reply_idle, args.broadcast)
+    try:
+        bridge.run()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        bridge.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,202 @@
+# -*- coding: utf-8 -*-
+'''
+    pylink.cache
+    ------------
+
+    Cache the replies of a slow device to its idempotent requests, so that
+    clients asking for the same status within seconds share one exchange::
+
+        >>> cache = ResponseCache(ttl=5, ttls=[(b"ATI", 3600)])
+        >>> link = CachingLink(GSMLink(phone, modem), cache)
+        >>> link.transact(b"STATUS\\r\\n", b"\\r\\n")
+
+    :copyright: Copyright 2012 Salem Harrache and contributors, see AUTHORS.
+    :license: BSD, see LICENSE for details.
+
+'''
+from __future__ import unicode_literals
+import threading
+from collections import OrderedDict
+
+from .link import Link
+from .logger import LOGGER
+from .compat import format_string, monotonic
+
+
+class _Flight(object):
+    '''An exchange in progress, awaited by the identical requests.'''
+    def __init__(self):
+        self.done = threading.Event()
+        self.reply = None
+        self.error = None
+
+
+class ResponseCache(object):
+    '''Replies by (link url, request bytes, reply reader), kept `ttl`
+    seconds.
+
+    - `ttls`: list of (`pattern`, `ttl`) giving the time to live of the
+      matching requests, the first matching pattern wins. A pattern is a
+      bytes prefix or a compiled bytes regex, and a `ttl` of 0 disables
+      the cache for these requests (e.g. commands changing the device
+      state).
+    - `max_entries`: the least recently used replies are dropped past this
+      number.
+
+    Identical requests made while the first one is in progress wait for
+    its reply (or error) instead of running their own exchange. Empty
+    replies (nothing received before the timeout) and errors are not
+    cached. A cache can be shared by several links.'''
+    def __init__(self, ttl=5, ttls=(), max_entries=1024):
+        self.ttl = ttl
+        self.ttls = [(pattern if hasattr(pattern, 'search')
+                      else format_string(pattern), pattern_ttl)
+                     for pattern, pattern_ttl in ttls]
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._flights = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+    def ttl_of(self, request):
+        '''Return the time to live of the reply to `request` (bytes).'''
+        for pattern, ttl in self.ttls:
+            if hasattr(pattern, 'search'):
+                if pattern.search(request):
+                    return ttl
+            elif request.startswith(pattern):
+                return ttl
+        return self.ttl
+
+    def stats(self):
+        '''Return the hit and miss counters, as a dict.'''
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses,
+                    'coalesced': self.coalesced,
+                    'evictions': self.evictions,
+                    'entries': len(self._entries)}
+
+    def clear(self):
+        '''Drop all the cached replies.'''
+        with self._lock:
+            self._entries.clear()
+
+    def fetch(self, key, exchange, timeout=None):
+        '''Return the cached reply of `key` (``(url, request, reader)``), or
+        the one of ``exchange()``. A request waiting for an identical one in
+        progress raises `TimeoutError` after `timeout` seconds.'''
+        ttl = self.ttl_of(key[1])
+        if not ttl:
+            return exchange()
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None and entry[0] > monotonic():
+                self._entries[key] = entry
+                self.hits += 1
+                return entry[1]
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+                self.misses += 1
+            else:
+                self.coalesced += 1
+        if not leader:
+            if not flight.done.wait(timeout):
+                raise TimeoutError('No reply to the same request in progress')
+            if flight.error is not None:
+                raise flight.error
+            return flight.reply
+        try:
+            flight.reply = exchange()
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+                if flight.error is None and len(flight.reply) != 0:
+                    self._store(key, ttl, flight.reply)
+            flight.done.set()
+        return flight.reply
+
+    def _store(self, key, ttl, reply):
+        self._entries[key] = (monotonic() + ttl, reply)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+
+class CachingLink(Link):
+    '''Wrap any `link` and serve :meth:`transact` from `cache` (a
+    :class:`ResponseCache`, a new one by default). A cache hit does not
+    even open the link, so a GSM link only dials when a reply is missing.
+    The other methods go straight to the link.'''
+    def __init__(self, link, cache=None):
+        self.link = link
+        self.cache = ResponseCache() if cache is None else cache
+
+    @property
+    def url(self):
+        return self.link.url
+
+    @property
+    def binary(self):
+        return self.link.binary
+
+    @property
+    def timeout(self):
+        return self.link.timeout
+
+    def settimeout(self, timeout):
+        self.link.settimeout(timeout)
+
+    def open(self):
+        self.link.open()
+
+    def close(self):
+        self.link.close()
+
+    def is_alive(self):
+        return self.link.is_alive()
+
+    def fileno(self):
+        return self.link.fileno()
+
+    def flush(self):
+        self.link.flush()
+
+    @property
+    def _rbuffer(self):
+        return self.link._rbuffer
+
+    def _recv_chunk(self, size, timeout):
+        return self.link._recv_chunk(size, timeout)
+
+    def write(self, data):
+        self.link.write(data)
+
+    def read(self, size=None, timeout=None):
+        return self.link.read(size, timeout)
+
+    def readinto(self, buffer, timeout=None):
+        return self.link.readinto(buffer, timeout)
+
+    def transact(self, request, expect=None, timeout=None, deadline=None):
+        '''Return the cached reply to `request` read with `expect`, or run
+        the exchange on the link (see :meth:`Link.transact`).'''
+        request = format_string(request)
+
+        def exchange():
+            LOGGER.info('Cache : miss for %s' % self)
+            self.link.open()
+            return self.link.transact(request, expect, timeout, deadline)
+        return self.cache.fetch((self.url, request, expect), exchange,
+                                deadline)
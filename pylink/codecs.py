@@ -0,0 +1,287 @@
+# -*- coding: utf-8 -*-
+'''
+    pylink.codecs
+    -------------
+
+    Frame codecs for :meth:`Link.read_frame` and :meth:`Link.iter_frames`:
+    delimiter, length prefix, SLIP, COBS and STX/ETX framing, optionally
+    with a checksum verified by :class:`Checked`::
+
+        >>> codec = Checked(SLIP(), 'crc16-modbus')
+        >>> link.write(codec.encode(b"request"))
+        >>> link.read_frame(codec=codec)
+        b'reply'
+
+    A codec decodes from the start of a receive buffer (a `bytearray`) and
+    only looks at what it holds, so a frame can arrive in any number of
+    chunks. Searches and unescaping run in C (`bytearray.find`,
+    `bytes.replace`, `binascii`, `zlib`) rather than byte per byte.
+
+    :copyright: Copyright 2012 Salem Harrache and contributors, see AUTHORS.
+    :license: BSD, see LICENSE for details.
+
+'''
+from __future__ import unicode_literals
+import binascii
+import struct
+import zlib
+
+from .compat import format_string
+
+
+class Codec(object):
+    '''Base class of the frame codecs.
+
+    ``decode(buffer)`` returns None while `buffer` does not start with a
+    complete frame, or ``(payload, consumed)``: the frame payload (bytes)
+    and the number of bytes of `buffer` it used. The payload is None for
+    an invalid frame, which the link drops. A codec raises `ValueError`
+    when the stream cannot be resynchronized.'''
+
+    def decode(self, buffer):
+        raise NotImplementedError
+
+    def encode(self, payload):
+        '''Return the frame of `payload`.'''
+        raise NotImplementedError
+
+
+class Delimited(Codec):
+    '''Frames ending with `delimiter`, which is not part of the payload.
+    Without a delimiter after `max_size` bytes, the data is dropped.'''
+    def __init__(self, delimiter=b'\n', max_size=65536):
+        self.delimiter = format_string(delimiter)
+        self.max_size = max_size
+
+    def decode(self, buffer):
+        end = buffer.find(self.delimiter)
+        if end < 0:
+            if len(buffer) > self.max_size:
+                return None, len(buffer)
+            return None
+        return bytes(buffer[:end]), end + len(self.delimiter)
+
+    def encode(self, payload):
+        return format_string(payload) + self.delimiter
+
+
+class LengthPrefixed(Codec):
+    '''Frames starting with their payload length: `length_prefix` bytes
+    (unsigned big-endian) or a :mod:`struct` format such as ``'<H'``.
+    A length above `max_size` raises `ValueError`.'''
+    def __init__(self, length_prefix=1, max_size=None):
+        if isinstance(length_prefix, int):
+            length_prefix = '>' + {1: 'B', 2: 'H', 4: 'I',
+                                   8: 'Q'}[length_prefix]
+        self.header = struct.Struct(length_prefix)
+        self.max_size = max_size
+
+    def decode(self, buffer):
+        size = self.header.size
+        if len(buffer) < size:
+            return None
+        length, = self.header.unpack_from(buffer)
+        if self.max_size is not None and length > self.max_size:
+            raise ValueError('Frame of %d bytes, more than %d'
+                             % (length, self.max_size))
+        if len(buffer) < size + length:
+            return None
+        return bytes(buffer[size:size + length]), size + length
+
+    def encode(self, payload):
+        payload = format_string(payload)
+        return self.header.pack(len(payload)) + payload
+
+
+class STXETX(Codec):
+    '''Frames between `stx` and `etx` bytes. Data before `stx` is dropped,
+    as is a frame without `etx` after `max_size` bytes.'''
+    def __init__(self, stx=b'\x02', etx=b'\x03', max_size=65536):
+        self.stx = format_string(stx)
+        self.etx = format_string(etx)
+        self.max_size = max_size
+
+    def decode(self, buffer):
+        start = buffer.find(self.stx)
+        if start < 0:
+            return (None, len(buffer)) if buffer else None
+        if start > 0:
+            # Noise before the frame
+            return None, start
+        end = buffer.find(self.etx, len(self.stx))
+        if end < 0:
+            if len(buffer) > self.max_size:
+                return None, len(buffer)
+            return None
+        return bytes(buffer[len(self.stx):end]), end + len(self.etx)
+
+    def encode(self, payload):
+        return self.stx + format_string(payload) + self.etx
+
+
+class SLIP(Codec):
+    '''Serial Line IP framing (RFC 1055). Empty frames (the END bytes some
+    senders put before each frame) are skipped.'''
+    END = b'\xc0'
+    ESC = b'\xdb'
+    ESC_END = b'\xdb\xdc'
+    ESC_ESC = b'\xdb\xdd'
+
+    def __init__(self, max_size=65536):
+        self.max_size = max_size
+
+    def decode(self, buffer):
+        start = 0
+        while start < len(buffer) and buffer[start] == 0xc0:
+            start += 1
+        end = buffer.find(self.END, start)
+        if end < 0:
+            # The leading END bytes go with the frame once it is complete
+            if len(buffer) > self.max_size:
+                return None, len(buffer)
+            return None
+        payload = bytes(buffer[start:end])
+        if self.ESC in payload:
+            # ESC_END first: an escaped ESC is never followed by 0xdc
+            payload = payload.replace(self.ESC_END, self.END) \
+                .replace(self.ESC_ESC, self.ESC)
+        return payload, end + 1
+
+    def encode(self, payload):
+        payload = format_string(payload).replace(self.ESC, self.ESC_ESC) \
+            .replace(self.END, self.ESC_END)
+        return self.END + payload + self.END
+
+
+def cobs_encode(data):
+    '''Consistent Overhead Byte Stuffing of `data`, without the trailing
+    zero delimiter.'''
+    output = bytearray()
+    parts = bytes(data).split(b'\0')
+    for index, part in enumerate(parts):
+        blocks = 0
+        while len(part) >= 254:
+            output += b'\xff' + part[:254]
+            part = part[254:]
+            blocks += 1
+        # A full block at the very end needs no closing block
+        if part or not blocks or index < len(parts) - 1:
+            output.append(len(part) + 1)
+            output += part
+    return bytes(output)
+
+
+def cobs_decode(data):
+    '''Decode a COBS encoded frame (without its zero delimiter). Raise
+    `ValueError` if it is malformed.'''
+    output = bytearray()
+    index = 0
+    size = len(data)
+    while index < size:
+        code = data[index]
+        end = index + code
+        if code == 0 or end > size:
+            raise ValueError('Bad COBS frame')
+        output += data[index + 1:end]
+        index = end
+        if code < 0xff and index < size:
+            output.append(0)
+    return bytes(output)
+
+
+class COBS(Codec):
+    '''Consistent Overhead Byte Stuffing, frames delimited by a zero
+    byte.'''
+    def __init__(self, max_size=65536):
+        self.max_size = max_size
+
+    def decode(self, buffer):
+        end = buffer.find(b'\0')
+        if end < 0:
+            if len(buffer) > self.max_size:
+                return None, len(buffer)
+            return None
+        if end == 0:
+            return None, 1
+        # Released at once: an exported buffer cannot be resized
+        with memoryview(buffer) as view:
+            try:
+                return cobs_decode(view[:end]), end + 1
+            except ValueError:
+                return None, end + 1
+
+    def encode(self, payload):
+        return cobs_encode(format_string(payload)) + b'\0'
+
+
+def crc16_ccitt(data, value=0xffff):
+    '''CRC-16/CCITT-FALSE of `data` (XMODEM with `value` = 0).'''
+    return binascii.crc_hqx(data, value)
+
+
+def _modbus_table():
+    table = []
+    for byte in range(256):
+        crc = byte
+        for _ in range(8):
+            crc = (crc >> 1) ^ 0xa001 if crc & 1 else crc >> 1
+        table.append(crc)
+    return table
+
+
+_MODBUS_TABLE = _modbus_table()
+
+
+def crc16_modbus(data, value=0xffff):
+    '''CRC-16/MODBUS of `data`. The standard library has no C version of
+    this polynomial: it is computed with a 256-entry table, one lookup per
+    byte.'''
+    table = _MODBUS_TABLE
+    for byte in bytes(data):
+        value = (value >> 8) ^ table[(value ^ byte) & 0xff]
+    return value
+
+
+def crc32(data, value=0):
+    '''CRC-32 (zlib, Ethernet) of `data`.'''
+    return zlib.crc32(data, value) & 0xffffffff
+
+
+#: Checksums by name: (function, struct format of the appended value).
+CHECKSUMS = {
+    'crc16': (crc16_ccitt, '>H'),
+    'crc16-modbus': (crc16_modbus, '<H'),
+    'crc32': (crc32, '<I'),
+}
+
+
+class Checked(Codec):
+    '''Verify and strip the checksum at the end of the payloads of
+    `codec`. `checksum` is a name of :data:`CHECKSUMS`, or a
+    ``(function, struct format)`` pair. Frames with a wrong checksum are
+    dropped and counted in `errors`.'''
+    def __init__(self, codec, checksum='crc16'):
+        self.codec = codec
+        if not isinstance(checksum, tuple):
+            checksum = CHECKSUMS[checksum]
+        self.function = checksum[0]
+        self.trailer = struct.Struct(checksum[1])
+        self.errors = 0
+
+    def decode(self, buffer):
+        result = self.codec.decode(buffer)
+        if result is None or result[0] is None:
+            return result
+        payload, consumed = result
+        size = len(payload) - self.trailer.size
+        if size >= 0:
+            expected, = self.trailer.unpack_from(payload, size)
+            if self.function(memoryview(payload)[:size]) == expected:
+                return payload[:size], consumed
+        self.errors += 1
+        return None, consumed
+
+    def encode(self, payload):
+        payload = format_string(payload)
+        return self.codec.encode(payload +
+                                 self.trailer.pack(self.function(payload)))
@@ -11,6 +11,7 @@
 """
 
 import sys
+import time
 
 # -------
 # Pythons
@@ -72,6 +73,9 @@ elif is_py3:
     bytes = bytes
     basestring = bytes
 
+#: Clock used for timeouts and deadlines, immune to wall-clock changes.
+monotonic = time.monotonic
+
 
 def format_unicode(s, encoding='utf-8'):
     if isinstance(s, str):
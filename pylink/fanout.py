@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+'''
+    pylink.fanout
+    -------------
+
+    Send the same request to many links at once and collect the replies as
+    they come, so that a poll cycle lasts about as long as the slowest
+    station instead of the sum of all of them::
+
+        >>> for url, reply, latency in poll(urls, "DATA?", reader=b"END",
+        ...                                 deadline=10):
+        ...     if isinstance(reply, Exception):
+        ...         print("%s failed: %s" % (url, reply))
+
+    :copyright: Copyright 2012 Salem Harrache and contributors, see AUTHORS.
+    :license: BSD, see LICENSE for details.
+
+'''
+from __future__ import unicode_literals
+from concurrent import futures
+
+from . import link_from_url
+from .logger import LOGGER
+from .compat import monotonic
+
+
+def poll(urls, request, reader=None, concurrency=16, deadline=None,
+         timeout=None, pool=None, factory=link_from_url):
+    '''Send `request` to the link of each url of `urls` and yield
+    ``(url, reply, latency)`` as soon as each exchange ends, `reply` being
+    the exception raised by a failed exchange. `latency` is the duration
+    of the exchange in seconds, link opening included.
+
+    - `reader`: how to read each reply, as the `expect` argument of
+      :meth:`Link.transact` (None, a size, a terminator or a
+      ``reader(link, timeout)`` callable).
+    - `concurrency`: maximum number of exchanges running at once, each in
+      its own thread.
+    - `deadline`: seconds after which the exchanges still waiting or
+      running are given up, and yielded with a `TimeoutError`. Exchanges
+      started before also shorten their reads to end by then.
+    - `timeout`: read timeout of each exchange, the link timeout by
+      default.
+    - `pool`: a :class:`~pylink.pool.LinkPool` to take the links from and
+      give them back to. Without it, each exchange opens a link with
+      `factory` and closes it at the end.
+
+    A given url is polled once per occurrence in `urls`.'''
+    urls = list(urls)
+    if not urls:
+        return
+    begin = monotonic()
+    end = None if deadline is None else begin + deadline
+
+    def exchange(url):
+        remaining = _left(end)
+        if remaining == 0:
+            raise TimeoutError('Deadline reached before polling %s' % url)
+        if pool is not None:
+            with pool.acquire(url, remaining) as link:
+                return link.transact(request, reader, timeout, _left(end))
+        link = factory(url)
+        try:
+            link.open()
+            return link.transact(request, reader, timeout, _left(end))
+        finally:
+            link.close()
+
+    def run(url):
+        start = monotonic()
+        try:
+            reply = exchange(url)
+        except Exception as e:
+            LOGGER.error('Fanout : %s failed (%s)' % (url, e))
+            reply = e
+        return reply, monotonic() - start
+
+    executor = futures.ThreadPoolExecutor(max_workers=min(concurrency,
+                                                          len(urls)))
+    pending = {}
+    try:
+        for url in urls:
+            pending[executor.submit(run, url)] = url
+        try:
+            for future in futures.as_completed(list(pending), _left(end)):
+                reply, latency = future.result()
+                yield (pending.pop(future), reply, latency)
+        except futures.TimeoutError:
+            pass
+        for future, url in list(pending.items()):
+            future.cancel()
+            del pending[future]
+            LOGGER.error('Fanout : %s given up after %ss' % (url, deadline))
+            yield (url, TimeoutError('No reply from %s before the deadline'
+                                     % url), monotonic() - begin)
+    finally:
+        for future in pending:
+            future.cancel()
+        # Exchanges still running end on their own, with their read timeout
+        executor.shutdown(wait=False)
+
+
+def _left(end):
+    '''Seconds left until the monotonic time `end` (None for no limit).'''
+    if end is None:
+        return None
+    return max(0, end - monotonic())
@@ -8,19 +8,150 @@
 
 '''
 from __future__ import unicode_literals
+import os
+import re
+import atexit
+import logging
 import socket
-import time
-import serial
+import selectors
+import sys
 import binascii
+import random
+import tempfile
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
 
+from . import metrics, trace, resolver
+from .codecs import LengthPrefixed
 from .logger import LOGGER
-from .compat import bytes, str, format_string
+from .compat import bytes, str, format_string, monotonic
+
+
+def _terminator_finder(buffer, terminator):
+    '''Return a function giving the offset just past `terminator` in the
+    growing `buffer`, or -1. `terminator` is a byte string (searched
+    incrementally) or a compiled bytes regex.'''
+    if hasattr(terminator, 'search'):
+        def find():
+            match = terminator.search(buffer)
+            return match.end() if match else -1
+    else:
+        terminator = format_string(terminator)
+        start = [0]
+
+        def find():
+            index = buffer.find(terminator, start[0])
+            # Resume the next search where a terminator could start
+            start[0] = max(0, len(buffer) - len(terminator) + 1)
+            return index + len(terminator) if index >= 0 else -1
+    return find
+
+
+def _byte_to_hex(data):
+    try:
+        return str(binascii.hexlify(data, ' ').upper(), "utf-8")
+    except TypeError:
+        # No separator before Python 3.8
+        hexstr = str(binascii.hexlify(data), "utf-8").upper()
+        return ' '.join(hexstr[i:i + 2] for i in range(0, len(hexstr), 2))
+
+
+class _LogData(object):
+    '''Format link data for the logs only when the record is emitted:
+    repr for text, hex dump for bytes.'''
+    __slots__ = ('data',)
+
+    def __init__(self, data):
+        self.data = data
+
+    def __str__(self):
+        if isinstance(self.data, str):
+            return repr(self.data)
+        return _byte_to_hex(self.data)
+
+
+_TRACE_KINDS = {"Read": trace.READ, "Write": trace.WRITE}
+
+
+class _FifoLock(object):
+    '''Lock granted in arrival order, which also remembers when it was
+    last released.'''
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._waiters = deque()
+        self._busy = False
+        self.released_at = 0
+
+    def acquire(self, timeout=None):
+        with self._lock:
+            if not self._busy and not self._waiters:
+                self._busy = True
+                return True
+            waiter = threading.Event()
+            self._waiters.append(waiter)
+        if waiter.wait(timeout):
+            return True
+        with self._lock:
+            # The lock may have been handed over since the wait timed out
+            if waiter.is_set():
+                return True
+            self._waiters.remove(waiter)
+            return False
+
+    def release(self):
+        with self._lock:
+            self.released_at = monotonic()
+            if self._waiters:
+                # Hand the lock over to the oldest waiter, it stays busy
+                self._waiters.popleft().set()
+            else:
+                self._busy = False
+
+
+_fifo_locks_lock = threading.Lock()
+
+#: Socket options of `TCPLink`: name -> (level, option). TCP_CORK and
+#: TCP_KEEPIDLE only exist on Linux.
+SOCKET_OPTIONS = {
+    'nodelay': (socket.IPPROTO_TCP, socket.TCP_NODELAY),
+    'keepalive': (socket.SOL_SOCKET, socket.SO_KEEPALIVE),
+    'keepidle': (socket.IPPROTO_TCP, getattr(socket, 'TCP_KEEPIDLE', None)),
+    'sndbuf': (socket.SOL_SOCKET, socket.SO_SNDBUF),
+    'rcvbuf': (socket.SOL_SOCKET, socket.SO_RCVBUF),
+    'cork': (socket.IPPROTO_TCP, getattr(socket, 'TCP_CORK', None)),
+}
+
+# Maximum number of buffers given to one sendmsg call
+_IOV_MAX = 1024
 
 
 class Link(object):
     '''Abstract base class for all links.'''
     MAX_STRING_SIZE = 4048
 
+    #: While nothing at all has been received, a read waits this many times
+    #: its timeout before giving up (the peer may be slow to answer). Once a
+    #: first chunk arrived, the read ends after one timeout of silence.
+    FIRST_READ_FACTOR = 2
+
+    #: In binary mode, reads always return bytes. Otherwise they return str
+    #: when the data is valid UTF-8.
+    binary = False
+
+    #: Minimum time (seconds) between the end of a transaction and the next
+    #: request, e.g. for the bus turnaround of a RS-485 device.
+    turnaround = 0
+
+    #: In buffered mode, writes are gathered until :meth:`flush`, a read,
+    #: or until `flush_size` bytes or `flush_age` seconds are reached (both
+    #: checked on write).
+    buffered = False
+    flush_size = 65536
+    flush_age = None
+    _wbuffer = None
+
     def open(self):
         '''Open the link.'''
         pass
@@ -29,19 +160,52 @@ class Link(object):
         '''Close the link.'''
         pass
 
+    def is_alive(self):
+        '''Cheap check that an opened link is still usable, without sending
+        anything on it.'''
+        return True
+
+    def _set_buffering(self, buffered, flush_size, flush_age):
+        self.buffered = buffered
+        if flush_size is not None:
+            self.flush_size = flush_size
+        self.flush_age = flush_age
+
+    def _buffer_write(self, data):
+        '''Gather `data` (bytes) with the previous writes, and flush them
+        when the buffer is full or old enough.'''
+        if not self._wbuffer:
+            self._wbuffer = []
+            self._wbuffer_size = 0
+            self._wbuffer_since = monotonic()
+        self._wbuffer.append(data)
+        self._wbuffer_size += len(data)
+        if self._wbuffer_size >= self.flush_size or \
+                (self.flush_age is not None and
+                 monotonic() - self._wbuffer_since >= self.flush_age):
+            self.flush()
+
+    def flush(self):
+        '''Send the buffered writes at once (see `buffered`).'''
+        if self._wbuffer:
+            buffers, self._wbuffer = self._wbuffer, None
+            self._send_buffers(buffers)
+
+    def _send_buffers(self, buffers):
+        '''Send a list of byte strings.'''
+        raise NotImplementedError()
+
     def byte_to_hex(self, bytes):
         '''Convert a byte string to it's hex string representation.'''
-        hexstr = str(binascii.hexlify(bytes), "utf-8")
-        data = []
-        for i in range(0, len(hexstr), 2):
-            data.append("%s" % hexstr[i:i + 2].upper())
-        return ' '.join(data)
+        return _byte_to_hex(bytes)
 
     def log(self, message, data):
-        if not self.is_text(data):
-            LOGGER.info("%s : <%s>" % (message, self.byte_to_hex(data)))
-        else:
-            LOGGER.info("%s : <%s>" % (message, repr(data)))
+        '''Log `data` at INFO level. The data is only formatted if a record
+        is emitted, and the traffic is also sent to the active trace.'''
+        if LOGGER.isEnabledFor(logging.INFO):
+            LOGGER.info("%s : <%s>", message, _LogData(data))
+        if trace.TRACE is not None and message in _TRACE_KINDS:
+            trace.TRACE.record(_TRACE_KINDS[message], self.url, data)
 
     def is_text(self, data):
         return isinstance(data, str)
@@ -49,6 +213,370 @@ class Link(object):
     def is_bytes(self, data):
         return isinstance(data, bytes)
 
+    def decode(self, data):
+        '''Return `data` as bytes in binary mode. Otherwise return it as str
+        when it is valid UTF-8, as bytes if not.'''
+        if self.binary:
+            return bytes(data)
+        try:
+            return str(data, encoding='utf8')
+        except UnicodeDecodeError:
+            return bytes(data)
+
+    def _recv_chunk(self, size, timeout):
+        '''Return up to `size` bytes as soon as some are available. An empty
+        byte string means that nothing arrived within `timeout` seconds or
+        that the peer closed the link.'''
+        raise NotImplementedError
+
+    def _deadline(self, timeout):
+        if timeout is None:
+            timeout = self.timeout or 0
+        return monotonic() + timeout
+
+    def _fill(self, deadline):
+        '''Append newly received bytes to the receive buffer. Return False
+        when nothing arrived before `deadline`.'''
+        data = self._recv_chunk(self.MAX_STRING_SIZE, deadline - monotonic())
+        self._rbuffer.extend(data)
+        return len(data) != 0
+
+    def _take(self, size):
+        '''Remove and return (as bytes) the first `size` buffered bytes.'''
+        data = bytes(self._rbuffer[:size])
+        del self._rbuffer[:size]
+        return data
+
+    def _take_into(self, view):
+        '''Move buffered bytes to the start of `view`, return their count.'''
+        size = min(len(self._rbuffer), len(view))
+        if size:
+            view[:size] = self._rbuffer[:size]
+            del self._rbuffer[:size]
+        return size
+
+    def _framed(self, data):
+        if len(data) != 0:
+            self.log("Read", data)
+        return self.decode(data)
+
+    def _count_read(self, size, complete, begin):
+        '''Count a read of `size` bytes started at `begin`, which ended with
+        all the requested data (`complete`) or by its timeout.'''
+        if metrics.ENABLED:
+            metrics.of(self).read(size, complete, monotonic() - begin)
+
+    def _count_write(self, size):
+        if metrics.ENABLED:
+            metrics.of(self).write(size)
+
+    def _count_open(self, begin):
+        if metrics.ENABLED:
+            link_metrics = metrics.of(self)
+            link_metrics.opens += 1
+            link_metrics.open_time += monotonic() - begin
+
+    def _count_close(self):
+        link_metrics = metrics.get_metrics(self)
+        if link_metrics is not None:
+            link_metrics.closes += 1
+
+    def _count_reconnect(self):
+        if metrics.ENABLED:
+            metrics.of(self).reconnects += 1
+
+    def read_exactly(self, size, timeout=None):
+        '''Read exactly `size` bytes, unless `timeout` seconds (the link
+        timeout by default) elapse first, in which case the bytes received
+        so far are returned. Data is converted like :meth:`read` does.'''
+        self.flush()
+        begin = monotonic()
+        deadline = self._deadline(timeout)
+        while len(self._rbuffer) < size and self._fill(deadline):
+            pass
+        data = self._take(size)
+        self._count_read(len(data), len(data) == size, begin)
+        return self._framed(data)
+
+    def read_until(self, terminator=b'\n', size=None, timeout=None):
+        '''Read until `terminator` is found and return the data including
+        it. `terminator` is a byte string or a compiled bytes regex. The read
+        also ends after `size` bytes or `timeout` seconds (the link timeout by
+        default), returning what was received so far. Bytes that follow the
+        terminator are kept for the next read.'''
+        self.flush()
+        begin = monotonic()
+        find = _terminator_finder(self._rbuffer, terminator)
+        deadline = self._deadline(timeout)
+        complete = True
+        while True:
+            end = find()
+            if end >= 0:
+                break
+            if size is not None and len(self._rbuffer) >= size:
+                end = size
+                break
+            if not self._fill(deadline):
+                end = len(self._rbuffer)
+                complete = False
+                break
+        if size is not None:
+            end = min(end, size)
+        data = self._take(end)
+        self._count_read(len(data), complete, begin)
+        return self._framed(data)
+
+    def read_frame(self, length_prefix=1, timeout=None, codec=None):
+        '''Read a frame and return its payload. By default the frame
+        starts with its length: an unsigned big-endian integer of
+        `length_prefix` bytes, or any :mod:`struct` format (e.g. ``'<H'``).
+        Other framings and checksums are given by a `codec` of
+        :mod:`pylink.codecs`, whose invalid frames are dropped. If no frame
+        is complete after `timeout` seconds, return None and keep the
+        partial frame buffered for the next call.'''
+        self.flush()
+        begin = monotonic()
+        if codec is None:
+            codec = LengthPrefixed(length_prefix)
+        deadline = self._deadline(timeout)
+        while True:
+            frame = self._next_frame(codec)
+            if frame is not None:
+                self._count_read(frame[1], True, begin)
+                return self._framed(frame[0])
+            if not self._fill(deadline):
+                self._count_read(0, False, begin)
+                return None
+
+    def _next_frame(self, codec):
+        '''Remove the next valid frame from the receive buffer and return
+        its (`payload`, `size`), or None.'''
+        while True:
+            result = codec.decode(self._rbuffer)
+            if result is None:
+                return None
+            del self._rbuffer[:result[1]]
+            if result[0] is not None:
+                return result
+            LOGGER.error('%s : invalid frame of %d bytes dropped'
+                         % (self, result[1]))
+
+    #: Delay between two attempts to reopen a dead link while streaming, in
+    #: seconds (doubled up to `MAX_REOPEN_DELAY` while they fail).
+    REOPEN_DELAY = 0.1
+    MAX_REOPEN_DELAY = 30
+
+    def iter_chunks(self, size=None, idle_timeout=None, reconnect=True):
+        '''Yield the data as it arrives, in chunks of at most `size` bytes
+        (`MAX_STRING_SIZE` by default). See :meth:`iter_lines` for
+        `idle_timeout` and `reconnect`.'''
+        size = size or self.MAX_STRING_SIZE
+        for begin in self._stream(idle_timeout, reconnect):
+            while self._rbuffer:
+                data = self._take(size)
+                self._count_read(len(data), True, begin)
+                yield self._framed(data)
+
+    def iter_lines(self, terminator=b'\n', max_size=65536, idle_timeout=None,
+                   reconnect=True):
+        '''Yield each record ending with `terminator` (a byte string or a
+        compiled bytes regex) as soon as it is complete, terminator
+        included.
+
+        Reading is driven by the consumer: nothing more is read from the
+        link while the previous record is being processed, so a slow
+        consumer throttles the sender through the transport flow control
+        instead of growing a buffer. A record longer than `max_size` bytes
+        is yielded in parts.
+
+        The iteration goes on through silences and ends after
+        `idle_timeout` seconds without data (never by default). A link
+        found dead (peer hung up, carrier lost) is closed and opened again
+        if `reconnect` is set, with a growing delay between attempts
+        (see `REOPEN_DELAY`), the partial record being dropped; otherwise
+        the iteration ends.'''
+        for begin in self._stream(idle_timeout, reconnect):
+            while True:
+                end = _terminator_finder(self._rbuffer, terminator)()
+                if end < 0:
+                    if len(self._rbuffer) < max_size:
+                        break
+                    LOGGER.error('%s : record longer than %d bytes'
+                                 % (self, max_size))
+                    end = max_size
+                data = self._take(end)
+                self._count_read(len(data), True, begin)
+                yield self._framed(data)
+
+    def iter_frames(self, length_prefix=1, max_size=65536, idle_timeout=None,
+                    reconnect=True, codec=None):
+        '''Yield the payload of each frame (see :meth:`read_frame`) as soon
+        as it is complete. A length prefix announcing more than `max_size`
+        bytes raises `ValueError`: the stream cannot be resynchronized. See
+        :meth:`iter_lines` for the other parameters.'''
+        if codec is None:
+            codec = LengthPrefixed(length_prefix, max_size)
+        for begin in self._stream(idle_timeout, reconnect):
+            while True:
+                frame = self._next_frame(codec)
+                if frame is None:
+                    break
+                self._count_read(frame[1], True, begin)
+                yield self._framed(frame[0])
+
+    def _stream(self, idle_timeout, reconnect):
+        '''Receive into the buffer and yield the time of each arrival,
+        until `idle_timeout` seconds pass without data.'''
+        self.flush()
+        last = monotonic()
+        delay = 0
+        while True:
+            wait = self.timeout or 1
+            if idle_timeout is not None:
+                wait = min(wait, last + idle_timeout - monotonic())
+                if wait <= 0:
+                    return
+            try:
+                received = self._fill(monotonic() + wait)
+            except socket.error as e:
+                if not reconnect:
+                    raise
+                LOGGER.error('%s : read failed (%s)' % (self, e))
+                received = False
+            if received:
+                last = monotonic()
+                delay = 0
+                end = self._end_of_stream()
+                if end < 0:
+                    yield last
+                    continue
+                # The end of the connection was reported in the data
+                del self._rbuffer[end:]
+                yield last
+            elif self.is_alive():
+                continue
+            if not reconnect:
+                return
+            delay = self._reopen(delay)
+
+    def _end_of_stream(self):
+        '''Return the offset of an end of connection reported in the
+        receive buffer, or -1.'''
+        return -1
+
+    def _reopen(self, delay):
+        '''Wait `delay` seconds, then close and open the dead link again.
+        Return the delay before the next attempt.'''
+        time.sleep(delay)
+        if self._rbuffer:
+            LOGGER.error('%s : %d bytes of a partial record dropped'
+                         % (self, len(self._rbuffer)))
+            del self._rbuffer[:]
+        try:
+            self.close()
+        except Exception as e:
+            LOGGER.error('%s : close failed (%s)' % (self, e))
+        # Left over by the closing exchange (e.g. a GSM hang-up)
+        del self._rbuffer[:]
+        try:
+            self.open()
+        except Exception as e:
+            LOGGER.error('%s : reopen failed (%s)' % (self, e))
+            return min(max(2 * delay, self.REOPEN_DELAY),
+                       self.MAX_REOPEN_DELAY)
+        self._count_reconnect()
+        LOGGER.info('%s was reopened' % self)
+        return 0
+
+    @property
+    def _transactions(self):
+        lock = self.__dict__.get('_fifo_lock')
+        if lock is None:
+            with _fifo_locks_lock:
+                lock = self.__dict__.setdefault('_fifo_lock', _FifoLock())
+        return lock
+
+    @contextmanager
+    def locked(self, deadline=None):
+        '''Context manager holding the link for a multi-step exchange. The
+        callers are served in arrival order; if the link is still busy after
+        `deadline` seconds, raise `TimeoutError`.'''
+        lock = self._transactions
+        if not lock.acquire(deadline):
+            raise TimeoutError('%s is busy' % self)
+        try:
+            yield self
+        finally:
+            lock.release()
+
+    def transact(self, request, expect=None, timeout=None, deadline=None):
+        '''Write `request` and read its reply as one atomic exchange, so
+        that threads sharing the link never get each other's replies.
+        Return the reply, read according to `expect`:
+
+        - None: :meth:`read`,
+        - an int: :meth:`read_exactly` of that size,
+        - bytes, str or compiled regex: :meth:`read_until` this terminator,
+        - a callable: ``expect(link, timeout)``.
+
+        The waiting callers are served in arrival order, and the request
+        is sent at least `turnaround` seconds after the previous exchange.
+        Stale input (e.g. the late reply to a timed out exchange) is
+        dropped before the request is sent. `timeout` bounds the read (the
+        link timeout by default) and `deadline` the whole exchange, waiting
+        included: `TimeoutError` is raised if the link is still busy by
+        then.'''
+        begin = monotonic()
+        end = None if deadline is None else begin + deadline
+        with self.locked(deadline):
+            wait = self._transactions.released_at + self.turnaround - \
+                monotonic()
+            if end is not None and monotonic() + max(wait, 0) >= end:
+                raise TimeoutError('%s : no time left for the exchange'
+                                   % self)
+            if wait > 0:
+                time.sleep(wait)
+            if timeout is None:
+                timeout = self.timeout or 0
+            if end is not None:
+                timeout = max(0, min(timeout, end - monotonic()))
+            self._drop_input()
+            self.write(request)
+            if expect is None:
+                return self._read_reply(timeout, end)
+            if isinstance(expect, int):
+                return self.read_exactly(expect, timeout)
+            if callable(expect):
+                return expect(self, timeout)
+            return self.read_until(expect, timeout=timeout)
+
+    def _read_reply(self, timeout, end=None):
+        '''Read what arrives until `timeout` seconds pass without data (the
+        wait for the first bytes included), and by the monotonic time `end`
+        at the latest (if not None).'''
+        self.flush()
+        begin = monotonic()
+        data = bytearray(self._take(self.MAX_STRING_SIZE))
+        while len(data) < self.MAX_STRING_SIZE:
+            wait = timeout if end is None else min(timeout, end - monotonic())
+            if wait <= 0:
+                break
+            chunk = self._recv_chunk(self.MAX_STRING_SIZE - len(data), wait)
+            if len(chunk) == 0:
+                break
+            data += chunk
+        self._count_read(len(data), len(data) == self.MAX_STRING_SIZE, begin)
+        return self._framed(bytes(data))
+
+    def _drop_input(self):
+        '''Discard the buffered and pending input.'''
+        while self._fill(monotonic()):
+            pass
+        if self._rbuffer:
+            LOGGER.info("Drop stale input : <%s>",
+                        _LogData(bytes(self._rbuffer)))
+            del self._rbuffer[:]
+
     def __del__(self):
         '''Close link when object is deleted.'''
         self.close()
@@ -66,40 +594,125 @@ class Link(object):
 
 class TCPLink(Link):
     '''TCPLink class allows TCP/IP protocol communication with File-like
-    API.'''
-    def __init__(self, host, port, timeout=1):
+    API.
+
+    With `buffered`, writes are gathered and sent by one `sendmsg` call on
+    :meth:`flush`, on the next read, or once `flush_size` bytes are
+    buffered or the oldest write is `flush_age` seconds old.
+
+    The keyword `options` set the socket options (see
+    :data:`SOCKET_OPTIONS`): `nodelay`, `keepalive`, `keepidle` (seconds),
+    `sndbuf`, `rcvbuf` (bytes) and `cork`. Options not supported by the
+    platform are ignored.
+
+    `host` is resolved when the link opens, through the shared cache of
+    `resolver` (IPv4 and IPv6), and the resolved addresses are tried in
+    parallel, staggered by `connect_delay` seconds.'''
+    # Set on the class too, for `close` on partly built links
+    _socket = None
+
+    #: Resolver of the host names, see :class:`pylink.resolver.Resolver`.
+    resolver = resolver.RESOLVER
+
+    #: Delay before trying the next address of a host, in seconds.
+    connect_delay = 0.25
+
+    _socktype = socket.SOCK_STREAM
+    # Address of the last connection
+    _peer = None
+
+    def __init__(self, host, port, timeout=1, binary=False, buffered=False,
+                 flush_size=None, flush_age=None, **options):
         self.timeout = timeout
-        self.host = socket.gethostbyname(host)
+        self.binary = binary
+        self.host = host
         self.port = port
+        for name in options:
+            if name not in SOCKET_OPTIONS:
+                raise ValueError('Unknown socket option %s' % name)
+        self.options = options
+        self._set_buffering(buffered, flush_size, flush_age)
         self._socket = None
+        self._selector = None
+        self._rbuffer = bytearray()
+
+    def resolve(self):
+        '''Return the `getaddrinfo` results of `host` and `port`.'''
+        return self.resolver.resolve(self.host, self.port, self._socktype)
 
     @property
     def address(self):
-        '''Return a tuple of (`host`, `port`).'''
-        return (self.host, self.port)
+        '''Return a tuple of (`ip`, `port`): the address of the last
+        connection, or else the first resolved address.'''
+        if self._peer is not None:
+            return self._peer
+        return self.resolve()[0][4][:2]
+
+    def _format_url(self, scheme):
+        # Never resolves: links are formatted in every log message
+        host, port = self._peer or (self.host, self.port)
+        if ':' in host:
+            host = '[%s]' % host
+        return '%s:%s:%d' % (scheme, host, port)
 
     @property
     def url(self):
-        '''Make a connection url from `host` and `port`.'''
-        return 'tcp:%s:%d' % self.address
+        '''Make a connection url from the address of the last connection,
+        or else from `host` and `port`.'''
+        return self._format_url('tcp')
 
     def open(self):
         '''Open the socket.'''
         if self._socket is None:
-            self._socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            self._socket.connect(self.address)
-            self.socket.setblocking(0)
+            begin = monotonic()
+            self._socket = self._connect()
+            self._socket.setblocking(0)
+            self._register()
+            self._count_open(begin)
             LOGGER.info('new %s was initialized' % self)
 
+    def _connect(self, timeout=None):
+        '''Return a new socket connected to one of the addresses of
+        `host`.'''
+        try:
+            sock = resolver.connect(self.resolve(), timeout,
+                                    self.connect_delay, self._set_options)
+        except socket.error:
+            # The host may have moved, resolve it again next time
+            self.resolver.forget(self.host, self.port, self._socktype)
+            raise
+        self._peer = sock.getpeername()[:2]
+        return sock
+
+    def _set_options(self, sock):
+        '''Apply the socket `options` (before connecting, so that the
+        buffer sizes apply to the TCP window).'''
+        for name, value in self.options.items():
+            level, option = SOCKET_OPTIONS[name]
+            if value is None or option is None:
+                continue
+            if level == socket.IPPROTO_TCP and sock.type != socket.SOCK_STREAM:
+                continue
+            sock.setsockopt(level, option, int(value))
+
+    def _register(self):
+        '''Watch the freshly opened socket with a selector.'''
+        self._selector = selectors.DefaultSelector()
+        self._selector.register(self._socket, selectors.EVENT_READ)
+
     def settimeout(self, timeout):
         self.timeout = timeout
 
     def close(self):
-        '''Close the socket.'''
+        '''Close the socket, after sending the buffered writes.'''
         if self._socket is not None:
             LOGGER.info('Close connection %s' % self)
+            self.flush()
             self.empty_socket()
+            self._selector.close()
+            self._selector = None
             self._socket.close()
+            self._count_close()
             LOGGER.info('Connection %s was closed' % self)
             self._socket = None
 
@@ -109,58 +722,168 @@ class TCPLink(Link):
         self.open()
         return self._socket
 
+    def fileno(self):
+        '''Return the file descriptor of the opened socket.'''
+        return self.socket.fileno()
+
     def write(self, data):
         '''Write all `data` to socket.'''
         if self.is_text(data):
-            self.send_to_socket(bytes(data.encode('utf-8')))
+            encoded = bytes(data.encode('utf-8'))
         else:
-            self.send_to_socket(data)
+            encoded = data
+        if self.buffered:
+            self._buffer_write(bytes(encoded))
+        else:
+            self.send_to_socket(encoded)
+        self._count_write(len(format_string(data)))
         self.log("Write", data)
 
-    def read(self, size=None, timeout=None):
+    def _send_buffers(self, buffers):
+        '''Send `buffers` with as few `sendmsg` calls as possible.'''
+        sock = self.socket
+        if not hasattr(sock, 'sendmsg'):
+            self.send_to_socket(b''.join(buffers))
+            return
+        views = deque(memoryview(data) for data in buffers)
+        while views:
+            try:
+                sent = sock.sendmsg(list(views)[:_IOV_MAX])
+            except (BlockingIOError, InterruptedError):
+                self._wait_writable()
+                continue
+            while sent:
+                if sent >= len(views[0]):
+                    sent -= len(views.popleft())
+                else:
+                    views[0] = views[0][sent:]
+                    sent = 0
+        if self.options.get('cork') and SOCKET_OPTIONS['cork'][1]:
+            # Push the corked partial frame now
+            level, option = SOCKET_OPTIONS['cork']
+            sock.setsockopt(level, option, 0)
+            sock.setsockopt(level, option, 1)
+
+    def _wait_writable(self):
+        with selectors.DefaultSelector() as selector:
+            selector.register(self._socket, selectors.EVENT_WRITE)
+            if not selector.select(self.timeout):
+                raise socket.timeout('%s : write timed out' % self)
+
+    def read(self, size=None, timeout=None, first_timeout=None):
         '''Read data from socket. The maximum amount of data to be received at
-        once is specified by `size`. If `is_byte` is True, the data will be
-        convert to hexadecimal array.'''
+        once is specified by `size`. The read ends when `size` bytes are
+        received or when the peer stays quiet for `timeout` (see
+        :meth:`recv_timeout` for `first_timeout`).'''
+        self.flush()
         size = size or self.MAX_STRING_SIZE
         timeout = (timeout or 1) * (self.timeout or 1)
-        data = self.recv_timeout(size, timeout)
+        begin = monotonic()
+        data = bytearray(size)
+        with memoryview(data) as view:
+            count = self.recv_timeout_into(view, timeout, first_timeout)
+        del data[count:]
+        self._count_read(count, count == size, begin)
+        data = self.decode(data)
         if len(data) != 0 :
             self.log("Read", data)
         return data
 
-    def recv_timeout(self, size, timeout):
-        '''Uses a non-blocking sockets in order to continue trying to get data
-        as long as the client manages to even send a single byte.
-        This is useful for moving data which you know very little about
-        (like encrypted data), so cannot check for completion in a sane way.
+    def is_alive(self):
+        '''Return False if the socket is closed or the peer hung up.'''
+        if self._socket is None:
+            return False
+        if not self._selector.select(0):
+            return True
+        try:
+            return self._socket.recv(1, socket.MSG_PEEK) != b''
+        except (BlockingIOError, InterruptedError):
+            return True
+        except socket.error:
+            return False
+
+    def wait_readable(self, timeout):
+        '''Block until the socket has data to read or `timeout` seconds
+        elapsed (no limit if None), without using any CPU. Return True if
+        data is ready.'''
+        if timeout is not None:
+            timeout = max(timeout, 0)
+        return bool(self.socket and self._selector.select(timeout))
+
+    def readinto(self, buffer, timeout=None, first_timeout=None):
+        '''Read data into `buffer`, a writable bytes-like object (bytearray,
+        memoryview...), and return the number of bytes received. The read
+        ends like :meth:`read` with ``size = len(buffer)``. Bytes go from the
+        socket straight into `buffer` with `recv_into`.'''
+        self.flush()
+        timeout = (timeout or 1) * (self.timeout or 1)
+        begin = monotonic()
+        view = memoryview(buffer).cast('B')
+        size = self.recv_timeout_into(view, timeout, first_timeout)
+        self._count_read(size, size == len(view), begin)
+        if size != 0:
+            self.log("Read", view[:size])
+        return size
+
+    def recv_timeout(self, size, timeout, first_timeout=None):
+        '''Receive up to `size` bytes, see :meth:`recv_timeout_into`.'''
+        data = bytearray(size)
+        with memoryview(data) as view:
+            size = self.recv_timeout_into(view, timeout, first_timeout)
+        del data[size:]
+        return self.decode(data)
+
+    def recv_timeout_into(self, view, timeout, first_timeout=None):
+        '''Receive bytes into the memoryview `view` and return their count.
+        The socket selector wakes the read as soon as bytes arrive, and
+        deadlines use a monotonic clock.
+
+        - Once some data was received, the read ends after `timeout` seconds
+          without new data.
+        - While nothing was received, it waits `first_timeout` seconds, which
+          defaults to ``timeout * FIRST_READ_FACTOR`` (twice the timeout).
+
+        The read also ends as soon as `view` is full or the peer closed the
+        connection. Bytes left over by a framed read are returned first.
         '''
-        begin = time.time()
-        data = bytearray()
-        total_data = []
-        while True:
-            #if you got some data, then break after wait sec
-            if total_data and time.time() - begin > timeout:
-                break
-            #if you got no data at all, wait a little longer
-            elif time.time() - begin > (timeout * 2):
+        size = self._take_into(view)
+        if size:
+            deadline = monotonic() + timeout
+        else:
+            if first_timeout is None:
+                first_timeout = timeout * self.FIRST_READ_FACTOR
+            deadline = monotonic() + first_timeout
+        while size < len(view):
+            count = self._recv_chunk_into(view[size:], deadline - monotonic())
+            if not count:
                 break
+            size += count
+            deadline = monotonic() + timeout
+        return size
+
+    def _recv_chunk_into(self, view, timeout):
+        deadline = monotonic() + timeout
+        while self.wait_readable(deadline - monotonic()):
+            try:
+                size = self.recv_from_socket_into(view)
+            except (BlockingIOError, InterruptedError):
+                continue
+            # None means nothing usable (e.g. a datagram from another peer)
+            if size is not None:
+                return size
+        return 0
+
+    def _recv_chunk(self, size, timeout):
+        deadline = monotonic() + timeout
+        while self.wait_readable(deadline - monotonic()):
             try:
                 data = self.recv_from_socket(size)
-                if data:
-                    total_data.append(data)
-                    size = size - len(data)
-                    if size == 0:
-                        break
-                    begin = time.time()
-                else:
-                    time.sleep(0.1)
-            except:
-                pass
-        # Try to convert into str
-        try:
-            return str(b"".join(total_data), encoding='utf8')
-        except:
-            return b"".join(total_data)
+            except (BlockingIOError, InterruptedError):
+                continue
+            # None means nothing usable (e.g. a datagram from another peer)
+            if data is not None:
+                return data
+        return b''
 
     def send_to_socket(self, data):
         '''Send data to TCP socket.'''
@@ -170,36 +893,475 @@ class TCPLink(Link):
         '''Read data from TCP socket.'''
         return self.socket.recv(size)
 
+    def recv_from_socket_into(self, buffer):
+        '''Read data from TCP socket into `buffer`, return the size.'''
+        return self.socket.recv_into(buffer)
+
     def empty_socket(self):
         '''Read data from TCP socket.'''
-        # empty buffer reception
-        self.recv_timeout(self.MAX_STRING_SIZE, timeout=0.1)
+        # empty buffer reception, without waiting if nothing is pending
+        self.recv_timeout(self.MAX_STRING_SIZE, timeout=0.1, first_timeout=0)
 
 
 class UDPLink(TCPLink):
     '''TCPLink class allows UDP/IP protocol communication with File-like
-    API.'''
+    API.
+
+    The socket is connected to (`host`, `port`): the kernel drops the
+    datagrams of other peers. :meth:`read` joins the datagrams in a byte
+    stream, :meth:`read_datagram`, :meth:`read_datagrams` and
+    :meth:`write_many` keep their boundaries.'''
+
+    #: Largest UDP payload.
+    MAX_DATAGRAM_SIZE = 65535
+
+    _socktype = socket.SOCK_DGRAM
 
     @property
     def url(self):
         '''Make a connection url from `host` and `port`.'''
-        return 'udp:%s:%d' % self.address
+        return self._format_url('udp')
 
     def open(self):
-        '''Open the socket.'''
+        '''Open the socket, connected to the first address of `host`.'''
         if self._socket is None:
-            self._socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            begin = monotonic()
+            family, socktype, proto, _, sockaddr = self.resolve()[0]
+            sock = socket.socket(family, socktype, proto)
+            try:
+                self._set_options(sock)
+                sock.connect(sockaddr)
+            except Exception:
+                sock.close()
+                raise
+            self._peer = sockaddr[:2]
+            self._socket = sock
+            self._socket.setblocking(0)
+            self._register()
+            self._datagram = bytearray(self.MAX_DATAGRAM_SIZE)
+            self._count_open(begin)
             LOGGER.info('new %s was initialized' % self)
 
+    def is_alive(self):
+        '''Return True while the socket is open (UDP has no connection).'''
+        return self._socket is not None
+
     def send_to_socket(self, data):
-        '''Send data to TCP socket.'''
-        self.socket.sendto(data, self.address)
+        '''Send data to UDP socket.'''
+        try:
+            self.socket.send(data)
+        except ConnectionRefusedError:
+            # Reported for an earlier datagram (ICMP port unreachable)
+            self.socket.send(data)
 
     def recv_from_socket(self, size):
-        '''Read data from TCP socket.'''
-        data, address = self.socket.recvfrom(size)
-        if address == self.address:
-            return data
+        '''Read data from UDP socket.'''
+        try:
+            data = self.socket.recv(size)
+        except ConnectionRefusedError:
+            return None
+        # Empty datagrams carry nothing for a byte stream, skip them too
+        return data or None
+
+    def recv_from_socket_into(self, buffer):
+        '''Read a datagram from UDP socket into `buffer`, return the size.'''
+        try:
+            size = self.socket.recv_into(buffer)
+        except ConnectionRefusedError:
+            return None
+        return size or None
+
+    def _send_buffers(self, buffers):
+        '''Send each buffered write as its own datagram.'''
+        for data in buffers:
+            self.send_to_socket(data)
+
+    def write_many(self, datagrams):
+        '''Send each item of `datagrams` as one datagram, return their
+        count.
+
+        The standard library has no `sendmmsg`: this is still one `send`
+        call per datagram, made in a row once all the datagrams are
+        encoded, without the checks of :meth:`write` between them. A
+        buffered link queues them for the next flush.'''
+        datagrams = list(datagrams)
+        encoded = [format_string(data) for data in datagrams]
+        if self.buffered:
+            for data in encoded:
+                self._buffer_write(data)
+        else:
+            self._send_buffers(encoded)
+        for data, sent in zip(datagrams, encoded):
+            self._count_write(len(sent))
+            self.log("Write", data)
+        return len(encoded)
+
+    def read_datagram(self, timeout=None):
+        '''Return the next datagram, or None if none arrived within
+        `timeout` seconds (the link timeout by default).'''
+        datagrams = self.read_datagrams(1, timeout)
+        return datagrams[0] if datagrams else None
+
+    def read_datagrams(self, max_count=64, timeout=None):
+        '''Wait up to `timeout` seconds (the link timeout by default, no
+        limit if it is None) for a datagram, then return it with every
+        datagram already queued on the socket, at most `max_count`. The
+        list is empty on timeout.
+
+        Datagrams are received one by one in a reused buffer: the standard
+        library has no `recvmmsg`, but a wake-up drains the whole socket
+        queue. These reads bypass the receive buffer of the stream reads.'''
+        if timeout is None:
+            timeout = self.timeout
+        self.flush()
+        begin = monotonic()
+        deadline = None if timeout is None else begin + timeout
+        datagrams = []
+        self.open()
+        view = memoryview(self._datagram)
+        while len(datagrams) < max_count:
+            try:
+                size = self.socket.recv_into(view)
+            except (BlockingIOError, InterruptedError):
+                if datagrams:
+                    break
+                if not self.wait_readable(None if deadline is None
+                                          else deadline - monotonic()):
+                    break
+                continue
+            except ConnectionRefusedError:
+                continue
+            datagrams.append(view[:size].tobytes())
+        view.release()
+        self._count_read(sum(len(data) for data in datagrams),
+                         bool(datagrams), begin)
+        for i, data in enumerate(datagrams):
+            datagrams[i] = data = self.decode(data)
+            self.log("Read", data)
+        return datagrams
+
+
+class UnixSocketLink(TCPLink):
+    '''Link over the Unix domain socket at `path`, to a process of the same
+    host: no TCP/IP stack, no name resolution. A `path` starting with
+    ``@`` is in the Linux abstract namespace.
+
+    With `type` ``'dgram'``, the socket is a datagram socket and the link
+    works like :class:`UDPLink` (:meth:`read_datagrams`,
+    :meth:`write_many`). It is bound to an automatic address, for the peer
+    to reply to. Of the socket options, only `keepalive`, `sndbuf` and
+    `rcvbuf` apply.'''
+
+    #: Socket types by name.
+    SOCKET_TYPES = {'stream': socket.SOCK_STREAM, 'dgram': socket.SOCK_DGRAM}
+
+    MAX_DATAGRAM_SIZE = UDPLink.MAX_DATAGRAM_SIZE
+
+    # Socket file bound by a datagram link, and its directory
+    _bound = None
+
+    def __init__(self, path, timeout=1, binary=False, type='stream',
+                 **kwargs):
+        if type not in self.SOCKET_TYPES:
+            raise ValueError('Unknown socket type %s' % type)
+        for name in kwargs:
+            if SOCKET_OPTIONS.get(name, (None,))[0] == socket.IPPROTO_TCP:
+                raise ValueError('Socket option %s needs TCP' % name)
+        super(UnixSocketLink, self).__init__(None, None, timeout, binary,
+                                             **kwargs)
+        self.path = path
+        self.type = type
+        self._socktype = self.SOCKET_TYPES[type]
+
+    @property
+    def datagram(self):
+        return self._socktype == socket.SOCK_DGRAM
+
+    def resolve(self):
+        '''Return the socket address of `path`, as a `getaddrinfo`
+        result.'''
+        return [(socket.AF_UNIX, self._socktype, 0, '', self.address)]
+
+    @property
+    def address(self):
+        '''Return the socket address of `path`.'''
+        if self.path.startswith('@'):
+            return '\0' + self.path[1:]
+        return self.path
+
+    @property
+    def url(self):
+        '''Make a connection url from `path`.'''
+        if self.datagram:
+            return 'unix:%s?type=dgram' % self.path
+        return 'unix:%s' % self.path
+
+    def open(self):
+        '''Open the socket.'''
+        if self._socket is None and self.datagram:
+            self._datagram = bytearray(self.MAX_DATAGRAM_SIZE)
+        super(UnixSocketLink, self).open()
+
+    def _connect(self, timeout=None):
+        sock = socket.socket(socket.AF_UNIX, self._socktype)
+        try:
+            self._set_options(sock)
+            if self.datagram:
+                self._bind(sock)
+            sock.connect(self.address)
+        except Exception:
+            sock.close()
+            self._unbind()
+            raise
+        return sock
+
+    def _bind(self, sock):
+        try:
+            # Linux picks a free abstract address
+            sock.bind('')
+        except socket.error:
+            directory = tempfile.mkdtemp(prefix='pylink-')
+            self._bound = os.path.join(directory, 'socket')
+            sock.bind(self._bound)
+
+    def _unbind(self):
+        if self._bound is not None:
+            try:
+                os.unlink(self._bound)
+                os.rmdir(os.path.dirname(self._bound))
+            except OSError:
+                pass
+            self._bound = None
+
+    def close(self):
+        '''Close the socket, after sending the buffered writes.'''
+        super(UnixSocketLink, self).close()
+        self._unbind()
+
+    def is_alive(self):
+        if self.datagram:
+            return UDPLink.is_alive(self)
+        return super(UnixSocketLink, self).is_alive()
+
+    def send_to_socket(self, data):
+        if self.datagram:
+            UDPLink.send_to_socket(self, data)
+        else:
+            super(UnixSocketLink, self).send_to_socket(data)
+
+    def recv_from_socket(self, size):
+        if self.datagram:
+            return UDPLink.recv_from_socket(self, size)
+        return super(UnixSocketLink, self).recv_from_socket(size)
+
+    def recv_from_socket_into(self, buffer):
+        if self.datagram:
+            return UDPLink.recv_from_socket_into(self, buffer)
+        return super(UnixSocketLink, self).recv_from_socket_into(buffer)
+
+    def _send_buffers(self, buffers):
+        if self.datagram:
+            UDPLink._send_buffers(self, buffers)
+        else:
+            super(UnixSocketLink, self)._send_buffers(buffers)
+
+    # Datagram type only
+    write_many = UDPLink.write_many
+    read_datagram = UDPLink.read_datagram
+    read_datagrams = UDPLink.read_datagrams
+
+
+class ReconnectingTCPLink(TCPLink):
+    '''TCPLink which survives the peer: a reset or end of connection seen
+    by a read or a write closes the socket, and the link connects again on
+    its next use.
+
+    - Connection attempts are spaced by a jittered exponential backoff,
+      from `backoff` up to `max_backoff` seconds. Between two attempts,
+      reads return nothing at once instead of waiting for their timeout.
+    - Writes made while disconnected are queued, up to `max_pending` bytes
+      (the oldest writes are dropped past that), and sent on reconnection.
+    - `connect_timeout` bounds each connection attempt (the link timeout
+      by default).
+
+    :attr:`state` tells whether the link is ``connected``, ``disconnected``
+    (waiting to connect again) or ``closed``.'''
+
+    CONNECTED = 'connected'
+    DISCONNECTED = 'disconnected'
+    CLOSED = 'closed'
+
+    def __init__(self, host, port, timeout=1, binary=False, backoff=0.1,
+                 max_backoff=30, max_pending=65536, connect_timeout=None,
+                 **kwargs):
+        super(ReconnectingTCPLink, self).__init__(host, port, timeout, binary,
+                                                  **kwargs)
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.max_pending = max_pending
+        self.connect_timeout = connect_timeout
+        self.dropped = 0
+        self._pending = deque()
+        self._pending_size = 0
+        self._failures = 0
+        self._next_attempt = None
+        self._connected_once = False
+
+    @property
+    def state(self):
+        if self._socket is not None:
+            return self.CONNECTED
+        if self._next_attempt is not None:
+            return self.DISCONNECTED
+        return self.CLOSED
+
+    def open(self):
+        '''Connect, unless connected already or waiting for the next
+        attempt. A failed attempt does not raise, see :attr:`state`.'''
+        if self._socket is not None:
+            return
+        if self._next_attempt is not None \
+                and monotonic() < self._next_attempt:
+            return
+        try:
+            super(ReconnectingTCPLink, self).open()
+        except socket.error as e:
+            self._failures += 1
+            self._retry_later('connection failed (%s)' % e)
+            return
+        if self._connected_once:
+            self._count_reconnect()
+        self._connected_once = True
+        self._failures = 0
+        self._next_attempt = None
+        self._flush_pending()
+
+    def _connect(self, timeout=None):
+        if timeout is None:
+            timeout = self.connect_timeout or self.timeout
+        return super(ReconnectingTCPLink, self)._connect(timeout)
+
+    def _retry_later(self, reason):
+        delay = min(self.max_backoff, self.backoff * 2 ** self._failures)
+        delay *= random.uniform(0.5, 1)
+        self._next_attempt = monotonic() + delay
+        LOGGER.error('%s : %s, retry in %.3fs' % (self, reason, delay))
+
+    def _drop_socket(self):
+        self._selector.close()
+        self._selector = None
+        self._socket.close()
+        self._socket = None
+
+    def _lost(self, reason):
+        '''Close the broken connection and plan the next attempt.'''
+        if self._socket is not None:
+            self._drop_socket()
+            self._retry_later('connection lost (%s)' % reason)
+
+    def close(self):
+        '''Close the socket and forget the queued writes.'''
+        if self._socket is not None:
+            self.flush()
+        if self._wbuffer:
+            self._queue(b''.join(self._wbuffer))
+            self._wbuffer = None
+        if self._pending:
+            LOGGER.error('%s : %d queued bytes were not sent'
+                         % (self, self._pending_size))
+        self._pending.clear()
+        self._pending_size = 0
+        self._next_attempt = None
+        self._failures = 0
+        if self._socket is not None:
+            self._drop_socket()
+            self._count_close()
+            LOGGER.info('Connection %s was closed' % self)
+
+    def is_alive(self):
+        '''Return True while connected, after a reconnection attempt if
+        the connection was lost.'''
+        if self._socket is not None \
+                and not super(ReconnectingTCPLink, self).is_alive():
+            self._lost('end of connection')
+        self.open()
+        return self._socket is not None
+
+    def wait_readable(self, timeout):
+        if self.socket is None:
+            return False
+        return super(ReconnectingTCPLink, self).wait_readable(timeout)
+
+    def _reopen(self, delay):
+        # The link reconnects on its own, wait for its next attempt
+        if self._next_attempt is not None:
+            time.sleep(max(0, min(self._next_attempt - monotonic(),
+                                  self.timeout or 1)))
+        return 0
+
+    def _send_buffers(self, buffers):
+        self.send_to_socket(b''.join(buffers))
+
+    def send_to_socket(self, data):
+        '''Send data to TCP socket, or queue it while disconnected.'''
+        sock = self.socket
+        if sock is not None:
+            try:
+                sock.sendall(data)
+                return
+            except (BlockingIOError, InterruptedError):
+                raise
+            except socket.error as e:
+                self._lost(e)
+        self._queue(bytes(data))
+
+    def recv_from_socket(self, size):
+        '''Read data from TCP socket, b'' once the connection is lost.'''
+        try:
+            data = self.socket.recv(size)
+        except (BlockingIOError, InterruptedError):
+            raise
+        except socket.error as e:
+            self._lost(e)
+            return b''
+        if not data:
+            self._lost('end of connection')
+        return data
+
+    def recv_from_socket_into(self, buffer):
+        '''Read data from TCP socket into `buffer`, 0 once the connection
+        is lost.'''
+        try:
+            size = self.socket.recv_into(buffer)
+        except (BlockingIOError, InterruptedError):
+            raise
+        except socket.error as e:
+            self._lost(e)
+            return 0
+        if not size:
+            self._lost('end of connection')
+        return size
+
+    def _queue(self, data):
+        self._pending.append(data)
+        self._pending_size += len(data)
+        while self._pending_size > self.max_pending:
+            dropped = self._pending.popleft()
+            self._pending_size -= len(dropped)
+            self.dropped += len(dropped)
+            LOGGER.error('%s : queue full, %d bytes dropped'
+                         % (self, len(dropped)))
+
+    def _flush_pending(self):
+        while self._pending and self._socket is not None:
+            data = self._pending.popleft()
+            self._pending_size -= len(data)
+            try:
+                self._socket.sendall(data)
+            except socket.error as e:
+                self._pending.appendleft(data)
+                self._pending_size += len(data)
+                self._lost(e)
 
 
 class SerialLink(Link):
@@ -207,16 +1369,62 @@ class SerialLink(Link):
     Possible values for the parameter port:
       - Number: number of device, numbering starts at zero.
       - Device name: depending on operating system.
-          e.g. /dev/ttyUSB0 on GNU/Linux or COM3 on Windows.'''
+          e.g. /dev/ttyUSB0 on GNU/Linux or COM3 on Windows.
+
+    With `idle_chars`, a read also returns as soon as the line stays idle
+    for that many character times after some data was received (e.g. 3.5
+    for the Modbus RTU end of frame), instead of waiting for `size` bytes
+    or the whole timeout.
+
+    The port itself keeps a short constant timeout (the idle time, or
+    `POLL_TIME`) and the reads loop up to their own deadline: pyserial
+    reconfigures the tty each time its timeout changes.'''
+
+    #: Port timeout without `idle_chars`, in seconds.
+    POLL_TIME = 0.02
+
+    #: Lower bound of the idle time, in seconds. The OS and USB adapters
+    #: (latency timers) deliver bytes by bursts, a shorter gap would split
+    #: frames.
+    MIN_IDLE_TIME = 0.005
+
+    # Set on the class too, for `close` on partly built links
+    _serial = None
+
     def __init__(self, port, baudrate=19200, bytesize=8, parity='N',
-                 stopbits=1, timeout=1):
+                 stopbits=1, timeout=1, binary=False, idle_chars=None,
+                 buffered=False, flush_size=None, flush_age=None):
         self.port = port
         self.timeout = timeout
+        self.binary = binary
         self.baudrate = baudrate
         self.bytesize = bytesize
         self.parity = parity
         self.stopbits = stopbits
+        self.idle_chars = idle_chars
+        self._set_buffering(buffered, flush_size, flush_age)
         self._serial = None
+        self._rbuffer = bytearray()
+
+    @property
+    def char_time(self):
+        '''Time to transmit one character (start, data, parity and stop
+        bits) at the current baudrate, in seconds.'''
+        bits = 1 + self.bytesize + (self.parity != 'N') + self.stopbits
+        return float(bits) / self.baudrate
+
+    @property
+    def idle_timeout(self):
+        '''Inter-byte timeout of the reads, None without `idle_chars`.'''
+        if self.idle_chars is None:
+            return None
+        return max(self.idle_chars * self.char_time, self.MIN_IDLE_TIME)
+
+    @property
+    def port_timeout(self):
+        '''Timeout given to pyserial, constant for the life of the port.'''
+        idle_timeout = self.idle_timeout
+        return self.POLL_TIME if idle_timeout is None else idle_timeout
 
     @property
     def url(self):
@@ -228,84 +1436,260 @@ class SerialLink(Link):
     def open(self):
         '''Open the serial connection.'''
         if self._serial is None:
+            # pyserial is only needed by the serial links
+            import serial
+            begin = monotonic()
             self._serial = serial.Serial(self.port, self.baudrate,
-                                         timeout=self.timeout,
+                                         timeout=self.port_timeout,
                                          bytesize=self.bytesize,
                                          parity=self.parity,
                                          stopbits=self.stopbits)
             self._serial.reset_output_buffer()
+            self._count_open(begin)
             LOGGER.info('new %s was initialized' % self)
 
     def settimeout(self, timeout):
         self.timeout = timeout
-        self.serial.timeout = self.timeout
 
     def close(self):
-        '''Close the serial connection.'''
+        '''Close the serial connection, after sending the buffered
+        writes.'''
         if self._serial is not None:
             if self._serial.isOpen():
+                self.flush()
                 self._serial.close()
+                self._count_close()
                 LOGGER.info('Connection %s was closed' % self)
             self._serial = None
 
+    def is_alive(self):
+        '''Return True while the serial port is open.'''
+        return self._serial is not None and self._serial.isOpen()
+
     @property
     def serial(self):
         '''Return an opened serial object.'''
         self.open()
         return self._serial
 
+    def fileno(self):
+        '''Return the file descriptor of the opened port (POSIX only).'''
+        return self.serial.fileno()
+
     def write(self, data):
         '''Write all `data` to the serial connection.'''
-        data = format_string(data)
-        self.serial.write(data)
-        try:
-            self.log("Write", str(data, encoding='utf8'))
-        except:
-            self.log("Write", data)
+        encoded = format_string(data)
+        if self.buffered:
+            self._buffer_write(encoded)
+        else:
+            self.serial.write(encoded)
+        self._count_write(len(encoded))
+        self.log("Write", data)
 
     def read(self, size=None, timeout=None):
         '''Read data from the serial connection. The maximum amount of data
         to be received at once is specified by `size`. If `is_byte` is True,
         the data will be convert to byte array.'''
+        self.flush()
         size = size or self.MAX_STRING_SIZE
         timeout = (timeout or 1) * (self.timeout or 1)
-        self.serial.timeout = timeout
-        data = self.serial.read(size)
-        try:
-            data = str(data, encoding='utf8')
-        except:
-            pass
+        begin = monotonic()
+        data = self._take(size)
+        if len(data) < size:
+            data += self._read_port(size - len(data), timeout)
+        self._count_read(len(data), len(data) == size, begin)
+        data = self.decode(data)
         if len(data) != 0 :
             self.log("Read", data)
-        self.serial.timeout = self.timeout
         return data
 
+    def readinto(self, buffer, timeout=None):
+        '''Read data into `buffer`, a writable bytes-like object, and return
+        the number of bytes received (see :meth:`read`).'''
+        self.flush()
+        timeout = (timeout or 1) * (self.timeout or 1)
+        begin = monotonic()
+        view = memoryview(buffer).cast('B')
+        size = self._take_into(view)
+        if size < len(view):
+            size += self._read_port_into(view[size:], timeout)
+        self._count_read(size, size == len(view), begin)
+        if size != 0:
+            self.log("Read", view[:size])
+        return size
+
+    def _send_buffers(self, buffers):
+        self.serial.write(b''.join(buffers))
+
+    def _read_port(self, size, timeout):
+        '''Read up to `size` bytes from the port until `timeout` expires, or
+        until the line goes idle in idle mode.'''
+        deadline = monotonic() + timeout
+        data = bytearray()
+        while len(data) < size:
+            chunk = self.serial.read(size - len(data))
+            data += chunk
+            if not chunk and data and self.idle_chars is not None:
+                break
+            if monotonic() >= deadline:
+                break
+        return bytes(data)
+
+    def _read_port_into(self, view, timeout):
+        '''Read into `view` like :meth:`_read_port`, and return the number
+        of bytes. On POSIX the bytes go from the port straight into `view`
+        with `os.readv` (`Serial.readinto` reads a bytes object and copies
+        it).'''
+        if not hasattr(os, 'readv') or not hasattr(self.serial, 'fd'):
+            return self._read_port_fallback_into(view, timeout)
+        deadline = monotonic() + timeout
+        size = 0
+        with selectors.DefaultSelector() as selector:
+            selector.register(self.serial.fd, selectors.EVENT_READ)
+            while size < len(view):
+                wait = min(self.port_timeout, deadline - monotonic())
+                count = 0
+                if selector.select(max(wait, 0)):
+                    try:
+                        count = os.readv(self.serial.fd, [view[size:]])
+                    except (BlockingIOError, InterruptedError):
+                        continue
+                    if not count:
+                        # Readable without data: the device is gone
+                        import serial
+                        raise serial.SerialException(
+                            'device reports readiness to read but '
+                            'returned no data')
+                size += count
+                if not count and size and self.idle_chars is not None:
+                    break
+                if monotonic() >= deadline:
+                    break
+        return size
+
+    def _read_port_fallback_into(self, view, timeout):
+        deadline = monotonic() + timeout
+        size = 0
+        while size < len(view):
+            count = self.serial.readinto(view[size:])
+            size += count
+            if not count and size and self.idle_chars is not None:
+                break
+            if monotonic() >= deadline:
+                break
+        return size
+
+    def _recv_chunk(self, size, timeout):
+        data = b''
+        if not self.serial.in_waiting and timeout > 0:
+            data = self._read_port(1, timeout)
+        waiting = self.serial.in_waiting
+        if waiting and len(data) < size:
+            data += self.serial.read(min(waiting, size - len(data)))
+        return data
+
+
+#: Final result codes of an ATD command.
+DIAL_RESULT = re.compile(b"CONNECT[^\r\n]*\r?\n|BUSY|NO CARRIER|ERROR|"
+                         b"NO DIALTONE|NO ANSWER")
+
+
+#: Carrier loss notice of the modem.
+NO_CARRIER = b"NO CARRIER"
+
+
+class DialError(ValueError):
+    '''A GSM data call failed: `code` is the final result code sent by the
+    modem (``BUSY``, ``NO CARRIER``, ``ERROR``...), None if it sent none.'''
+
+    #: Result codes about the called station rather than the modem.
+    STATION_CODES = ('BUSY', 'NO ANSWER', 'NO CARRIER')
+
+    def __init__(self, phone, code=None):
+        super(DialError, self).__init__('no GSM device (call %s : %s)'
+                                        % (phone, code or 'no result code'))
+        self.phone = phone
+        self.code = code
+
+    @property
+    def modem_failure(self):
+        '''True unless the code blames the called station.'''
+        return self.code not in self.STATION_CODES
+
+# modem url -> closed GSMLink whose data call is kept up, see `linger`
+_lingering = {}
+_lingering_lock = threading.Lock()
+
+
+def _take_lingering(modem_url):
+    with _lingering_lock:
+        link = _lingering.pop(modem_url, None)
+    if link is not None:
+        link._watchdog.cancel()
+    return link
+
+
+def hangup_lingering():
+    '''Hang up all the data calls kept up by `GSMLink.linger`. This runs
+    at exit.'''
+    with _lingering_lock:
+        links = list(_lingering.values())
+        _lingering.clear()
+    for link in links:
+        link._watchdog.cancel()
+        link._end_call()
+
+
+atexit.register(hangup_lingering)
+
 
 class GSMLink(Link):
-    '''GSM link class.'''
+    '''GSM link class.
 
-    def __init__(self, phone, link,timeout=1):      #EGC added timeout (the aplication throws an error if the object doesn't have an attribute when call packbus read method)
+    With `linger` (seconds), :meth:`close` keeps the data call up for that
+    long, and the next :meth:`open` of a GSMLink to the same phone on the
+    same modem reuses it instead of dialing again. The modem link of the
+    call then replaces `link`. A watchdog thread hangs up when the delay
+    expires, and a call which reported ``NO CARRIER`` is never reused.'''
+
+    def __init__(self, phone, link,timeout=1, linger=0):      #EGC added timeout (the aplication throws an error if the object doesn't have an attribute when call packbus read method)
         self.link = link
         self.phone = phone
         self.is_open = False
         self.timeout = timeout  #EGC set timeout
+        self.linger = linger
+        self._watchdog = None
 
     def _call(self):
+        '''Dial `phone`, return the final result code of the modem (None
+        if it sent none).'''
         LOGGER.info("GSM : Call %s" % self.phone)
         self.link.write("ATD%s\r\n" % self.phone)
+        self.link.flush()
+        result = None
         for i in range(100):	#EGC Change While to For (While never ends, in case of error program won't stop, infinite loop)
-            response = self.link.read(22)
-            if ("BUSY" in response or "NO CARRIER" in response
-                    or "ERROR" in response):
-                LOGGER.error("GSM : <%s>" % repr(response))
-                return False
-            if "CONNECT" in response:
-                self.log("GSM", "Client is ready (%s)" % response)
-                self.link.read()
-                return True
+            # The received bytes stay buffered until a result code is
+            # complete, it may arrive in several reads
+            deadline = monotonic() + 1
+            result = DIAL_RESULT.search(self.link._rbuffer)
+            while result is None and monotonic() < deadline and \
+                    self.link._fill(deadline):
+                result = DIAL_RESULT.search(self.link._rbuffer)
+            if result is not None:
+                break
             self.log("GSM", "call in progress")
-            time.sleep(1)
-        return False
+        if result is None:
+            return None
+        # Before the buffer moves under the match
+        code = result.group().strip().decode('ascii', 'replace')
+        response = self.link._take(result.end())
+        self.link.log("Read", response)
+        if not code.startswith("CONNECT"):
+            LOGGER.error("GSM : <%s>" % repr(response))
+            return code
+        self.log("GSM", "Client is ready (%s)" % self.decode(response))
+        self.link.read()
+        return code
 
     def _hangup(self):      
         #EGC my modem (Citerion (formerly SIEMENS) gprs mc35i) send two additional weird characters before the OK response, something that looks like ᤙᤙOK and it makes the function never ends
@@ -316,24 +1700,130 @@ class GSMLink(Link):
         resp=self.link.read(6)
         LOGGER.info("GSM : Hang-up")
         
+    def carrier_lost(self):
+        '''Return True if the modem reported ``NO CARRIER`` in the data
+        received so far (pending data is buffered, not consumed).'''
+        while self.link._fill(monotonic()):
+            pass
+        return NO_CARRIER in self.link._rbuffer
+
+    def _end_call(self):
+        '''Hang up (unless the carrier is already lost) and close the
+        modem link.'''
+        try:
+            if self.link.is_alive() and not self.carrier_lost():
+                self._hangup()
+        except Exception as e:
+            LOGGER.error('GSM : hang-up failed (%s)' % e)
+        self.link.close()
+        del self.link._rbuffer[:]
+
+    def _expire(self):
+        with _lingering_lock:
+            if self.link is None or _lingering.get(self.link.url) is not self:
+                return
+            del _lingering[self.link.url]
+        LOGGER.info('GSM : linger delay of %s expired' % self)
+        self._end_call()
+
+    def _resume(self):
+        '''Take over a lingering call to `phone` on the modem, if any.
+        Return True when the call is usable.'''
+        previous = _take_lingering(self.link.url)
+        if previous is None:
+            return False
+        if previous.phone != self.phone or not previous.link.is_alive() \
+                or previous.carrier_lost():
+            previous._end_call()
+            return False
+        # The previous object is left without a modem link, closing or
+        # deleting it never ends the call (the links may be one object)
+        self.link, previous.link = previous.link, None
+        LOGGER.info('GSM : Reuse the call to %s' % self.phone)
+        return True
+
     def open(self):
         '''Open the gsm connection.'''
         if not self.is_open:
+            begin = monotonic()
+            if self._resume():
+                self.is_open = True
+                self._count_open(begin)
+                return
             self.link.open()
-            self.is_open = self._call()
+            code = self._call()
+            self.is_open = code is not None and code.startswith("CONNECT")
+            self._count_open(begin)
             if not self.is_open:
                 self.link.close()   #EGC Close Serial port because sometimes if a error occurrs let the serial port open and busy and it makes impossible  restart a new comunication.
-                raise ValueError('no GSM device')
+                raise DialError(self.phone, code)
             
     def close(self):
         '''Close the gsm connection.'''
-        if self.is_open:
+        self._close(self.linger)
+
+    def __del__(self):
+        '''Hang up when the object is deleted, without lingering.'''
+        self._close(0)
+
+    def _close(self, linger):
+        if self.link is None:
+            # Handed over to another GSMLink, see `_resume`
+            return
+        # No watchdog thread can start once the interpreter shuts down
+        if self.is_open and linger and not sys.is_finalizing() \
+                and self.link.is_alive() and not self.carrier_lost():
+            self.is_open = False
+            self._count_close()
+            self._watchdog = threading.Timer(linger, self._expire)
+            self._watchdog.daemon = True
+            with _lingering_lock:
+                previous = _lingering.pop(self.link.url, None)
+                _lingering[self.link.url] = self
+            if previous is not None and previous is not self:
+                previous._watchdog.cancel()
+                previous._end_call()
+            self._watchdog.start()
+            LOGGER.info('GSM : Keep the call up for %ss' % linger)
+        elif self.is_open:
             self._hangup()
             self.link.close()
             self.is_open = False
-        else:   
-            self.link.close()   #EGC to ensure te correct close of the serial port to avoid futures problems when someone wants to restart a serial com
-            
+            self._count_close()
+        else:
+            with _lingering_lock:
+                lingering = _lingering.get(self.link.url) is self
+            if not lingering:
+                self.link.close()   #EGC to ensure te correct close of the serial port to avoid futures problems when someone wants to restart a serial com
+
+    @property
+    def binary(self):
+        '''The data is converted by the modem link, see `Link.binary`.'''
+        return self.link.binary
+
+    def fileno(self):
+        '''Return the file descriptor of the modem link.'''
+        return self.link.fileno()
+
+    @property
+    def _rbuffer(self):
+        return self.link._rbuffer
+
+    def _recv_chunk(self, size, timeout):
+        return self.link._recv_chunk(size, timeout)
+
+    def _end_of_stream(self):
+        index = self._rbuffer.find(NO_CARRIER)
+        # The result code is sent as "\r\nNO CARRIER\r\n"
+        if index >= 2 and self._rbuffer[index - 2:index] == b'\r\n':
+            index -= 2
+        return index
+
+    def is_alive(self):
+        '''Return True while the call is up on a usable modem link.'''
+        return (self.is_open and self.link.is_alive()
+                and not self.carrier_lost())
+
     @property
     def url(self):
         '''Connection url.'''
@@ -347,6 +1837,21 @@ class GSMLink(Link):
         '''Write all `data` to the gsm connection.'''
         self.link.write(data)
 
+    def flush(self):
+        self.link.flush()
+
     def read(self, size=None, timeout=None):
         '''Read data from the serial connection.'''
         return self.link.read(size, timeout)
+
+    def readinto(self, buffer, timeout=None):
+        return self.link.readinto(buffer, timeout)
+
+    def read_exactly(self, size, timeout=None):
+        return self.link.read_exactly(size, timeout)
+
+    def read_until(self, terminator=b'\n', size=None, timeout=None):
+        return self.link.read_until(terminator, size, timeout)
+
+    def read_frame(self, length_prefix=1, timeout=None, codec=None):
+        return self.link.read_frame(length_prefix, timeout, codec)
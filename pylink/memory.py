@@ -0,0 +1,294 @@
+# -*- coding: utf-8 -*-
+'''
+    pylink.memory
+    -------------
+
+    In-process links, for components of the same program and for tests: the
+    bytes go from one end to the other through a shared buffer, without
+    sockets nor system calls::
+
+        >>> device, client = MemoryLink.pair()
+        >>> client.write(b"PING")
+        >>> device.read(4)
+        b'PING'
+
+    Named links are opened like the other links, here to a simulator
+    listening on ``memory:sim``::
+
+        >>> listener = MemoryListener("sim")
+        >>> link = link_from_url("memory:sim")
+        >>> link.open()
+        >>> device = listener.accept()
+
+    :copyright: Copyright 2012 Salem Harrache and contributors, see AUTHORS.
+    :license: BSD, see LICENSE for details.
+
+'''
+from __future__ import unicode_literals
+import itertools
+import socket
+import threading
+from collections import deque
+
+from .link import Link
+from .logger import LOGGER
+from .compat import format_string, monotonic
+
+# name -> MemoryListener
+_listeners = {}
+_listeners_lock = threading.Lock()
+
+_pair_ids = itertools.count(1)
+
+
+class _Pipe(object):
+    '''One direction of a memory link: the bytes written by one end and not
+    read yet by the other.'''
+    def __init__(self, size):
+        self.size = size
+        self.data = bytearray()
+        self.closed = False
+        self.ready = threading.Condition()
+
+    def put(self, buffers, timeout):
+        '''Append `buffers`, waiting up to `timeout` seconds while the pipe
+        holds `size` bytes or more.'''
+        with self.ready:
+            for data in buffers:
+                if not self.ready.wait_for(lambda: self.closed or
+                                           len(self.data) < self.size,
+                                           timeout):
+                    raise socket.timeout('Memory link full')
+                if self.closed:
+                    raise BrokenPipeError('Memory link closed by the peer')
+                self.data += data
+                self.ready.notify_all()
+
+    def get_into(self, view, timeout):
+        '''Move up to ``len(view)`` bytes to `view`, waiting up to `timeout`
+        seconds for some. Return their count, 0 on timeout or once the pipe
+        is closed and empty.'''
+        with self.ready:
+            if not self.data and timeout > 0:
+                self.ready.wait_for(lambda: self.data or self.closed, timeout)
+            size = min(len(self.data), len(view))
+            if size:
+                view[:size] = self.data[:size]
+                del self.data[:size]
+                self.ready.notify_all()
+            return size
+
+    def get(self, size, timeout):
+        '''Return up to `size` bytes, see :meth:`get_into`.'''
+        data = bytearray(size)
+        with memoryview(data) as view:
+            size = self.get_into(view, timeout)
+        del data[size:]
+        return bytes(data)
+
+    def close(self):
+        with self.ready:
+            self.closed = True
+            self.ready.notify_all()
+
+
+class MemoryLink(Link):
+    '''One end of a thread-safe in-process duplex link, with the File-like
+    API of the other links.
+
+    :meth:`pair` makes two connected ends. Otherwise the link connects on
+    :meth:`open` to the :class:`MemoryListener` of `name`, and can be
+    opened again after a close. Each direction buffers up to `PIPE_SIZE`
+    bytes: past it, writes wait for the reader (up to the link timeout).
+    The link has no file descriptor, it cannot be watched by a
+    :class:`~pylink.selector.LinkSelector`.'''
+
+    #: Bytes a direction holds before the writes wait.
+    PIPE_SIZE = 1 << 20
+
+    # Set on the class too, for `close` on partly built links
+    _inbox = None
+
+    def __init__(self, name, timeout=1, binary=False, buffered=False,
+                 flush_size=None, flush_age=None):
+        self.name = name
+        self.timeout = timeout
+        self.binary = binary
+        self._set_buffering(buffered, flush_size, flush_age)
+        self._rbuffer = bytearray()
+        self._inbox = None
+        self._outbox = None
+        # Pair and accepted ends cannot connect again
+        self._dialing = True
+
+    @classmethod
+    def pair(cls, timeout=1, binary=False):
+        '''Return two connected links.'''
+        name = 'pair-%d' % next(_pair_ids)
+        first = cls(name, timeout, binary)
+        second = cls(name, timeout, binary)
+        first._connect(second)
+        second._dialing = False
+        return first, second
+
+    def _connect(self, peer):
+        self._inbox = _Pipe(self.PIPE_SIZE)
+        self._outbox = _Pipe(peer.PIPE_SIZE)
+        peer._inbox, peer._outbox = self._outbox, self._inbox
+        self._dialing = False
+        LOGGER.info('new %s was initialized' % self)
+
+    @property
+    def url(self):
+        '''Make a connection url from `name`.'''
+        return 'memory:%s' % self.name
+
+    def open(self):
+        '''Connect to the listener of `name`.'''
+        if self._inbox is None:
+            if not self._dialing:
+                raise ConnectionResetError('%s was closed' % self)
+            begin = monotonic()
+            with _listeners_lock:
+                listener = _listeners.get(self.name)
+            if listener is None:
+                raise ConnectionRefusedError('No listener on %s' % self.url)
+            listener._accept(self)
+            self._count_open(begin)
+            LOGGER.info('new %s was initialized' % self)
+
+    def settimeout(self, timeout):
+        self.timeout = timeout
+
+    def close(self):
+        '''Close the link, after sending the buffered writes. The peer reads
+        what was written before, then the end of the link.'''
+        if self._inbox is not None:
+            try:
+                self.flush()
+            finally:
+                self._outbox.close()
+                self._inbox.close()
+                self._inbox = None
+                self._outbox = None
+                self._count_close()
+                LOGGER.info('Connection %s was closed' % self)
+
+    def is_alive(self):
+        '''Return False if the link is closed, or if the peer closed it and
+        everything it wrote was read.'''
+        inbox = self._inbox
+        return inbox is not None and not (inbox.closed and not inbox.data)
+
+    def write(self, data):
+        '''Write all `data` to the peer.'''
+        encoded = format_string(data)
+        if self.buffered:
+            self._buffer_write(encoded)
+        else:
+            self._send_buffers([encoded])
+        self._count_write(len(encoded))
+        self.log("Write", data)
+
+    def _send_buffers(self, buffers):
+        self.open()
+        self._outbox.put(buffers, self.timeout)
+
+    def read(self, size=None, timeout=None):
+        '''Read up to `size` bytes. Like :meth:`TCPLink.read`, the read ends
+        once `size` bytes are received, or when the peer stays quiet for
+        `timeout` (twice as long before the first bytes).'''
+        self.flush()
+        size = size or self.MAX_STRING_SIZE
+        timeout = (timeout or 1) * (self.timeout or 1)
+        begin = monotonic()
+        data = bytearray(size)
+        with memoryview(data) as view:
+            count = self._read_into(view, timeout)
+        del data[count:]
+        self._count_read(count, count == size, begin)
+        data = self.decode(data)
+        if len(data) != 0:
+            self.log("Read", data)
+        return data
+
+    def readinto(self, buffer, timeout=None):
+        '''Read data into `buffer`, a writable bytes-like object, and return
+        the number of bytes received (see :meth:`read`).'''
+        self.flush()
+        timeout = (timeout or 1) * (self.timeout or 1)
+        begin = monotonic()
+        view = memoryview(buffer).cast('B')
+        size = self._read_into(view, timeout)
+        self._count_read(size, size == len(view), begin)
+        if size != 0:
+            self.log("Read", view[:size])
+        return size
+
+    def _read_into(self, view, timeout):
+        self.open()
+        size = self._take_into(view)
+        wait = timeout if size else timeout * self.FIRST_READ_FACTOR
+        while size < len(view):
+            count = self._inbox.get_into(view[size:], wait)
+            if not count:
+                break
+            size += count
+            wait = timeout
+        return size
+
+    def _recv_chunk(self, size, timeout):
+        self.open()
+        return self._inbox.get(size, timeout)
+
+
+class MemoryListener(object):
+    '''Accept the memory links opened on ``memory:name``, until closed.
+    The accepted ends get `timeout` and `binary`.'''
+    def __init__(self, name, timeout=1, binary=False):
+        with _listeners_lock:
+            if name in _listeners:
+                raise ValueError('memory:%s is already listened to' % name)
+            _listeners[name] = self
+        self.name = name
+        self.timeout = timeout
+        self.binary = binary
+        self.closed = False
+        self._pending = deque()
+        self._ready = threading.Condition()
+
+    def _accept(self, link):
+        peer = MemoryLink(self.name, self.timeout, self.binary)
+        with self._ready:
+            if self.closed:
+                raise ConnectionRefusedError('No listener on %s' % link.url)
+            peer._connect(link)
+            self._pending.append(peer)
+            self._ready.notify()
+
+    def accept(self, timeout=None):
+        '''Return the end of the next link opened on the name, or None if
+        none was opened within `timeout` seconds (no limit by default).'''
+        with self._ready:
+            self._ready.wait_for(lambda: self._pending or self.closed,
+                                 timeout)
+            return self._pending.popleft() if self._pending else None
+
+    def close(self):
+        '''Stop listening, and close the links not accepted yet.'''
+        with _listeners_lock:
+            if _listeners.get(self.name) is self:
+                del _listeners[self.name]
+        with self._ready:
+            self.closed = True
+            pending = list(self._pending)
+            self._pending.clear()
+            self._ready.notify_all()
+        for link in pending:
+            link.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
@@ -0,0 +1,165 @@
+# -*- coding: utf-8 -*-
+'''
+    pylink.metrics
+    --------------
+
+    Per-link performance counters. They are off by default, and a disabled
+    link only pays for a flag check per operation::
+
+        >>> from pylink import metrics
+        >>> metrics.enable_metrics()
+        >>> ...
+        >>> metrics.snapshot()['total']['bytes_read']
+
+    :copyright: Copyright 2012 Salem Harrache and contributors, see AUTHORS.
+    :license: BSD, see LICENSE for details.
+
+'''
+from __future__ import unicode_literals
+import bisect
+import threading
+import weakref
+
+#: Are the links counting?
+ENABLED = False
+
+#: Upper bounds (seconds) of the read latency histogram buckets. A last
+#: bucket counts the slower reads.
+LATENCY_BUCKETS = (0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.2, 0.5,
+                   1, 2, 5, 10)
+
+COUNTERS = ('bytes_read', 'bytes_written', 'reads', 'writes',
+            'reads_complete', 'reads_timeout', 'opens', 'closes',
+            'open_time', 'reconnects')
+
+
+class Histogram(object):
+    '''Fixed-bucket histogram.'''
+    __slots__ = ('bounds', 'counts', 'count', 'sum')
+
+    def __init__(self, bounds=LATENCY_BUCKETS):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def merge(self, other):
+        for i, count in enumerate(other.counts):
+            self.counts[i] += count
+        self.count += other.count
+        self.sum += other.sum
+
+    def as_dict(self):
+        buckets = [str(bound) for bound in self.bounds] + ['+Inf']
+        return {'buckets': dict(zip(buckets, self.counts)),
+                'count': self.count, 'sum': self.sum}
+
+
+class LinkMetrics(object):
+    '''Counters of one link.
+
+    - `bytes_read`, `bytes_written`, `reads`, `writes`: traffic.
+    - `reads_complete`: reads which got all the requested data (size or
+      frame), `reads_timeout`: reads ended by their timeout.
+    - `opens`, `closes`, `open_time` (seconds spent in `open()`, including
+      the GSM dial), `reconnects`.
+    - `read_latency`: histogram of the read durations.
+    '''
+    __slots__ = COUNTERS + ('read_latency',)
+
+    def __init__(self):
+        for name in COUNTERS:
+            setattr(self, name, 0)
+        self.read_latency = Histogram()
+
+    def read(self, size, complete, elapsed):
+        self.reads += 1
+        self.bytes_read += size
+        if complete:
+            self.reads_complete += 1
+        else:
+            self.reads_timeout += 1
+        self.read_latency.observe(elapsed)
+
+    def write(self, size):
+        self.writes += 1
+        self.bytes_written += size
+
+    def merge(self, other):
+        for name in COUNTERS:
+            setattr(self, name, getattr(self, name) + getattr(other, name))
+        self.read_latency.merge(other.read_latency)
+
+    def as_dict(self):
+        stats = dict((name, getattr(self, name)) for name in COUNTERS)
+        stats['read_latency'] = self.read_latency.as_dict()
+        return stats
+
+
+_lock = threading.Lock()
+# link -> metrics of the living links
+_links = weakref.WeakKeyDictionary()
+# Metrics of the deleted links, so that the totals never go backwards
+_retired = LinkMetrics()
+_generation = 0
+
+
+def enable_metrics(enabled=True):
+    '''Start (or stop) counting on every link.'''
+    global ENABLED
+    ENABLED = enabled
+
+
+def of(link):
+    '''Return the metrics of `link`, created on first use.'''
+    try:
+        return _links[link]
+    except KeyError:
+        with _lock:
+            metrics = _links.get(link)
+            if metrics is None:
+                metrics = _links[link] = LinkMetrics()
+                weakref.finalize(link, _retire, metrics, _generation)
+        return metrics
+
+
+def _retire(metrics, generation):
+    with _lock:
+        if generation == _generation:
+            _retired.merge(metrics)
+
+
+def get_metrics(link):
+    '''Return the metrics of `link`, or None if it never counted.'''
+    return _links.get(link)
+
+
+def snapshot():
+    '''Return the metrics as plain data: ``{'links': {url: stats},
+    'total': stats}``. Links sharing an url are summed up, and the total
+    includes the links that no longer exist.'''
+    with _lock:
+        items = list(_links.items())
+        total = LinkMetrics()
+        total.merge(_retired)
+    by_url = {}
+    for link, metrics in items:
+        total.merge(metrics)
+        by_url.setdefault(link.url, LinkMetrics()).merge(metrics)
+    return {'links': dict((url, metrics.as_dict())
+                          for url, metrics in by_url.items()),
+            'total': total.as_dict()}
+
+
+def reset():
+    '''Forget all the counters.'''
+    global _retired, _generation
+    with _lock:
+        _links.clear()
+        _retired = LinkMetrics()
+        _generation += 1
@@ -0,0 +1,183 @@
+# -*- coding: utf-8 -*-
+'''
+    pylink.pool
+    -----------
+
+    A pool of opened links, keyed by url, so that request/response clients
+    skip the connection setup and teardown of each exchange::
+
+        >>> pool = LinkPool(max_size=2, max_idle=60)
+        >>> with pool.acquire("tcp:localhost:7") as link:
+        ...     link.write("hello")
+        ...     link.read(5)
+
+    :copyright: Copyright 2012 Salem Harrache and contributors, see AUTHORS.
+    :license: BSD, see LICENSE for details.
+
+'''
+from __future__ import unicode_literals
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from . import link_from_url
+from .logger import LOGGER
+from .compat import monotonic
+
+
+class LinkPool(object):
+    '''Hand out opened links by url and keep them open between uses.
+
+    - `max_size`: maximum number of links (idle or in use) for one url.
+    - `max_links`: maximum number of open links in the pool. When it is
+      reached, the least recently used idle link is closed.
+    - `max_idle`: idle links unused for this many seconds are closed.
+    - `timeout`: how long :meth:`acquire` waits for a free link by default
+      (None waits forever).
+    - `factory`: builds a link from an url, :func:`link_from_url` by default.
+
+    Idle links are checked with `Link.is_alive()` before being handed out,
+    and dead ones are replaced by new links.
+    '''
+    def __init__(self, max_size=1, max_links=64, max_idle=300, timeout=None,
+                 factory=link_from_url):
+        self.max_size = max_size
+        self.max_links = max_links
+        self.max_idle = max_idle
+        self.timeout = timeout
+        self.factory = factory
+        self._cond = threading.Condition()
+        # idle link -> release time, least recently used first
+        self._idle = OrderedDict()
+        # link -> url, for every link of the pool (idle or in use)
+        self._urls = {}
+        # url -> number of links, including the ones being opened
+        self._counts = {}
+        self._closed = False
+
+    def __len__(self):
+        '''Number of open links (idle or in use).'''
+        with self._cond:
+            return sum(self._counts.values())
+
+    @contextmanager
+    def acquire(self, url, timeout=None):
+        '''Context manager giving an opened link for `url`. The link goes
+        back to the pool at the end of the block, or is closed if the block
+        raised an exception (its state is then unknown).'''
+        link = self.get(url, timeout)
+        try:
+            yield link
+        except BaseException:
+            self.discard(link)
+            raise
+        self.release(link)
+
+    def get(self, url, timeout=None):
+        '''Return an opened link for `url`, reusing an idle one when
+        possible. Wait for a free slot at most `timeout` seconds and raise
+        `TimeoutError` after that.'''
+        if timeout is None:
+            timeout = self.timeout
+        deadline = None if timeout is None else monotonic() + timeout
+        to_close = []
+        try:
+            with self._cond:
+                if self._closed:
+                    raise ValueError('LinkPool is closed')
+                while True:
+                    to_close.extend(self._expired())
+                    link = self._pop_idle(url, to_close)
+                    if link is not None:
+                        return link
+                    if self._counts.get(url, 0) < self.max_size:
+                        if (sum(self._counts.values()) >= self.max_links
+                                and self._idle):
+                            to_close.append(self._forget(
+                                next(iter(self._idle))))
+                        if sum(self._counts.values()) < self.max_links:
+                            self._counts[url] = self._counts.get(url, 0) + 1
+                            break
+                    remaining = None
+                    if deadline is not None:
+                        remaining = deadline - monotonic()
+                        if remaining <= 0:
+                            raise TimeoutError('No free link for %s' % url)
+                    self._cond.wait(remaining)
+        finally:
+            self._close(to_close)
+        try:
+            link = self.factory(url)
+            link.open()
+        except BaseException:
+            with self._cond:
+                self._counts[url] -= 1
+                if not self._counts[url]:
+                    del self._counts[url]
+                self._cond.notify_all()
+            raise
+        with self._cond:
+            self._urls[link] = url
+        return link
+
+    def release(self, link):
+        '''Give back a link obtained with :meth:`get`.'''
+        with self._cond:
+            if not self._closed:
+                self._idle[link] = monotonic()
+                self._cond.notify_all()
+                return
+            self._forget(link)
+        self._close([link])
+
+    def discard(self, link):
+        '''Close a link obtained with :meth:`get` instead of reusing it.'''
+        with self._cond:
+            self._forget(link)
+        self._close([link])
+
+    def evict_idle(self):
+        '''Close the links idle for more than `max_idle` seconds. This also
+        happens on each :meth:`get`.'''
+        with self._cond:
+            expired = self._expired()
+        self._close(expired)
+
+    def close(self):
+        '''Close all idle links. Links in use are closed when released.'''
+        with self._cond:
+            self._closed = True
+            idle = [self._forget(link) for link in list(self._idle)]
+        self._close(idle)
+
+    def _pop_idle(self, url, to_close):
+        for link in reversed(list(self._idle)):
+            if self._urls[link] != url:
+                continue
+            del self._idle[link]
+            if link.is_alive():
+                return link
+            LOGGER.info('Pool : drop dead %s' % link)
+            to_close.append(self._forget(link))
+        return None
+
+    def _expired(self):
+        limit = monotonic() - self.max_idle
+        expired = [link for link, used in self._idle.items() if used < limit]
+        return [self._forget(link) for link in expired]
+
+    def _forget(self, link):
+        self._idle.pop(link, None)
+        url = self._urls.pop(link)
+        self._counts[url] -= 1
+        if not self._counts[url]:
+            del self._counts[url]
+        self._cond.notify_all()
+        return link
+
+    def _close(self, links):
+        for link in links:
+            try:
+                link.close()
+            except Exception as e:
+                LOGGER.error('Pool : close %s failed (%s)' % (link, e))
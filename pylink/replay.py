@@ -0,0 +1,241 @@
+# -*- coding: utf-8 -*-
+'''
+    pylink.replay
+    -------------
+
+    Record the traffic of a link to a capture file, and replay it later
+    without the device::
+
+        >>> link = RecordingLink(TCPLink("device", 502), "session.trace")
+        >>> ...  # run the protocol as usual
+        >>> link.close()
+        >>> link = ReplayLink("session.trace")
+        >>> ...  # same exchanges, served from the capture
+
+    Captures use the :mod:`pylink.trace` file format.
+
+    :copyright: Copyright 2012 Salem Harrache and contributors, see AUTHORS.
+    :license: BSD, see LICENSE for details.
+
+'''
+from __future__ import unicode_literals
+import time
+
+from . import trace
+from .link import Link
+from .logger import LOGGER
+from .compat import format_string, monotonic
+
+
+class RecordingLink(Link):
+    '''Wrap any `link` (GSMLink included) and record what it reads and
+    writes to `output`, a :class:`~pylink.trace.TrafficTrace`, a path or a
+    binary file object. The raw bytes are recorded, so that a replay serves
+    any mix of plain and framed reads. A trace opened here is closed with
+    the link.'''
+    def __init__(self, link, output):
+        self.link = link
+        self._owns_trace = not isinstance(output, trace.TrafficTrace)
+        self.trace = (trace.TrafficTrace(output) if self._owns_trace
+                      else output)
+        self._rbuffer = bytearray()
+
+    @property
+    def url(self):
+        return self.link.url
+
+    @property
+    def binary(self):
+        return self.link.binary
+
+    @property
+    def timeout(self):
+        return self.link.timeout
+
+    def settimeout(self, timeout):
+        self.link.settimeout(timeout)
+
+    def open(self):
+        self.link.open()
+
+    def close(self):
+        '''Close the link, and the trace if it was opened here.'''
+        self.link.close()
+        if self.trace is not None and self._owns_trace:
+            self.trace.close()
+            self.trace = None
+
+    def is_alive(self):
+        return self.link.is_alive()
+
+    def fileno(self):
+        return self.link.fileno()
+
+    def flush(self):
+        self.link.flush()
+
+    def _record(self, kind, data):
+        if data and self.trace is not None:
+            self.trace.record(kind, self.url, format_string(data))
+
+    def write(self, data):
+        self.link.write(data)
+        self._record(trace.WRITE, data)
+
+    def read(self, size=None, timeout=None):
+        '''Read like the wrapped link, bytes left over by a framed read
+        first.'''
+        size = size or self.MAX_STRING_SIZE
+        data = self._take(size)
+        if data:
+            return self._framed(data)
+        data = self.link.read(size, timeout)
+        self._record(trace.READ, data)
+        return data
+
+    def readinto(self, buffer, timeout=None):
+        view = memoryview(buffer).cast('B')
+        size = self._take_into(view)
+        if size:
+            return size
+        size = self.link.readinto(view, timeout)
+        self._record(trace.READ, view[:size].tobytes())
+        return size
+
+    def _recv_chunk(self, size, timeout):
+        data = self.link._recv_chunk(size, timeout)
+        self._record(trace.READ, data)
+        return data
+
+
+class ReplayLink(Link):
+    '''Link serving the reads recorded in the capture file `path`, which is
+    memory-mapped. Writes are checked against the recording and raise
+    `ValueError` when they differ (unless `strict` is False).
+
+    - `url`: link to replay when the capture holds several ones, the first
+      recorded link by default.
+    - `realtime`: serve each read at its original time relative to the
+      first record. By default, reads are served as fast as possible.
+
+    A read returns the consecutive recorded reads up to the next recorded
+    write, or nothing once it is reached: a replay never waits for a
+    timeout unless `realtime` is set.'''
+    def __init__(self, path, url=None, realtime=False, strict=True,
+                 timeout=1, binary=False):
+        self.path = path
+        self.recorded_url = url
+        self.realtime = realtime
+        self.strict = strict
+        self.timeout = timeout
+        self.binary = binary
+        self._records = None
+        self._next = None
+        self._rbuffer = bytearray()
+
+    @property
+    def url(self):
+        return 'replay:%s' % self.path
+
+    def open(self):
+        '''Map the capture file and rewind the replay.'''
+        if self._records is None:
+            self._records = self._iter_records()
+            self._next = next(self._records, None)
+            self._start = monotonic()
+            LOGGER.info('new %s was initialized' % self)
+
+    def close(self):
+        if self._records is not None:
+            self._records.close()
+            self._records = None
+            self._next = None
+            del self._rbuffer[:]
+
+    def is_alive(self):
+        return self._records is not None
+
+    def settimeout(self, timeout):
+        self.timeout = timeout
+
+    @property
+    def done(self):
+        '''True once every record was replayed.'''
+        self.open()
+        return self._next is None
+
+    def _iter_records(self):
+        first = None
+        for timestamp, kind, url, data in trace.read_trace(self.path):
+            if self.recorded_url is None:
+                self.recorded_url = url
+            if url != self.recorded_url:
+                continue
+            if first is None:
+                first = timestamp
+            yield timestamp - first, kind, data
+
+    def _pop(self):
+        record = self._next
+        self._next = next(self._records, None)
+        return record
+
+    def write(self, data):
+        '''Check `data` against the next recorded write.'''
+        self.open()
+        encoded = format_string(data)
+        expected = b''
+        # Bytes recorded as read but not consumed before this write
+        while self._next is not None and self._next[1] == trace.READ:
+            self._pop()
+        if self._next is not None:
+            expected = self._pop()[2]
+        if expected != encoded:
+            message = ('Replay : write <%s> instead of the recorded <%s>'
+                       % (self.byte_to_hex(encoded),
+                          self.byte_to_hex(expected)))
+            if self.strict:
+                raise ValueError(message)
+            LOGGER.error(message)
+        self._count_write(len(encoded))
+        self.log("Write", data)
+
+    def read(self, size=None, timeout=None):
+        '''Return up to `size` recorded bytes.'''
+        size = size or self.MAX_STRING_SIZE
+        begin = monotonic()
+        data = bytearray(self._take(size))
+        while len(data) < size:
+            chunk = self._recv_chunk(size - len(data), self.timeout or 0)
+            if not chunk:
+                break
+            data += chunk
+        # Keep the rest of the last record for the next read
+        self._rbuffer += data[size:]
+        del data[size:]
+        self._count_read(len(data), len(data) == size, begin)
+        data = self.decode(data)
+        if len(data) != 0:
+            self.log("Read", data)
+        return data
+
+    def readinto(self, buffer, timeout=None):
+        view = memoryview(buffer).cast('B')
+        data = self.read(len(view), timeout)
+        data = format_string(data)
+        view[:len(data)] = data
+        return len(data)
+
+    def _recv_chunk(self, size, timeout):
+        # Records are served whole, even when longer than `size`
+        self.open()
+        if self._next is None or self._next[1] != trace.READ:
+            return b''
+        if self.realtime:
+            delay = self._next[0] - (monotonic() - self._start)
+            if delay > timeout:
+                time.sleep(max(timeout, 0))
+                return b''
+            if delay > 0:
+                time.sleep(delay)
+        return self._pop()[2]
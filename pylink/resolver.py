@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*-
+'''
+    pylink.resolver
+    ---------------
+
+    Host name resolution for the socket links: a `getaddrinfo` cache shared
+    by all links (IPv4 and IPv6), and a "happy eyeballs" connect trying the
+    resolved addresses in parallel, staggered by a short delay (RFC 8305).
+
+    :copyright: Copyright 2012 Salem Harrache and contributors, see AUTHORS.
+    :license: BSD, see LICENSE for details.
+
+'''
+from __future__ import unicode_literals
+import errno
+import os
+import selectors
+import socket
+import threading
+from collections import OrderedDict
+
+from .compat import monotonic
+
+# connect_ex results of a connection in progress (10035 is WSAEWOULDBLOCK)
+_IN_PROGRESS = (0, errno.EINPROGRESS, errno.EWOULDBLOCK, errno.EAGAIN, 10035)
+
+
+class Resolver(object):
+    '''Cache of `socket.getaddrinfo` results. Addresses are kept `ttl`
+    seconds, and failures (unknown hosts) `negative_ttl` seconds. At most
+    `max_size` entries are kept, the least recently used ones are dropped
+    first.'''
+    def __init__(self, ttl=300, negative_ttl=10, max_size=1024):
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_size = max_size
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    def resolve(self, host, port, socktype=socket.SOCK_STREAM):
+        '''Return the `getaddrinfo` results of (`host`, `port`), from the
+        cache when possible. Raise `socket.gaierror` for unknown hosts.'''
+        key = (host, port, socktype)
+        with self._lock:
+            entry = self._cache.pop(key, None)
+            if entry is not None and entry[0] > monotonic():
+                self._cache[key] = entry
+                if isinstance(entry[1], Exception):
+                    raise entry[1]
+                return entry[1]
+        try:
+            addresses = socket.getaddrinfo(host, port, 0, socktype)
+        except socket.gaierror as e:
+            self._store(key, self.negative_ttl, e)
+            raise
+        self._store(key, self.ttl, addresses)
+        return addresses
+
+    def _store(self, key, ttl, result):
+        with self._lock:
+            self._cache[key] = (monotonic() + ttl, result)
+            while len(self._cache) > self.max_size:
+                self._cache.popitem(last=False)
+
+    def forget(self, host, port, socktype=socket.SOCK_STREAM):
+        '''Drop the cached addresses of (`host`, `port`), e.g. after they
+        all refused the connection.'''
+        with self._lock:
+            self._cache.pop((host, port, socktype), None)
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+
+
+#: Resolver shared by the links.
+RESOLVER = Resolver()
+
+
+def _interleave(addresses):
+    '''Alternate the address families, starting with the preferred (first)
+    one.'''
+    families = OrderedDict()
+    for address in addresses:
+        families.setdefault(address[0], []).append(address)
+    ordered = []
+    groups = list(families.values())
+    while groups:
+        for group in groups:
+            ordered.append(group.pop(0))
+        groups = [group for group in groups if group]
+    return ordered
+
+
+def connect(addresses, timeout=None, delay=0.25, prepare=None):
+    '''Return a socket connected to the first reachable address of
+    `addresses` (`getaddrinfo` results). A new attempt starts every `delay`
+    seconds while the previous ones are pending, alternating IPv6 and IPv4,
+    and the first established connection wins. `prepare(sock)` is called
+    on each socket before connecting. The socket is returned in
+    non-blocking mode. Raise the last error if every attempt fails, or
+    `socket.timeout` after `timeout` seconds.'''
+    addresses = _interleave(addresses)
+    deadline = None if timeout is None else monotonic() + timeout
+    selector = selectors.DefaultSelector()
+    pending = []
+    error = None
+    next_attempt = monotonic()
+    try:
+        while addresses or pending:
+            now = monotonic()
+            if addresses and (not pending or now >= next_attempt):
+                family, socktype, proto, _, sockaddr = addresses.pop(0)
+                sock = socket.socket(family, socktype, proto)
+                try:
+                    if prepare is not None:
+                        prepare(sock)
+                    sock.setblocking(0)
+                    result = sock.connect_ex(sockaddr)
+                    if result not in _IN_PROGRESS:
+                        raise socket.error(result, os.strerror(result))
+                except socket.error as e:
+                    sock.close()
+                    error = e
+                    continue
+                selector.register(sock, selectors.EVENT_WRITE)
+                pending.append(sock)
+                next_attempt = now + delay
+                continue
+            wait = next_attempt - now if addresses else None
+            if deadline is not None:
+                if deadline <= now:
+                    raise socket.timeout('timed out')
+                wait = deadline - now if wait is None else min(
+                    wait, deadline - now)
+            for key, _ in selector.select(wait):
+                sock = key.fileobj
+                selector.unregister(sock)
+                pending.remove(sock)
+                result = sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+                if result == 0:
+                    return sock
+                sock.close()
+                error = socket.error(result, os.strerror(result))
+        raise error or socket.error('No address to connect to')
+    finally:
+        for sock in pending:
+            sock.close()
+        selector.close()
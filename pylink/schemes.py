@@ -0,0 +1,251 @@
+# -*- coding: utf-8 -*-
+'''
+    pylink.schemes
+    --------------
+
+    Url schemes of :func:`pylink.link_from_url`. A scheme maps to a link
+    class, given as a class or as a ``"module:Class"`` string imported the
+    first time the scheme is used, so that pyserial or asyncio are only
+    loaded when needed::
+
+        >>> register_scheme("modbus", "mypackage.links:ModbusLink")
+
+    Packages can also declare schemes as ``pylink.schemes`` entry points::
+
+        entry_points={
+            "pylink.schemes": ["modbus = mypackage.links:ModbusLink"],
+        }
+
+    Besides :data:`URL_PARAMETERS`, a scheme takes the query parameters
+    given to `register_scheme` (``parameters={"unit": int}``) or listed in
+    the ``URL_PARAMETERS`` dict of its link class.
+
+    :copyright: Copyright 2012 Salem Harrache and contributors, see AUTHORS.
+    :license: BSD, see LICENSE for details.
+
+'''
+from __future__ import unicode_literals
+import importlib
+import inspect
+import threading
+from functools import lru_cache
+from urllib.parse import parse_qsl
+
+BAD_URL = 'Bad url link sepecified'
+
+ENTRY_POINT_GROUP = 'pylink.schemes'
+
+
+def _flag(value):
+    return value.lower() in ('1', 'true', 'yes', 'on')
+
+
+#: Link parameters accepted as url query parameters by every scheme, with
+#: their type.
+URL_PARAMETERS = {
+    'timeout': float, 'binary': _flag, 'idle_chars': float,
+    'buffered': _flag, 'flush_size': int, 'flush_age': float,
+    'nodelay': _flag, 'keepalive': _flag, 'keepidle': int, 'sndbuf': int,
+    'rcvbuf': int, 'cork': _flag,
+}
+
+
+def split_address(address, options, build):
+    '''Default address parser: the ``:`` separated parts of the address are
+    the positional arguments of the link class.'''
+    return address.split(':'), options
+
+
+def _parse_host(address, options, build):
+    '''``host:port``, IPv6 addresses being written in brackets:
+    ``[::1]:port``.'''
+    if address.startswith('['):
+        host, _, port = address[1:].partition(']:')
+        if not host or ']' in host:
+            raise ValueError(BAD_URL)
+        return (host, int(port)), options
+    args = address.split(':')
+    if len(args) != 2:
+        raise ValueError(BAD_URL)
+    return (args[0], int(args[1])), options
+
+
+def _parse_whole(address, options, build):
+    '''The whole address (a path or a name) is the only argument.'''
+    return (address,), options
+
+
+def _parse_serial(address, options, build):
+    args = address.split(':')
+    if len(args) > 3 or not args[0]:
+        raise ValueError(BAD_URL)
+    port = args[0]
+    if len(args) == 1:
+        return (port,), options
+    baudrate = int(args[1])
+    if len(args) == 2:
+        return (port, baudrate), options
+    if len(args[2]) != 3:
+        raise ValueError(BAD_URL)
+    bytesize = int(args[2][0])
+    parity = args[2][1]
+    stopbits = int(args[2][2])
+    return (port, baudrate, bytesize, parity, stopbits), options
+
+
+def _parse_gsm(address, options, build):
+    '''``gsm:phone:<modem url>``, the query parameters go to the modem
+    link.'''
+    phone, _, modem_url = address.partition(':')
+    return (phone, build(modem_url, options)), {}
+
+
+@lru_cache(maxsize=64)
+def _signature(link_class):
+    return inspect.signature(link_class)
+
+
+class Scheme(object):
+    '''An url scheme: `link_class` and `async_class` are classes or
+    ``"module:Class"`` strings, `parse(address, options, build)` returns
+    the positional and keyword arguments of the class (`build(url,
+    options)` makes the nested links of wrapper schemes). `parameters`
+    maps the query parameters of the scheme, besides
+    :data:`URL_PARAMETERS`, to their type.'''
+    def __init__(self, name, link_class, async_class=None,
+                 parse=split_address, parameters=None):
+        self.name = name
+        self.classes = [link_class, async_class]
+        self.parse = parse
+        self.parameters = dict(parameters or {})
+        self._lock = threading.Lock()
+
+    def link_class(self, asynchronous=False):
+        '''Return the link class, imported on first use.'''
+        link_class = self.classes[asynchronous]
+        if link_class is None:
+            raise ValueError('No %s link for the scheme %s' %
+                             ('asyncio' if asynchronous else 'blocking',
+                              self.name))
+        if not isinstance(link_class, type):
+            module, _, name = link_class.partition(':')
+            link_class = getattr(importlib.import_module(module), name)
+            with self._lock:
+                self.classes[asynchronous] = link_class
+        return link_class
+
+    def convert(self, link_class, query):
+        '''Return the keyword arguments of the (name, value) pairs of
+        `query`, for `link_class`. Raise `ValueError` on a parameter the
+        scheme does not take.'''
+        options = {}
+        for name, value in query:
+            convert = (self.parameters.get(name) or
+                       getattr(link_class, 'URL_PARAMETERS', {}).get(name) or
+                       URL_PARAMETERS.get(name))
+            if convert is None:
+                raise ValueError('Unknown url parameter %s' % name)
+            options[name] = convert(value)
+        return options
+
+    def check_arguments(self, link_class, args, kwargs):
+        '''Raise `ValueError` if `link_class` does not take `args` and
+        `kwargs`.'''
+        try:
+            _signature(link_class).bind(*args, **kwargs)
+        except TypeError as e:
+            raise ValueError('%s (%s link: %s)' % (BAD_URL, self.name, e))
+
+
+_schemes = {}
+
+
+def register_scheme(name, link_class, async_class=None, parse=split_address,
+                    parameters=None):
+    '''Make `link_from_url` (and `alink_from_url` with `async_class`)
+    build `link_class` links for the urls ``name:...``. See
+    :class:`Scheme`.'''
+    _schemes[name.lower()] = Scheme(name.lower(), link_class, async_class,
+                                    parse, parameters)
+
+
+def unregister_scheme(name):
+    '''Forget the scheme `name`, if registered.'''
+    _schemes.pop(name.lower(), None)
+
+
+register_scheme('tcp', 'pylink.link:TCPLink', 'pylink.aio:AsyncTCPLink',
+                _parse_host)
+register_scheme('udp', 'pylink.link:UDPLink', 'pylink.aio:AsyncUDPLink',
+                _parse_host)
+register_scheme('serial', 'pylink.link:SerialLink',
+                'pylink.aio:AsyncSerialLink', _parse_serial)
+register_scheme('gsm', 'pylink.link:GSMLink', 'pylink.aio:AsyncGSMLink',
+                _parse_gsm)
+register_scheme('replay', 'pylink.replay:ReplayLink',
+                parse=_parse_whole)
+register_scheme('unix', 'pylink.link:UnixSocketLink', parse=_parse_whole,
+                parameters={'type': str})
+register_scheme('memory', 'pylink.memory:MemoryLink', parse=_parse_whole)
+
+
+def _entry_point(name):
+    '''Return the ``module:Class`` of the entry point declaring the scheme
+    `name`, without importing it.'''
+    try:
+        from importlib.metadata import entry_points
+    except ImportError:
+        return None
+    found = entry_points()
+    if hasattr(found, 'select'):
+        found = found.select(group=ENTRY_POINT_GROUP)
+    else:
+        found = found.get(ENTRY_POINT_GROUP, ())
+    for entry_point in found:
+        if entry_point.name.lower() == name:
+            return entry_point.value
+    return None
+
+
+def get_scheme(name):
+    '''Return the :class:`Scheme` called `name`, looking for an entry point
+    if it is not registered yet. Raise `ValueError` if it is unknown.'''
+    name = name.lower()
+    scheme = _schemes.get(name)
+    if scheme is None and name:
+        link_class = _entry_point(name)
+        if link_class is not None:
+            register_scheme(name, link_class)
+            scheme = _schemes[name]
+    if scheme is None:
+        raise ValueError(BAD_URL)
+    return scheme
+
+
+@lru_cache(maxsize=256)
+def parse_url(url):
+    '''Split `url` in (`scheme`, `address`, `query`), the query parameters
+    being a tuple of (name, value) strings, see :meth:`Scheme.convert`.
+    The results are cached.'''
+    address, _, query = url.partition('?')
+    scheme, _, address = address.partition(':')
+    if not address:
+        raise ValueError(BAD_URL)
+    query = parse_qsl(query, keep_blank_values=True)
+    return scheme.lower(), address, tuple(query)
+
+
+def build_link(url, options=None, asynchronous=False):
+    '''Make the link of `url`, with the `options` given in addition to its
+    query parameters.'''
+    scheme_name, address, query = parse_url(url)
+    scheme = get_scheme(scheme_name)
+    link_class = scheme.link_class(asynchronous)
+    kwargs = scheme.convert(link_class, query)
+    kwargs.update(options or {})
+
+    def build(nested_url, nested_options):
+        return build_link(nested_url, nested_options, asynchronous)
+    args, kwargs = scheme.parse(address, kwargs, build)
+    scheme.check_arguments(link_class, args, kwargs)
+    return link_class(*args, **kwargs)
@@ -0,0 +1,175 @@
+# -*- coding: utf-8 -*-
+'''
+    pylink.selector
+    ---------------
+
+    Watch many links for incoming data from a single thread.
+
+    :copyright: Copyright 2012 Salem Harrache and contributors, see AUTHORS.
+    :license: BSD, see LICENSE for details.
+
+'''
+from __future__ import unicode_literals
+import selectors
+import socket
+import threading
+
+from .logger import LOGGER
+
+
+class LinkSelector(object):
+    '''Multiplex the links (`TCPLink`, `UDPLink`, `SerialLink` on POSIX,
+    `GSMLink`...) with the best selector of the platform (epoll, kqueue...).
+
+    A link registered with a `callback` is read by the selector itself:
+    ``callback(link, data)`` is called with the available data, converted
+    like :meth:`Link.read` does, and with empty data once the link is closed
+    by the peer (it is then unregistered). A link which keeps waking the
+    selector up without data, like the port of an unplugged serial
+    adapter, is taken as closed after `MAX_EMPTY_WAKEUPS` times in a row.
+    Links registered without callback are returned by :meth:`select` when
+    they are readable.
+
+    Links can be registered and unregistered from any thread, including
+    while another thread waits in :meth:`select` or :meth:`run`.
+    '''
+    #: Wake-ups in a row without data after which a link is closed.
+    MAX_EMPTY_WAKEUPS = 10
+
+    def __init__(self):
+        self._selector = selectors.DefaultSelector()
+        self._lock = threading.Lock()
+        self._links = {}
+        self._changes = []
+        # link -> file descriptor in the selector, owned by select()
+        self._filenos = {}
+        # link -> wake-ups in a row without data, owned by select()
+        self._empty_wakeups = {}
+        self._running = False
+        self._wakeup_r, self._wakeup_w = socket.socketpair()
+        self._wakeup_r.setblocking(0)
+        self._wakeup_w.setblocking(0)
+        self._selector.register(self._wakeup_r, selectors.EVENT_READ)
+
+    @property
+    def links(self):
+        '''The registered links.'''
+        with self._lock:
+            return list(self._links)
+
+    def register(self, link, callback=None):
+        '''Open `link` and watch it for incoming data.'''
+        link.open()
+        with self._lock:
+            self._links[link] = callback
+            self._changes.append((link, link.fileno()))
+        self._wakeup()
+
+    def unregister(self, link):
+        '''Stop watching `link` (it is not closed).'''
+        with self._lock:
+            if self._links.pop(link, False) is not False:
+                self._changes.append((link, None))
+        self._wakeup()
+
+    def _wakeup(self):
+        try:
+            self._wakeup_w.send(b'\0')
+        except (BlockingIOError, InterruptedError):
+            pass
+
+    def _apply_changes(self):
+        with self._lock:
+            changes, self._changes = self._changes, []
+        for link, fileno in changes:
+            self._empty_wakeups.pop(link, None)
+            if link in self._filenos:
+                try:
+                    self._selector.unregister(self._filenos.pop(link))
+                except (KeyError, ValueError):
+                    # Already closed
+                    pass
+            if fileno is not None:
+                self._selector.register(fileno, selectors.EVENT_READ, link)
+                self._filenos[link] = fileno
+
+    def select(self, timeout=None):
+        '''Wait at most `timeout` seconds (None waits forever) for incoming
+        data, serve the callbacks and return the list of readable links that
+        have no callback.'''
+        self._apply_changes()
+        # Data left in a receive buffer is ready right away
+        with self._lock:
+            ready = set(link for link in self._links
+                        if link._rbuffer)
+        events = self._selector.select(0 if ready else timeout)
+        for key, mask in events:
+            if key.fileobj is self._wakeup_r:
+                try:
+                    self._wakeup_r.recv(4096)
+                except (BlockingIOError, InterruptedError):
+                    pass
+            else:
+                ready.add(key.data)
+        readable = []
+        for link in ready:
+            with self._lock:
+                if link not in self._links:
+                    continue
+                callback = self._links[link]
+            if callback is None:
+                readable.append(link)
+            else:
+                self._serve(link, callback)
+        return readable
+
+    def _serve(self, link, callback):
+        try:
+            data = (link._take(len(link._rbuffer)) +
+                    link._recv_chunk(link.MAX_STRING_SIZE, 0))
+            closed = not data and not link.is_alive()
+        except EnvironmentError as e:
+            LOGGER.error('%s : %s' % (link, e))
+            data, closed = b'', True
+        if data or closed:
+            self._empty_wakeups.pop(link, None)
+        else:
+            count = self._empty_wakeups.get(link, 0) + 1
+            self._empty_wakeups[link] = count
+            if count >= self.MAX_EMPTY_WAKEUPS:
+                LOGGER.error('%s : readable without data, taken as closed'
+                             % link)
+                closed = True
+        if closed:
+            self.unregister(link)
+        if data or closed:
+            callback(link, link._framed(data))
+
+    def run(self, timeout=None):
+        '''Serve the callbacks until :meth:`stop` is called, or for `timeout`
+        seconds. All links should have a callback: nothing would read the
+        ones without, they are unregistered once readable.'''
+        self._running = True
+        timer = threading.Timer(timeout or 0, self.stop)
+        timer.daemon = True
+        if timeout is not None:
+            timer.start()
+        try:
+            while self._running:
+                for link in self.select():
+                    LOGGER.error('%s : readable without callback, '
+                                 'unregistered' % link)
+                    self.unregister(link)
+        finally:
+            timer.cancel()
+
+    def stop(self):
+        '''Make :meth:`run` return, from any thread.'''
+        self._running = False
+        self._wakeup()
+
+    def close(self):
+        '''Release the selector. The links are not closed.'''
+        self._selector.close()
+        self._wakeup_r.close()
+        self._wakeup_w.close()
@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+'''
+    pylink.test_aio
+    ---------------
+
+    The pylink asyncio test suite.
+
+    :copyright: Copyright 2012 Salem Harrache and contributors, see AUTHORS.
+    :license: BSD.
+
+'''
+from __future__ import unicode_literals
+import asyncio
+import os
+import socket
+import time
+
+from .aio import AsyncTCPLink, AsyncUDPLink, AsyncSerialLink, AsyncGSMLink
+from . import alink_from_url
+from .testing import EchoServer, SerialPair
+
+
+def run(coroutine):
+    return asyncio.new_event_loop().run_until_complete(coroutine)
+
+
+class TestAsyncLinks(object):
+    '''Suite test for asyncio links'''
+
+    def setup_class(self):
+        self.tcp_server = EchoServer(socket.SOCK_STREAM)
+        self.udp_server = EchoServer(socket.SOCK_DGRAM)
+
+    def teardown_class(self):
+        self.tcp_server.close()
+        self.udp_server.close()
+
+    def test_tcp_echo(self):
+        async def exchange():
+            async with AsyncTCPLink('localhost', self.tcp_server.port) as link:
+                await link.write("hello")
+                assert await link.read(5) == "hello"
+                await link.write(b'\x06\xFF\r\nrest')
+                assert await link.read_until(b'\r\n') == b'\x06\xFF\r\n'
+                assert await link.read_exactly(4) == 'rest'
+        run(exchange())
+
+    def test_udp_echo(self):
+        async def exchange():
+            async with AsyncUDPLink('127.0.0.1', self.udp_server.port,
+                                    timeout=0.1) as link:
+                await link.write(b'\x00\x02ok')
+                assert await link.read_frame(2) == 'ok'
+                begin = time.time()
+                assert await link.read() == ''
+                assert 0.15 < time.time() - begin < 0.35
+        run(exchange())
+
+    def test_many_links_on_one_loop(self):
+        async def exchange(i):
+            link = alink_from_url('tcp:localhost:%d' % self.tcp_server.port)
+            async with link:
+                await link.write('link %d' % i)
+                return await link.read(len('link %d' % i))
+
+        async def main():
+            return await asyncio.gather(*[exchange(i) for i in range(20)])
+        assert run(main()) == ['link %d' % i for i in range(20)]
+
+    def test_serial(self):
+        device = SerialPair()
+
+        async def exchange():
+            async with AsyncSerialLink(device.port, 38400) as link:
+                device.write(b'ab\ncd')
+                assert await link.read_until(b'\n') == 'ab\n'
+                assert await link.read(2) == 'cd'
+                await link.write('out')
+                assert device.read(3) == b'out'
+        run(exchange())
+        device.close()
+
+    def test_gsm_split_result_code(self):
+        device = SerialPair()
+
+        async def call():
+            link = AsyncGSMLink('0102030405',
+                                AsyncSerialLink(device.port, 38400,
+                                                timeout=0.1))
+            task = asyncio.ensure_future(link.open())
+            await asyncio.sleep(0.1)
+            device.write(b'\r\nCONN')
+            await asyncio.sleep(1.2)
+            device.write(b'ECT 9600\r\n')
+            await asyncio.wait_for(task, 2)
+            device.write(b'ping')
+            assert await link.read(4) == 'ping'
+            await link.link.close()
+        run(call())
+        device.close()
+
+    def test_serial_device_gone(self):
+        device = SerialPair()
+
+        async def exchange():
+            async with AsyncSerialLink(device.port, 38400,
+                                       timeout=0.1) as link:
+                device.write(b'ab')
+                assert await link.read(2) == 'ab'
+                # Reads fail with EIO once the pty master is closed
+                os.close(device.master)
+                begin = time.process_time()
+                await asyncio.sleep(0.3)
+                assert time.process_time() - begin < 0.1
+                assert link._eof
+                begin = time.time()
+                assert await link.read(10) == ''
+                assert time.time() - begin < 0.1
+        run(exchange())
+        os.close(device.slave)
+
+    def test_url(self):
+        link = alink_from_url('gsm:0102030405:serial:/dev/ttyUSB0:9600:8N1')
+        assert link.phone == '0102030405'
+        assert link.link.url == 'serial:/dev/ttyUSB0:9600:8N1'
@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+'''
+    pylink.test_bank
+    ----------------
+
+    The pylink GSM modem bank test suite.
+
+    :copyright: Copyright 2012 Salem Harrache and contributors, see AUTHORS.
+    :license: BSD.
+
+'''
+from __future__ import unicode_literals
+import pytest
+import time
+
+from .bank import GSMModemBank
+from .link import DialError
+from .testing import FakeModem
+
+
+def echo(link, data):
+    link.write(data)
+    return link.read(len(data))
+
+
+def serial_url(modem):
+    return 'serial:%s:9600:8N1' % modem.port
+
+
+class TestGSMModemBank(object):
+    '''Suite test for GSMModemBank'''
+
+    def test_parallel_calls(self):
+        modems = [FakeModem(dial_time=0.3) for _ in range(2)]
+        bank = GSMModemBank([serial_url(modem) for modem in modems],
+                            timeout=0.1)
+        begin = time.time()
+        futures = [bank.submit('010203040%d' % i, echo, 'ping %d' % i)
+                   for i in range(4)]
+        assert [future.result() for future in futures] == \
+            ['ping %d' % i for i in range(4)]
+        assert time.time() - begin < 1.5
+        assert [len(modem.calls) for modem in modems] == [2, 2]
+        assert [state['calls'] for state in bank.status()] == [2, 2]
+        bank.close()
+        for modem in modems:
+            modem.close()
+
+    def test_bad_modem_out_of_rotation(self):
+        good, bad = FakeModem(), FakeModem(result='ERROR')
+        bank = GSMModemBank([serial_url(bad), serial_url(good)],
+                            max_failures=1, cooldown=60, timeout=0.1)
+        results = list(bank.map(lambda link: 'ok', ['01', '02', '03']))
+        assert results == ['ok', 'ok', 'ok']
+        assert len(bad.calls) == 1
+        assert len(good.calls) == 3
+        bad_state, good_state = bank.status()
+        assert not bad_state['available']
+        assert good_state['available'] and good_state['calls'] == 3
+        bank.close()
+        good.close()
+        bad.close()
+
+    def test_errors(self):
+        modem = FakeModem(results={'01': 'BUSY', '04': 'ERROR'})
+        with GSMModemBank([serial_url(modem)], retries=0,
+                          timeout=0.1) as bank:
+            with pytest.raises(DialError) as error:
+                bank.submit('01', echo, 'x').result()
+            assert error.value.code == 'BUSY'
+            # The called station is busy, the modem is fine
+            assert bank.status()[0]['failures'] == 0
+            with pytest.raises(DialError) as error:
+                bank.submit('04', echo, 'x').result()
+            assert error.value.code == 'ERROR'
+            assert bank.status()[0]['failures'] == 1
+
+            def fail(link):
+                raise KeyError('station')
+            with pytest.raises(KeyError):
+                bank.submit('02', fail).result()
+            assert bank.status()[0]['failures'] == 0
+        with pytest.raises(ValueError):
+            bank.submit('03', echo, 'x')
+        modem.close()
@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+'''
+    pylink.test_bridge
+    ------------------
+
+    The pylink serial to TCP bridge test suite.
+
+    :copyright: Copyright 2012 Salem Harrache and contributors, see AUTHORS.
+    :license: BSD.
+
+'''
+from __future__ import unicode_literals
+import socket
+import threading
+import time
+
+from .bridge import Bridge, parse_listen_url
+from .link import TCPLink, SerialLink
+from .testing import EchoServer, SerialPair
+
+
+class SerialResponder(SerialPair):
+    '''Serial device answering ``<request>!`` to each request, after
+    `delay` seconds.'''
+    def __init__(self, delay=0.1):
+        super(SerialResponder, self).__init__()
+        self.delay = delay
+        self.requests = []
+        self.thread = threading.Thread(target=self.serve)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def serve(self):
+        while True:
+            try:
+                request = self.read()
+            except OSError:
+                return
+            self.requests.append(request)
+            time.sleep(self.delay)
+            self.write(request + b'!')
+
+
+class TestBridge(object):
+    '''Suite test for the serial to TCP bridge'''
+
+    def start(self, device, **kwargs):
+        bridge = Bridge(SerialLink(device.port, 38400, timeout=0.1),
+                        'tcp-listen:127.0.0.1:0', **kwargs)
+        thread = threading.Thread(target=bridge.run)
+        thread.daemon = True
+        thread.start()
+        return bridge, thread
+
+    def stop(self, bridge, thread):
+        bridge.stop()
+        thread.join()
+        bridge.close()
+
+    def test_parse_listen_url(self):
+        assert parse_listen_url('tcp-listen:0.0.0.0:4001') == \
+            ('0.0.0.0', 4001)
+        assert parse_listen_url('tcp-listen:[::]:4001') == ('::', 4001)
+
+    def test_transactions(self):
+        device = SerialResponder()
+        bridge, thread = self.start(device)
+        clients = [TCPLink('127.0.0.1', bridge.address[1], timeout=1)
+                   for _ in range(3)]
+        for i, client in enumerate(clients):
+            client.write('request %d' % i)
+        # Served one at a time, each reply to its client
+        for i, client in enumerate(clients):
+            assert client.read_exactly(10) == 'request %d!' % i
+        assert device.requests == [('request %d' % i).encode('ascii')
+                                   for i in range(3)]
+        clients[0].close()
+        clients[1].write('again')
+        assert clients[1].read_exactly(6) == 'again!'
+        for client in clients[1:]:
+            client.close()
+        self.stop(bridge, thread)
+        device.close()
+
+    def test_broadcast(self):
+        device = SerialPair()
+        bridge, thread = self.start(device, broadcast=True)
+        clients = [TCPLink('127.0.0.1', bridge.address[1], timeout=1)
+                   for _ in range(2)]
+        for client in clients:
+            client.open()
+        time.sleep(0.1)
+        device.write(b'alarm')
+        for client in clients:
+            assert client.read_exactly(5) == 'alarm'
+            client.close()
+        self.stop(bridge, thread)
+        device.close()
+
+    def test_device_end_of_connection(self):
+        server = EchoServer(socket.SOCK_STREAM)
+        device = TCPLink('127.0.0.1', server.port, timeout=0.1)
+        bridge = Bridge(device, 'tcp-listen:127.0.0.1:0', reply_timeout=0.2)
+        thread = threading.Thread(target=bridge.run)
+        thread.daemon = True
+        thread.start()
+        client = TCPLink('127.0.0.1', bridge.address[1], timeout=1)
+        # The echo server hangs up on QUIT
+        client.write('QUIT')
+        time.sleep(0.05)
+        begin = time.process_time()
+        time.sleep(0.5)
+        # No busy loop on the closed device
+        assert time.process_time() - begin < 0.2
+        client.write('hello')
+        assert client.read_exactly(5) == 'hello'
+        client.close()
+        self.stop(bridge, thread)
+        server.close()
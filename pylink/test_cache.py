@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+'''
+    pylink.test_cache
+    -----------------
+
+    The pylink response cache test suite.
+
+    :copyright: Copyright 2012 Salem Harrache and contributors, see AUTHORS.
+    :license: BSD.
+
+'''
+from __future__ import unicode_literals
+import pytest
+import re
+import socket
+import threading
+import time
+
+from .cache import CachingLink, ResponseCache
+from .link import Link, TCPLink
+from .testing import EchoServer
+
+
+class SlowDevice(Link):
+    '''Link answering each transaction after `delay` seconds.'''
+    url = 'slow:device'
+    timeout = 1
+
+    def __init__(self, delay=0.1):
+        self.delay = delay
+        self.requests = []
+        self.opened = False
+
+    def open(self):
+        self.opened = True
+
+    def transact(self, request, expect=None, timeout=None, deadline=None):
+        self.requests.append(request)
+        time.sleep(self.delay)
+        if request == b'FAIL':
+            raise ValueError('device error')
+        if request == b'QUIET':
+            return ''
+        return 'reply to %s' % request.decode('ascii')
+
+
+class TestCachingLink(object):
+    '''Suite test for CachingLink'''
+
+    def test_hits_and_ttls(self):
+        device = SlowDevice(delay=0)
+        cache = ResponseCache(ttl=0.2, ttls=[(b'SET', 0),
+                                             (re.compile(b'^ID'), 60)])
+        link = CachingLink(device, cache)
+        assert link.transact('STATUS') == 'reply to STATUS'
+        assert link.transact(b'STATUS') == 'reply to STATUS'
+        assert link.transact('ID?') == 'reply to ID?'
+        link.transact('SET 1')
+        link.transact('SET 1')
+        assert device.requests == [b'STATUS', b'ID?', b'SET 1', b'SET 1']
+        time.sleep(0.25)
+        link.transact('STATUS')
+        link.transact('ID?')
+        assert device.requests[-1] == b'STATUS'
+        assert cache.stats() == {'hits': 2, 'misses': 3, 'coalesced': 0,
+                                 'evictions': 0, 'entries': 2}
+
+    def test_lru_and_uncached_replies(self):
+        device = SlowDevice(delay=0)
+        link = CachingLink(device, ResponseCache(max_entries=2))
+        for request in ('A', 'B', 'A', 'C', 'B'):
+            link.transact(request)
+        assert device.requests == [b'A', b'B', b'C', b'B']
+        assert link.cache.stats()['evictions'] == 2
+        link.transact('QUIET')
+        link.transact('QUIET')
+        with pytest.raises(ValueError):
+            link.transact('FAIL')
+        assert device.requests[-3:] == [b'QUIET', b'QUIET', b'FAIL']
+
+    def test_coalescing(self):
+        device = SlowDevice(delay=0.2)
+        link = CachingLink(device)
+        results = []
+
+        def ask(request):
+            try:
+                results.append(link.transact(request))
+            except ValueError as e:
+                results.append(e)
+        for request in ['STATUS'] * 5 + ['FAIL'] * 3:
+            thread = threading.Thread(target=ask, args=(request,))
+            thread.start()
+        begin = time.time()
+        while len(results) < 8 and time.time() - begin < 2:
+            time.sleep(0.01)
+        assert device.requests.count(b'STATUS') == 1
+        assert device.requests.count(b'FAIL') == 1
+        assert results.count('reply to STATUS') == 5
+        assert len([r for r in results if isinstance(r, ValueError)]) == 3
+        assert link.cache.stats()['coalesced'] == 6
+
+    def test_no_open_on_hit(self):
+        server = EchoServer(socket.SOCK_STREAM)
+        cache = ResponseCache()
+        link = CachingLink(TCPLink('127.0.0.1', server.port), cache)
+        assert link.transact('ping', 4) == 'ping'
+        link.close()
+        other = TCPLink('127.0.0.1', server.port)
+        assert CachingLink(other, cache).transact('ping', 4) == 'ping'
+        assert other._socket is None
+        server.close()
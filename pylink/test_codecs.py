@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+'''
+    pylink.test_codecs
+    ------------------
+
+    The pylink frame codecs test suite.
+
+    :copyright: Copyright 2012 Salem Harrache and contributors, see AUTHORS.
+    :license: BSD.
+
+'''
+from __future__ import unicode_literals
+import pytest
+import socket
+
+from .codecs import (Delimited, LengthPrefixed, STXETX, SLIP, COBS, Checked,
+                     cobs_encode, cobs_decode, crc16_ccitt, crc16_modbus,
+                     crc32)
+from .link import TCPLink
+from .testing import EchoServer
+
+
+def decode_all(codec, data, chunk=3):
+    '''Feed `data` to `codec` by chunks, return the decoded payloads.'''
+    buffer = bytearray()
+    payloads = []
+    for start in range(0, len(data), chunk):
+        buffer += data[start:start + chunk]
+        while True:
+            result = codec.decode(buffer)
+            if result is None:
+                break
+            del buffer[:result[1]]
+            payloads.append(result[0])
+    return payloads
+
+
+PAYLOADS = [b'hello', b'', b'\x00\xc0\xdb\xdc\xdd\x02\x03\n', b'x' * 600]
+
+
+class TestCodecs(object):
+    '''Suite test for the frame codecs'''
+
+    @pytest.mark.parametrize('codec', [
+        Delimited(b'\r\n'), LengthPrefixed(2), LengthPrefixed('<I'), SLIP(),
+        COBS()])
+    def test_round_trip(self, codec):
+        payloads = PAYLOADS
+        if isinstance(codec, Delimited):
+            payloads = [payload.replace(b'\n', b'') for payload in payloads]
+        data = b''.join(codec.encode(payload) for payload in payloads)
+        decoded = [payload for payload in decode_all(codec, data)
+                   if payload is not None]
+        if isinstance(codec, SLIP):
+            payloads = [payload for payload in payloads if payload]
+        assert decoded == payloads
+
+    def test_slip(self):
+        codec = SLIP()
+        assert codec.encode(b'a\xc0b\xdbc') == b'\xc0a\xdb\xdcb\xdb\xddc\xc0'
+        assert decode_all(codec, b'\xc0\xc0a\xdb\xdd\xdc\xc0') == \
+            [b'a\xdb\xdc']
+        # A frame split after its leading END is not an invalid frame
+        assert codec.decode(bytearray(b'\xc0ab')) is None
+        assert codec.decode(bytearray(b'\xc0ab\xc0')) == (b'ab', 4)
+
+    def test_cobs(self):
+        vectors = [(b'\x00', b'\x01\x01'), (b'\x00\x00', b'\x01\x01\x01'),
+                   (b'\x11\x22\x00\x33', b'\x03\x11\x22\x02\x33'),
+                   (b'\x11\x00\x00\x00', b'\x02\x11\x01\x01\x01'),
+                   (bytes(bytearray(range(1, 255))),
+                    b'\xff' + bytes(bytearray(range(1, 255)))),
+                   (bytes(bytearray(range(0, 255))),
+                    b'\x01\xff' + bytes(bytearray(range(1, 255))))]
+        for data, encoded in vectors:
+            assert cobs_encode(data) == encoded
+            assert cobs_decode(encoded) == data
+        with pytest.raises(ValueError):
+            cobs_decode(b'\x05ab')
+        assert decode_all(COBS(), b'\x05ab\x00\x02a\x00') == [None, b'a']
+
+    def test_stx_etx(self):
+        data = b'noise\x02one\x03\x03\x02two\x03'
+        assert decode_all(STXETX(), data, len(data)) == \
+            [None, b'one', None, b'two']
+
+    def test_length_limit(self):
+        with pytest.raises(ValueError):
+            LengthPrefixed(2, max_size=10).decode(bytearray(b'\x01\x00'))
+        assert Delimited(max_size=4).decode(bytearray(b'abcdef')) == \
+            (None, 6)
+
+    def test_checksums(self):
+        assert crc16_ccitt(b'123456789') == 0x29b1
+        assert crc16_modbus(b'123456789') == 0x4b37
+        assert crc16_modbus(b'\x01\x03\x00\x00\x00\x01') == 0x0a84
+        assert crc32(b'123456789') == 0xcbf43926
+        codec = Checked(LengthPrefixed(1), 'crc16-modbus')
+        frame = codec.encode(b'\x01\x03\x00\x00\x00\x01')
+        assert frame == b'\x08\x01\x03\x00\x00\x00\x01\x84\x0a'
+        corrupted = frame[:-1] + b'\x00'
+        assert decode_all(codec, frame + corrupted + frame) == \
+            [b'\x01\x03\x00\x00\x00\x01', None, b'\x01\x03\x00\x00\x00\x01']
+        assert codec.errors == 1
+
+
+class TestLinkFrames(object):
+    '''Suite test for the codecs on links'''
+    def setup_class(self):
+        self.server = EchoServer(socket.SOCK_STREAM)
+
+    def teardown_class(self):
+        self.server.close()
+
+    def test_read_frame(self, caplog):
+        link = TCPLink('localhost', self.server.port, timeout=0.2)
+        codec = Checked(SLIP(), 'crc32')
+        bad = bytearray(codec.encode(b'bad'))
+        bad[1] ^= 0xff
+        frame = codec.encode(b'\xc0')
+        link.write(bytes(bad) + codec.encode(b'good') + frame[:3])
+        assert link.read_frame(codec=codec) == 'good'
+        assert link.read_frame(codec=codec) is None
+        link.write(frame[3:])
+        assert link.read_frame(codec=codec) == b'\xc0'
+        # Only the bad frame, not the split one
+        assert len([record for record in caplog.records
+                    if 'invalid frame' in record.getMessage()]) == 1
+        link.close()
+
+    def test_iter_frames(self):
+        link = TCPLink('localhost', self.server.port, timeout=0.1)
+        codec = COBS()
+        link.write(b''.join(codec.encode(data) for data in
+                            (b'one', b'\x00two', b'three')))
+        assert list(link.iter_frames(codec=codec, idle_timeout=0.2)) == \
+            ['one', '\x00two', 'three']
+        link.close()
@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+'''
+    pylink.test_fanout
+    ------------------
+
+    The pylink fan-out poller test suite.
+
+    :copyright: Copyright 2012 Salem Harrache and contributors, see AUTHORS.
+    :license: BSD.
+
+'''
+from __future__ import unicode_literals
+import socket
+import time
+
+from .fanout import poll
+from .pool import LinkPool
+from .testing import EchoServer
+
+
+class TestPoll(object):
+    '''Suite test for the fan-out poller'''
+
+    def setup_class(self):
+        self.echo = EchoServer(socket.SOCK_STREAM)
+        # Accepts connections (in its backlog) but never replies
+        self.silent = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.silent.bind(('127.0.0.1', 0))
+        self.silent.listen(64)
+        self.silent_url = 'tcp:127.0.0.1:%d' % self.silent.getsockname()[1]
+
+    def teardown_class(self):
+        self.echo.close()
+        self.silent.close()
+
+    def test_parallel(self):
+        urls = [self.silent_url] * 5 + [self.echo.url] * 2
+        begin = time.time()
+        results = list(poll(urls, 'ping\n', reader=b'\n', timeout=0.3))
+        assert time.time() - begin < 1
+        assert [url for url, _, _ in results[:2]] == [self.echo.url] * 2
+        assert [reply for _, reply, _ in results] == \
+            ['ping\n'] * 2 + [''] * 5
+        assert all(0 <= latency < 1 for _, _, latency in results)
+
+    def test_errors(self):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.bind(('127.0.0.1', 0))
+        closed_url = 'tcp:127.0.0.1:%d' % sock.getsockname()[1]
+        sock.close()
+        results = dict((url, reply) for url, reply, _ in
+                       poll([closed_url, self.echo.url], 'ok', reader=2))
+        assert isinstance(results[closed_url], socket.error)
+        assert results[self.echo.url] == 'ok'
+
+    def test_deadline(self):
+        urls = [self.silent_url] * 3
+        begin = time.time()
+        results = list(poll(urls, 'ping', concurrency=1, timeout=0.2,
+                            deadline=0.3))
+        assert time.time() - begin < 0.6
+        assert len(results) == 3
+        assert isinstance(results[-1][1], TimeoutError)
+
+    def test_pool(self):
+        pool = LinkPool(max_size=2)
+        for _ in range(2):
+            results = list(poll([self.echo.url] * 2, 'hi', reader=2,
+                                pool=pool))
+            assert [reply for _, reply, _ in results] == ['hi', 'hi']
+        assert len(pool) == 2
+        pool.close()
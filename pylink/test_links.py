@@ -10,11 +10,25 @@
 
 '''
 from __future__ import unicode_literals
+import gc
+import io
 import pytest
+import re
+import socket
+import subprocess
+import sys
+import threading
+import time
 from contextlib import contextmanager
 
-from .link import TCPLink, UDPLink
-from . import link_from_url
+from .link import (TCPLink, UDPLink, SerialLink, GSMLink,
+                   ReconnectingTCPLink, UnixSocketLink, DialError)
+from . import link_from_url, active_trace, metrics
+from .trace import TrafficTrace, read_trace, iter_records, MAGIC
+from .replay import ReplayLink
+from .memory import MemoryLink
+from .schemes import register_scheme, unregister_scheme, parse_url
+from .testing import EchoServer, SerialPair, FakeModem
 from .logger import active_logger
 
 
@@ -37,12 +51,16 @@ class TestUDPLink(object):
 
     def setup_class(self):
         '''Setup common data.'''
-        # echo service
-        self.echo_link = UDPLink('localhost', 7)
+        self.server = EchoServer(socket.SOCK_DGRAM)
+        self.echo_link = UDPLink('localhost', self.server.port)
+
+    def teardown_class(self):
+        self.echo_link.close()
+        self.server.close()
 
     def test_address(self):
         '''Test resolution address.'''
-        assert self.echo_link.address == ("127.0.0.1", 7)
+        assert self.echo_link.address == ("127.0.0.1", self.server.port)
 
     def test_hello_echo(self):
         '''Test echo.'''
@@ -53,17 +71,808 @@ class TestUDPLink(object):
         self.echo_link.write(b'\x06\xFF')
         assert self.echo_link.read(2) == b'\x06\xFF'
 
+    def test_datagrams(self):
+        server = EchoServer(socket.SOCK_DGRAM)
+        link = UDPLink('127.0.0.1', server.port, timeout=0.1, binary=True)
+        assert link.write_many([b'one', b'two', b'three']) == 3
+        assert link.read_datagram() == b'one'
+        time.sleep(0.05)
+        assert link.read_datagrams() == [b'two', b'three']
+        link.write_many([b'%d' % i for i in range(10)])
+        time.sleep(0.05)
+        assert link.read_datagrams(4) == [b'0', b'1', b'2', b'3']
+        assert len(link.read_datagrams()) == 6
+        begin = time.time()
+        assert link.read_datagram() is None
+        assert 0.05 < time.time() - begin < 0.3
+        link.close()
+        # Without timeout, the read waits for the datagram
+        link = UDPLink('127.0.0.1', server.port, timeout=None, binary=True,
+                       buffered=True)
+        assert link.write_many(iter([b'four', b'five'])) == 2
+        assert link.read_datagram() == b'four'
+        assert link.read_datagram() == b'five'
+        link.close()
+        server.close()
+
+    def test_other_peers_are_filtered(self):
+        server = EchoServer(socket.SOCK_DGRAM)
+        link = UDPLink('127.0.0.1', server.port, timeout=0.1)
+        link.open()
+        intruder = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        intruder.sendto(b'spam', link.socket.getsockname())
+        link.write('ham')
+        assert link.read_datagrams() == ['ham']
+        intruder.close()
+        link.close()
+        server.close()
+
+
+class TestUnixSocketLink(object):
+    '''Suite test for Unix socket Link'''
+
+    def test_stream(self, tmpdir):
+        server = EchoServer(host=str(tmpdir.join('echo.sock')))
+        link = link_from_url(server.url + '?timeout=0.2')
+        assert isinstance(link, UnixSocketLink)
+        assert link.url == server.url
+        link.write("hello")
+        assert link.read(5) == "hello"
+        assert link.transact(b'line\n', b'\n') == 'line\n'
+        assert link.is_alive()
+        link.write(b'QUIT')
+        time.sleep(0.05)
+        assert not link.is_alive()
+        link.close()
+        server.close()
+
+    def test_datagrams(self, tmpdir):
+        server = EchoServer(socket.SOCK_DGRAM, str(tmpdir.join('echo.sock')))
+        link = link_from_url(server.url + '&binary=1&timeout=0.1')
+        assert link.url == server.url
+        assert link.write_many([b'one', b'two']) == 2
+        assert link.read_datagram() == b'one'
+        assert link.read_datagram() == b'two'
+        assert link.read_datagram() is None
+        link.close()
+        server.close()
+
+    def test_errors(self, tmpdir):
+        link = UnixSocketLink(str(tmpdir.join('missing.sock')))
+        with pytest.raises(socket.error):
+            link.open()
+        with assert_raises(ValueError, 'Unknown socket type'):
+            UnixSocketLink('/tmp/x', type='seqpacket')
+        with assert_raises(ValueError, 'needs TCP'):
+            UnixSocketLink('/tmp/x', nodelay=True)
+
+
+class TestReconnectingTCPLink(object):
+    '''Suite test for ReconnectingTCPLink'''
+    def test_reconnect_after_end_of_connection(self):
+        server = EchoServer(socket.SOCK_STREAM)
+        link = ReconnectingTCPLink('127.0.0.1', server.port, timeout=0.1,
+                                   backoff=0.01)
+        metrics.reset()
+        metrics.enable_metrics()
+        try:
+            link.write('hello')
+            assert link.read(5) == 'hello'
+            link.write('QUIT')
+            assert not link.read()
+            assert link.state == link.DISCONNECTED
+            time.sleep(0.05)
+            link.write('again')
+            assert link.read(5) == 'again'
+            assert link.state == link.CONNECTED
+            assert metrics.get_metrics(link).reconnects == 1
+        finally:
+            metrics.enable_metrics(False)
+        link.close()
+        assert link.state == link.CLOSED
+        server.close()
+
+    def test_queue_while_disconnected(self):
+        probe = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        probe.bind(('127.0.0.1', 0))
+        port = probe.getsockname()[1]
+        probe.close()
+        link = ReconnectingTCPLink('127.0.0.1', port, timeout=0.1,
+                                   backoff=0.05, max_pending=8)
+        link.write('ab')
+        link.write('cdefgh')
+        link.write('ij')
+        assert link.state == link.DISCONNECTED
+        assert link.dropped == 2
+        begin = time.time()
+        assert not link.read()
+        assert time.time() - begin < 0.05
+        server = EchoServer(socket.SOCK_STREAM, port=port)
+        time.sleep(0.3)
+        assert link.read(8) == 'cdefghij'
+        assert link.is_alive()
+        link.close()
+        server.close()
+
+    def test_unknown_host(self):
+        # Formatting the link does not resolve its host
+        link = ReconnectingTCPLink('nonexistent.invalid', 7, backoff=0.05)
+        assert repr(link) == '<ReconnectingTCPLink tcp:nonexistent.invalid:7>'
+        link.open()
+        assert link.state == link.DISCONNECTED
+        link.close()
+
+
+class TestSelectorRead(object):
+    '''Suite test for the selector-driven TCP/UDP read path'''
+    def setup_class(self):
+        self.tcp_server = EchoServer(socket.SOCK_STREAM)
+        self.udp_server = EchoServer(socket.SOCK_DGRAM)
+
+    def teardown_class(self):
+        self.tcp_server.close()
+        self.udp_server.close()
+
+    def test_returns_when_size_is_reached(self):
+        link = TCPLink('localhost', self.tcp_server.port, timeout=5)
+        link.write(b'ping')
+        begin = time.time()
+        assert link.read(4) == 'ping'
+        assert time.time() - begin < 1
+        link.close()
+
+    def test_quiet_timeout_after_data(self):
+        link = UDPLink('localhost', self.udp_server.port, timeout=0.2)
+        link.write(b'ping')
+        begin = time.time()
+        assert link.read(100) == 'ping'
+        assert 0.15 < time.time() - begin < 0.35
+        link.close()
+
+    def test_first_timeout(self):
+        link = TCPLink('localhost', self.tcp_server.port, timeout=0.1)
+        begin = time.time()
+        assert not link.read()
+        assert 0.15 < time.time() - begin < 0.35
+        begin = time.time()
+        assert not link.read(first_timeout=0.05)
+        assert time.time() - begin < 0.1
+        link.close()
+
+    def test_peer_close_ends_read(self):
+        link = TCPLink('localhost', self.tcp_server.port, timeout=5)
+        link.write(b'QUIT')
+        begin = time.time()
+        assert not link.read()
+        assert time.time() - begin < 1
+        link.close()
+
+
+class TestFramedRead(object):
+    '''Suite test for read_exactly, read_until and read_frame'''
+    def setup_class(self):
+        self.server = EchoServer(socket.SOCK_STREAM)
+        self.link = TCPLink('localhost', self.server.port, timeout=1)
+
+    def teardown_class(self):
+        self.link.close()
+        self.server.close()
+
+    def test_read_until(self):
+        self.link.write(b'abc\r\ndef\r\nghi')
+        begin = time.time()
+        assert self.link.read_until(b'\r\n') == 'abc\r\n'
+        assert self.link.read_until('\r\n') == 'def\r\n'
+        assert time.time() - begin < 0.5
+        assert self.link.read_until(b'\r\n', timeout=0.1) == 'ghi'
+
+    def test_read_until_regex_and_size(self):
+        self.link.write(b'xxOK\r\nyyyy')
+        assert self.link.read_until(re.compile(b'OK|ERROR')) == 'xxOK'
+        assert self.link.read_until(b'\r\n') == '\r\n'
+        assert self.link.read_until(b'\r\n', size=2) == 'yy'
+        assert self.link.read() == 'yy'
+
+    def test_read_exactly(self):
+        self.link.write(b'\x06\xFF\x01\x02')
+        assert self.link.read_exactly(2) == b'\x06\xFF'
+        assert self.link.read_exactly(2) == '\x01\x02'
+        assert self.link.read_exactly(2, timeout=0.1) == ''
+
+    def test_read_frame(self):
+        self.link.write(b'\x00\x03abc\x02\x00z')
+        assert self.link.read_frame(2) == 'abc'
+        assert self.link.read_frame('<H', timeout=0.1) is None
+        self.link.write(b'z')
+        assert self.link.read_frame('<H') == 'zz'
+
+    def test_serial_read_until(self):
+        device = SerialPair()
+        link = SerialLink(device.port, 38400)
+        link.open()
+        device.write(b'ab\ncd\n')
+        assert link.read_until(b'\n') == 'ab\n'
+        assert link.read_exactly(3) == 'cd\n'
+        link.close()
+        device.close()
+
+
+class TestStreaming(object):
+    '''Suite test for iter_chunks, iter_lines and iter_frames'''
+    def setup_class(self):
+        self.server = EchoServer(socket.SOCK_STREAM)
+
+    def teardown_class(self):
+        self.server.close()
+
+    def test_iter_lines(self):
+        link = TCPLink('localhost', self.server.port, timeout=0.1)
+        link.write(b'one\ntw')
+        threading.Timer(0.2, link.write, [b'o\nthree']).start()
+        begin = time.time()
+        assert list(link.iter_lines(idle_timeout=0.3)) == ['one\n', 'two\n']
+        assert 0.4 < time.time() - begin < 0.8
+        link.write(b'\n' + b'x' * 10)
+        assert list(link.iter_lines(max_size=4, idle_timeout=0.2)) == \
+            ['three\n', 'xxxx', 'xxxx']
+        link.close()
+
+    def test_iter_chunks_and_frames(self):
+        link = TCPLink('localhost', self.server.port, timeout=0.1)
+        link.write(b'abcdef')
+        time.sleep(0.05)
+        assert list(link.iter_chunks(4, idle_timeout=0.2)) == ['abcd', 'ef']
+        link.write(b'\x02ok\x01x\x03y')
+        assert list(link.iter_frames(idle_timeout=0.2)) == ['ok', 'x']
+        link.write(b'yz\xff')
+        frames = link.iter_frames(max_size=16, idle_timeout=0.2)
+        assert next(frames) == 'yyz'
+        with assert_raises(ValueError, 'Frame of 255 bytes'):
+            next(frames)
+        link.close()
+
+    def test_reconnect(self):
+        link = TCPLink('localhost', self.server.port, timeout=0.1)
+        lines = link.iter_lines(idle_timeout=1)
+        link.write(b'one\npartial')
+        assert next(lines) == 'one\n'
+        link.write(b'QUIT')
+        threading.Timer(0.3, link.write, [b'two\n']).start()
+        assert next(lines) == 'two\n'
+        link.close()
+        link = TCPLink('localhost', self.server.port, timeout=0.1)
+        link.write(b'QUIT')
+        assert list(link.iter_lines(reconnect=False)) == []
+        link.close()
+
+    def test_gsm_redial(self):
+        modem = FakeModem()
+        link = GSMLink('0102030405', SerialLink(modem.port, timeout=0.1))
+        link.open()
+        lines = link.iter_lines(b'\r\n', idle_timeout=2)
+        modem.write(b'one\r\n')
+        assert next(lines) == 'one\r\n'
+        modem.write(b'two\r\n')
+        modem.drop_carrier()
+        assert next(lines) == 'two\r\n'
+        threading.Timer(0.5, modem.write, [b'three\r\n']).start()
+        assert next(lines) == 'three\r\n'
+        assert modem.calls == ['0102030405'] * 2
+        link.close()
+        modem.close()
+
+
+class TestTransact(object):
+    '''Suite test for transactions on a shared link'''
+    def setup_class(self):
+        self.server = EchoServer(socket.SOCK_STREAM)
+
+    def teardown_class(self):
+        self.server.close()
+
+    def test_threads_share_a_link(self):
+        link = TCPLink('localhost', self.server.port, timeout=0.5)
+        errors = []
+
+        def worker(i):
+            for j in range(20):
+                request = 'thread %d request %d\n' % (i, j)
+                reply = link.transact(request, expect=b'\n')
+                if reply != request:
+                    errors.append((request, reply))
+        threads = [threading.Thread(target=worker, args=(i,))
+                   for i in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert errors == []
+        link.close()
+
+    def test_expect(self):
+        link = TCPLink('localhost', self.server.port, timeout=0.1)
+        assert link.transact('hello') == 'hello'
+        assert link.transact(b'\x00\x02ab', expect=3) == '\x00\x02a'
+        # The unread byte of the previous reply is dropped
+        assert link.transact(b'\x02ok', expect=lambda link, timeout:
+                             link.read_frame(1, timeout)) == 'ok'
+        link.close()
+
+    def test_fifo_and_deadline(self):
+        link = TCPLink('localhost', self.server.port, timeout=0.1)
+        order = []
+
+        def worker(i):
+            order.append(link.transact('%d\n' % i, expect=b'\n'))
+        with link.locked():
+            threads = []
+            for i in range(5):
+                threads.append(threading.Thread(target=worker, args=(i,)))
+                threads[-1].start()
+                time.sleep(0.02)
+            with pytest.raises(TimeoutError):
+                link.transact('late', deadline=0.05)
+        for thread in threads:
+            thread.join()
+        assert order == ['%d\n' % i for i in range(5)]
+        link.close()
+
+    def test_deadline_is_held(self):
+        # The peer never replies
+        link, _ = MemoryLink.pair(timeout=1)
+        begin = time.time()
+        assert link.transact(b'x', timeout=0.1) == ''
+        assert 0.09 < time.time() - begin < 0.15
+        begin = time.time()
+        assert link.transact(b'x', deadline=0.2) == ''
+        assert 0.19 < time.time() - begin < 0.25
+
+        def hold():
+            with link.locked():
+                time.sleep(0.1)
+        thread = threading.Thread(target=hold)
+        thread.start()
+        time.sleep(0.01)
+        begin = time.time()
+        # Handed over about when the deadline passes
+        try:
+            link.transact(b'x', deadline=0.09)
+        except TimeoutError:
+            pass
+        assert time.time() - begin < 0.15
+        thread.join()
+        # No time left for the turnaround
+        link.turnaround = 0.5
+        begin = time.time()
+        with pytest.raises(TimeoutError):
+            link.transact(b'x', deadline=0.2)
+        assert time.time() - begin < 0.05
+        link.close()
+
+    def test_trickling_reply(self):
+        link, peer = MemoryLink.pair(timeout=1)
+
+        def trickle():
+            peer.read(1)
+            for byte in '0123456789':
+                time.sleep(0.05)
+                peer.write(byte)
+        thread = threading.Thread(target=trickle)
+        thread.start()
+        # The reply goes on as long as the peer is never quiet for timeout
+        assert link.transact(b'x', timeout=0.2) == '0123456789'
+        thread.join()
+        thread = threading.Thread(target=trickle)
+        thread.start()
+        # But no further than the deadline
+        reply = link.transact(b'x', timeout=0.2, deadline=0.25)
+        assert reply in ('0123', '01234')
+        thread.join()
+        link.close()
+        peer.close()
+
+    def test_turnaround(self):
+        link = TCPLink('localhost', self.server.port, timeout=0.1)
+        link.turnaround = 0.1
+        link.transact('a', expect=1)
+        begin = time.time()
+        link.transact('b', expect=1)
+        assert time.time() - begin >= 0.09
+        link.close()
+
+
+class TestBufferedWrites(object):
+    '''Suite test for buffered writes and socket options'''
+    def setup_class(self):
+        self.server = EchoServer(socket.SOCK_STREAM)
+
+    def teardown_class(self):
+        self.server.close()
+
+    def test_flush(self):
+        link = TCPLink('localhost', self.server.port, timeout=0.1,
+                       buffered=True)
+        for data in ('a', b'b', 'c'):
+            link.write(data)
+        assert not link.wait_readable(0.1)
+        link.flush()
+        assert link.wait_readable(0.5)
+        assert link.read(3) == 'abc'
+        link.write('def')
+        assert link.read(3) == 'def'
+        link.close()
+
+    def test_auto_flush(self):
+        link = TCPLink('localhost', self.server.port, timeout=0.1,
+                       buffered=True, flush_size=4, flush_age=0.05)
+        link.write('ab')
+        link.write('cd')
+        assert link.wait_readable(0.5)
+        assert link.read_exactly(4) == 'abcd'
+        link.write('e')
+        time.sleep(0.06)
+        link.write('f')
+        assert link.wait_readable(0.5)
+        link.close()
+
+    def test_serial_flush(self):
+        device = SerialPair()
+        link = SerialLink(device.port, 38400, buffered=True)
+        link.open()
+        link.write('ab')
+        link.write(b'cd')
+        link.flush()
+        assert device.read(4) == b'abcd'
+        link.close()
+        device.close()
+
+    def test_socket_options(self):
+        link = TCPLink('localhost', self.server.port, nodelay=True,
+                       keepalive=True, rcvbuf=32768)
+        sock = link.socket
+        assert sock.getsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY)
+        assert sock.getsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE)
+        assert sock.getsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF) >= 32768
+        link.close()
+        with assert_raises(ValueError, 'Unknown socket option'):
+            TCPLink('localhost', self.server.port, nodelay_=True)
+
+    def test_url_parameters(self):
+        link = link_from_url('tcp:localhost:%d?nodelay=1&buffered=true'
+                             '&timeout=0.5' % self.server.port)
+        assert link.buffered and link.timeout == 0.5
+        assert link.options == {'nodelay': True}
+        link = link_from_url('gsm:01:serial:/dev/ttyUSB0:9600:8N1'
+                             '?idle_chars=3.5')
+        assert link.link.idle_chars == 3.5
+        with assert_raises(ValueError, 'Unknown url parameter'):
+            link_from_url('tcp:localhost:7?speed=1')
+        with assert_raises(ValueError, 'Bad url link sepecified'):
+            link_from_url('serial:/dev/ttyUSB0?nodelay=1')
+
+
+class TestBinaryMode(object):
+    '''Suite test for binary mode and readinto'''
+    def setup_class(self):
+        self.tcp_server = EchoServer(socket.SOCK_STREAM)
+        self.udp_server = EchoServer(socket.SOCK_DGRAM)
+
+    def teardown_class(self):
+        self.tcp_server.close()
+        self.udp_server.close()
+
+    def test_binary_read(self):
+        link = TCPLink('localhost', self.tcp_server.port, binary=True)
+        link.write('hello\n')
+        assert link.read(6) == b'hello\n'
+        link.write('hello\n')
+        assert link.read_until(b'\n') == b'hello\n'
+        link.close()
+
+    def test_readinto(self):
+        link = UDPLink('localhost', self.udp_server.port, timeout=0.1)
+        buffer = bytearray(8)
+        view = memoryview(buffer)
+        link.write(b'\x06\xFF')
+        assert link.readinto(view[:2]) == 2
+        link.write(b'abc')
+        assert link.readinto(view[2:]) == 3
+        assert buffer == b'\x06\xFFabc\x00\x00\x00'
+        link.close()
+
+    def test_serial_readinto(self):
+        device = SerialPair()
+        link = SerialLink(device.port, 38400, timeout=0.1, binary=True)
+        link.open()
+        device.write(b'ab\ncd')
+        assert link.read_until(b'\n') == b'ab\n'
+        buffer = bytearray(4)
+        assert link.readinto(buffer) == 2
+        assert buffer[:2] == b'cd'
+
+        # Straight into the buffer, no intermediate bytes
+        def no_read(size=1):
+            raise AssertionError('Serial.read called')
+        link.serial.read = no_read
+        device.write(b'efgh')
+        assert link.readinto(memoryview(buffer)) == 4
+        assert buffer == b'efgh'
+        link.close()
+        device.close()
+
+
+class TestLogging(object):
+    '''Suite test for hex dumps and the traffic trace'''
+    def test_byte_to_hex(self):
+        link = MemoryLink('hex')
+        assert link.byte_to_hex(b'\x06\xff\x00') == '06 FF 00'
+        assert link.byte_to_hex(b'') == ''
+
+    def test_traffic_trace(self, tmpdir):
+        server = EchoServer(socket.SOCK_STREAM)
+        path = str(tmpdir.join('traffic.trace'))
+        active_trace(path)
+        link = TCPLink('localhost', server.port)
+        link.write(b'\x06\xff')
+        link.read(2)
+        active_trace(None)
+        records = list(read_trace(path))
+        assert [(kind, url, data) for _, kind, url, data in records] == [
+            (b'W', link.url, b'\x06\xff'), (b'R', link.url, b'\x06\xff')]
+        assert records[0][0] <= records[1][0]
+        link.close()
+        server.close()
+
+    def test_many_links_trace(self):
+        output = io.BytesIO()
+        traffic = TrafficTrace(output)
+        for i in range(70000):
+            traffic.record(b'W', 'tcp:host:%d' % i, b'x')
+        records = list(iter_records(output.getvalue()))
+        assert len(records) == 70000
+        assert records[-1][2] == 'tcp:host:69999'
+
+
+class TestMetrics(object):
+    '''Suite test for link metrics'''
+    def setup_method(self, method):
+        metrics.reset()
+        metrics.enable_metrics()
+
+    def teardown_method(self, method):
+        metrics.enable_metrics(False)
+
+    def test_counters(self):
+        server = EchoServer(socket.SOCK_STREAM)
+        link = TCPLink('localhost', server.port, timeout=0.05)
+        link.write('hello\n')
+        assert link.read(6) == 'hello\n'
+        assert not link.read(6)
+        link.write('a\n')
+        assert link.read_until('\n') == 'a\n'
+        stats = metrics.get_metrics(link).as_dict()
+        assert stats['bytes_written'] == 8
+        assert stats['bytes_read'] == 8
+        assert (stats['writes'], stats['reads']) == (2, 3)
+        assert (stats['reads_complete'], stats['reads_timeout']) == (2, 1)
+        assert stats['opens'] == 1 and stats['open_time'] > 0
+        assert stats['read_latency']['count'] == 3
+        link.close()
+        assert metrics.snapshot()['links'][link.url]['closes'] == 1
+        del link
+        total = metrics.snapshot()['total']
+        assert total['bytes_read'] == 8 and total['closes'] == 1
+        server.close()
+
+    def test_disabled(self):
+        metrics.enable_metrics(False)
+        server = EchoServer(socket.SOCK_STREAM)
+        link = TCPLink('localhost', server.port)
+        link.write('hello')
+        link.read(5)
+        assert metrics.get_metrics(link) is None
+        link.close()
+        server.close()
+
+
+class TestSerialLink(object):
+    '''Suite test for the serial port settings'''
+    def test_idle_timeout(self):
+        link = SerialLink('/dev/null', 9600, idle_chars=35)
+        assert abs(link.char_time - 10 / 9600.) < 1e-9
+        assert abs(link.idle_timeout - 35 * 10 / 9600.) < 1e-9
+        link = SerialLink('/dev/null', 115200, parity='E', idle_chars=1)
+        assert link.idle_timeout == SerialLink.MIN_IDLE_TIME
+        assert link.port_timeout == SerialLink.MIN_IDLE_TIME
+        link = SerialLink('/dev/null')
+        assert link.idle_timeout is None
+        assert link.port_timeout == SerialLink.POLL_TIME
+
+    def test_read_ends_on_idle_line(self):
+        device = SerialPair()
+        link = SerialLink(device.port, 9600, timeout=1, idle_chars=10)
+        link.open()
+        device.write(b'\x01\x03\x02')
+        begin = time.time()
+        assert link.read(256) == '\x01\x03\x02'
+        assert time.time() - begin < 0.5
+        timer = threading.Timer(0.2, device.write, (b'\x02',))
+        timer.start()
+        device.write(b'\x01')
+        assert link.read(256) == '\x01'
+        assert link.read(256) == '\x02'
+        timer.join()
+        link.close()
+        device.close()
+
+    def test_settings_are_cached(self):
+        device = SerialPair()
+        link = SerialLink(device.port, 38400, timeout=0.1)
+        link.open()
+        changes = []
+        serial_class = type(link.serial)
+        original = serial_class._reconfigure_port
+
+        def reconfigure(port, *args, **kwargs):
+            changes.append(port.timeout)
+            return original(port, *args, **kwargs)
+
+        serial_class._reconfigure_port = reconfigure
+        try:
+            for _ in range(3):
+                device.write(b'ab')
+                assert link.read(2) == 'ab'
+                device.write(b'ab\n')
+                assert link.read_until(b'\n') == 'ab\n'
+        finally:
+            serial_class._reconfigure_port = original
+        link.settimeout(0.2)
+        begin = time.time()
+        assert not link.read(2)
+        assert 0.15 < time.time() - begin < 0.4
+        assert changes == []
+        link.close()
+        device.close()
+
+
+class TestGSMLink(object):
+    '''Suite test for GSM Link with a fake modem'''
+    def test_call(self):
+        modem = FakeModem()
+        link = GSMLink('0102030405', SerialLink(modem.port, timeout=0.1))
+        link.open()
+        assert modem.calls == ['0102030405']
+        link.write('ping')
+        assert link.read(4) == 'ping'
+        link.close()
+        assert not modem.connected
+        modem.close()
+
+    def test_split_result_code(self):
+        modem, line = MemoryLink.pair(timeout=0.1)
+
+        def answer():
+            line.read_until(b'\r\n', timeout=5)
+            line.write(b'\r\nCONN')
+            time.sleep(1.2)
+            line.write(b'ECT 9600\r\n')
+        thread = threading.Thread(target=answer)
+        thread.start()
+        link = GSMLink('0102030405', modem)
+        begin = time.time()
+        link.open()
+        assert time.time() - begin < 2
+        thread.join()
+        line.write(b'ping')
+        assert link.read(4) == 'ping'
+        link.close()
+        line.close()
+
+    def test_busy(self):
+        modem = FakeModem(results={'0102030405': 'BUSY'})
+        link = GSMLink('0102030405', SerialLink(modem.port, timeout=0.1))
+        with pytest.raises(DialError, match='no GSM device') as error:
+            link.open()
+        assert error.value.code == 'BUSY' and not error.value.modem_failure
+        modem.close()
+
+    def test_linger(self):
+        modem = FakeModem()
+        link = GSMLink('0102030405', SerialLink(modem.port, timeout=0.1),
+                       linger=0.5)
+        link.open()
+        link.close()
+        assert modem.connected
+        other = GSMLink('0102030405', SerialLink(modem.port, timeout=0.1),
+                        linger=0.5)
+        other.open()
+        assert other.is_alive()
+        assert modem.calls == ['0102030405']
+        other.write('ping')
+        assert other.read(4) == 'ping'
+        other.close()
+        time.sleep(1)
+        assert not modem.connected
+        assert not other.link.is_alive()
+        modem.close()
+
+    def test_carrier_loss(self):
+        modem = FakeModem()
+        link = GSMLink('0102030405', SerialLink(modem.port, timeout=0.1),
+                       linger=5)
+        link.open()
+        modem.drop_carrier()
+        time.sleep(0.05)
+        assert not link.is_alive()
+        link.close()
+        link.open()
+        assert modem.calls == ['0102030405', '0102030405']
+        link.close()
+        modem.drop_carrier()
+        time.sleep(0.05)
+        link.open()
+        assert len(modem.calls) == 3
+        link.linger = 0
+        link.close()
+        assert not modem.connected
+        modem.close()
+
+    def test_linger_shared_modem_link(self):
+        modem = FakeModem()
+        serial = SerialLink(modem.port, timeout=0.1)
+        link = GSMLink('0102030405', serial, linger=5)
+        link.open()
+        link.close()
+        other = GSMLink('0102030405', serial, linger=5)
+        other.open()
+        # The first object handed the call over, it cannot end it
+        link._watchdog.join()
+        del link
+        gc.collect()
+        assert other.is_alive()
+        other.write('ping')
+        assert other.read(4) == 'ping'
+        other.linger = 0
+        other.close()
+        assert not modem.connected
+        modem.close()
+
+    def test_delete_hangs_up(self):
+        modem = FakeModem()
+        link = GSMLink('0102030405', SerialLink(modem.port, timeout=0.1),
+                       linger=5)
+        link.open()
+        del link
+        gc.collect()
+        assert not modem.connected
+        modem.close()
+
+    def test_open_at_exit(self):
+        '''A lingering GSMLink still open at exit does not hold the
+        interpreter.'''
+        code = ('from pylink.link import GSMLink, SerialLink; '
+                'from pylink.testing import FakeModem; '
+                'modem = FakeModem(); '
+                'link = GSMLink("0102030405", '
+                'SerialLink(modem.port, timeout=0.1), linger=5); '
+                'link.open()')
+        subprocess.check_call([sys.executable, '-c', code], timeout=10)
+
 
 class TestTCPLink(object):
     '''Suite test for TCP Link'''
     def setup_class(self):
         '''Setup common data.'''
-        # echo service
-        self.echo_link = TCPLink('localhost', 7)
+        self.server = EchoServer(socket.SOCK_STREAM)
+        self.echo_link = TCPLink('localhost', self.server.port)
+
+    def teardown_class(self):
+        self.echo_link.close()
+        self.server.close()
 
     def test_address(self):
         '''Test resolution address.'''
-        assert self.echo_link.address == ("127.0.0.1", 7)
+        assert self.echo_link.address == ("127.0.0.1", self.server.port)
 
     def test_hello_echo(self):
         '''Test echo.'''
@@ -75,22 +884,76 @@ class TestTCPLink(object):
         assert self.echo_link.read(2) == b'\x06\xFF'
 
     def test_web_connection(self):
-        '''Test internet connection.'''
-        link = TCPLink('docs.python.org', 80)
-        link.write('GET / HTTP 1.1\n\n')
+        '''Test a request to a local web server.'''
+        server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        server.bind(('127.0.0.1', 0))
+        server.listen(1)
+
+        def answer():
+            conn, _ = server.accept()
+            conn.recv(1024)
+            conn.sendall(b'HTTP/1.1 200 OK\r\nContent-Length: 0\r\n\r\n')
+            conn.close()
+        thread = threading.Thread(target=answer)
+        thread.start()
+        link = TCPLink('localhost', server.getsockname()[1])
+        link.write('GET / HTTP/1.1\r\nHost: localhost\r\n\r\n')
         data = link.read(4)
-        print(link.address)
         assert data == "HTTP"
+        thread.join()
+        link.close()
+        server.close()
 
 
 def test_link_from_url():
     '''Test parssing link from url.'''
-    link = link_from_url("tcp:localhost:7")
+    server = EchoServer(socket.SOCK_STREAM)
+    link = link_from_url("tcp:localhost:%d" % server.port)
     link.write("hello")
     assert link.read(5) == "hello"
+    link.close()
+    server.close()
     with assert_raises(ValueError, 'Bad url link sepecified'):
         assert link_from_url('')
     with assert_raises(ValueError, 'invalid literal for int'):
         assert link_from_url('tcp:localhost:10.3')
     with assert_raises(ValueError, 'Bad url link sepecified'):
         assert link_from_url('unknow:/dev/ttyUSB0')
+
+
+def test_lazy_imports():
+    '''Importing pylink and making links does not load pyserial.'''
+    code = ('import sys, pylink; pylink.link_from_url("tcp:localhost:7"); '
+            'pylink.link_from_url("serial:/dev/ttyUSB0"); '
+            'print("serial" in sys.modules, "asyncio" in sys.modules)')
+    output = subprocess.check_output([sys.executable, '-c', code])
+    assert output.split() == [b'False', b'False']
+
+
+def test_scheme_registry(tmpdir):
+    path = str(tmpdir.join('session.trace'))
+    with open(path, 'wb') as trace_file:
+        trace_file.write(MAGIC)
+    link = link_from_url('replay:%s?timeout=2' % path)
+    assert isinstance(link, ReplayLink) and link.timeout == 2
+    register_scheme('echo', 'pylink.link:TCPLink',
+                    parse=lambda address, options, build:
+                    (('localhost', options.pop('port', 7)), options),
+                    parameters={'port': int})
+    try:
+        hits = parse_url.cache_info().hits
+        for _ in range(2):
+            link = link_from_url('ECHO:local?timeout=0.5')
+            assert link.url == 'tcp:localhost:7' and link.timeout == 0.5
+        assert parse_url.cache_info().hits == hits + 1
+        # The parameters of the scheme, for this scheme only
+        assert link_from_url('echo:local?port=8').url == 'tcp:localhost:8'
+        with assert_raises(ValueError, 'Unknown url parameter'):
+            link_from_url('tcp:localhost:7?port=8')
+    finally:
+        unregister_scheme('echo')
+    with assert_raises(ValueError, 'Bad url link sepecified'):
+        link_from_url('echo:local')
+    # The arguments are checked before the link is built
+    with assert_raises(ValueError, 'serial link'):
+        link_from_url('serial:/dev/ttyUSB0:9600:8N1?cork=1')
@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+'''
+    pylink.test_memory
+    ------------------
+
+    The pylink in-process link test suite.
+
+    :copyright: Copyright 2012 Salem Harrache and contributors, see AUTHORS.
+    :license: BSD.
+
+'''
+from __future__ import unicode_literals
+import pytest
+import socket
+import threading
+import time
+
+from . import link_from_url
+from .memory import MemoryLink, MemoryListener
+from .testing import MemoryEcho
+
+
+class TestMemoryLink(object):
+    '''Suite test for the in-process links'''
+
+    def test_pair(self):
+        first, second = MemoryLink.pair(timeout=0.1)
+        first.write("hello")
+        assert second.read(5) == "hello"
+        second.write(b'\x06\xFF')
+        assert first.read(2) == b'\x06\xFF'
+        buffer = bytearray(4)
+        second.write(b'abcdef')
+        assert first.readinto(buffer) == 4 and buffer == b'abcd'
+        assert first.read_until(b'f') == 'ef'
+        begin = time.time()
+        assert first.read(1) == ''
+        assert 0.15 < time.time() - begin < 0.5
+
+    def test_close(self):
+        first, second = MemoryLink.pair(timeout=0.1)
+        first.write(b'last words')
+        first.close()
+        assert second.is_alive()
+        assert second.read() == 'last words'
+        assert not second.is_alive()
+        with pytest.raises(socket.error):
+            second.write(b'nobody')
+        second.close()
+        with pytest.raises(socket.error):
+            second.open()
+
+    def test_threads(self):
+        first, second = MemoryLink.pair(binary=True)
+        received = []
+        reader = threading.Thread(target=lambda: received.extend(
+            second.iter_chunks(idle_timeout=1, reconnect=False)))
+        reader.start()
+        for i in range(100):
+            first.write(b'%03d' % i)
+        first.close()
+        reader.join()
+        assert b''.join(received) == b''.join(b'%03d' % i
+                                               for i in range(100))
+
+    def test_full_pipe(self):
+        first, second = MemoryLink.pair(timeout=0.05)
+        first.write(b'x' * MemoryLink.PIPE_SIZE)
+        with pytest.raises(socket.timeout):
+            first.write(b'y')
+        assert len(second.read_exactly(MemoryLink.PIPE_SIZE)) == \
+            MemoryLink.PIPE_SIZE
+        first.write(b'y')
+        assert second.read(1) == 'y'
+
+    def test_listener(self):
+        echo = MemoryEcho('test-echo')
+        link = link_from_url('memory:test-echo?timeout=0.2')
+        assert link.url == 'memory:test-echo'
+        assert link.transact('ping\n', b'\n') == 'ping\n'
+        link.close()
+        # Named links can be opened again
+        assert link.transact('pong\n', b'\n') == 'pong\n'
+        link.close()
+        with pytest.raises(ValueError):
+            MemoryListener('test-echo')
+        echo.close()
+        with pytest.raises(socket.error):
+            link.open()
+
+    def test_accept_timeout(self):
+        with MemoryListener('test-accept') as listener:
+            assert listener.accept(0.05) is None
+            link = MemoryLink('test-accept')
+            link.open()
+            peer = listener.accept(0.05)
+            link.write(b'hi')
+            assert peer.read(2) == 'hi'
+            link.close()
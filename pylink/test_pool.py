@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+'''
+    pylink.test_pool
+    ----------------
+
+    The pylink connection pool test suite.
+
+    :copyright: Copyright 2012 Salem Harrache and contributors, see AUTHORS.
+    :license: BSD.
+
+'''
+from __future__ import unicode_literals
+import pytest
+import socket
+import time
+
+from .pool import LinkPool
+from .testing import EchoServer
+
+
+class TestLinkPool(object):
+    '''Suite test for LinkPool'''
+
+    def setup_class(self):
+        self.server = EchoServer(socket.SOCK_STREAM)
+        self.other_server = EchoServer(socket.SOCK_STREAM)
+        self.url = 'tcp:localhost:%d' % self.server.port
+        self.other_url = 'tcp:localhost:%d' % self.other_server.port
+
+    def teardown_class(self):
+        self.server.close()
+        self.other_server.close()
+
+    def test_reuse(self):
+        pool = LinkPool()
+        with pool.acquire(self.url) as link:
+            link.write('hello')
+            assert link.read(5) == 'hello'
+        with pool.acquire(self.url) as same_link:
+            assert same_link is link
+        assert len(pool) == 1
+        pool.close()
+        assert len(pool) == 0
+
+    def test_max_size(self):
+        pool = LinkPool(max_size=1)
+        link = pool.get(self.url)
+        with pytest.raises(TimeoutError):
+            pool.get(self.url, timeout=0.1)
+        pool.release(link)
+        assert pool.get(self.url, timeout=0.1) is link
+        pool.discard(link)
+        assert len(pool) == 0
+
+    def test_lru_cap(self):
+        pool = LinkPool(max_links=1)
+        with pool.acquire(self.url) as link:
+            pass
+        with pool.acquire(self.other_url) as other_link:
+            assert other_link is not link
+        assert link._socket is None
+        assert len(pool) == 1
+        pool.close()
+
+    def test_idle_eviction(self):
+        pool = LinkPool(max_idle=0.05)
+        with pool.acquire(self.url) as link:
+            pass
+        time.sleep(0.1)
+        pool.evict_idle()
+        assert link._socket is None
+        assert len(pool) == 0
+
+    def test_dead_link_is_replaced(self):
+        pool = LinkPool()
+        with pool.acquire(self.url) as link:
+            link.write(b'QUIT')
+        time.sleep(0.1)
+        assert not link.is_alive()
+        with pool.acquire(self.url) as new_link:
+            assert new_link is not link
+            new_link.write('hello')
+            assert new_link.read(5) == 'hello'
+        pool.close()
+
+    def test_error_discards_link(self):
+        pool = LinkPool()
+        with pytest.raises(ZeroDivisionError):
+            with pool.acquire(self.url) as link:
+                1 / 0
+        assert link._socket is None
+        assert len(pool) == 0
@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+'''
+    pylink.test_replay
+    ------------------
+
+    The pylink record and replay test suite.
+
+    :copyright: Copyright 2012 Salem Harrache and contributors, see AUTHORS.
+    :license: BSD.
+
+'''
+from __future__ import unicode_literals
+import pytest
+import socket
+import time
+
+from .link import TCPLink, SerialLink, GSMLink
+from .replay import RecordingLink, ReplayLink
+from .testing import EchoServer, FakeModem
+
+
+def exchange(link):
+    replies = []
+    link.write('hello')
+    replies.append(link.read(5))
+    link.write(b'ab\ncd\n')
+    replies.append(link.read_until(b'\n'))
+    replies.append(link.read_until(b'\n'))
+    link.write(b'\x03abc')
+    replies.append(link.read_frame(1))
+    return replies
+
+
+class TestReplay(object):
+    '''Suite test for RecordingLink and ReplayLink'''
+
+    def setup_class(self):
+        self.server = EchoServer(socket.SOCK_STREAM)
+
+    def teardown_class(self):
+        self.server.close()
+
+    def record(self, path, delay=0):
+        link = RecordingLink(TCPLink('localhost', self.server.port,
+                                     timeout=0.1), str(path))
+        replies = exchange(link)
+        if delay:
+            time.sleep(delay)
+            link.write('late')
+            replies.append(link.read(4))
+        link.close()
+        return replies
+
+    def test_replay(self, tmpdir):
+        path = tmpdir.join('session.trace')
+        replies = self.record(path)
+        assert replies == ['hello', 'ab\n', 'cd\n', 'abc']
+        link = ReplayLink(str(path))
+        assert exchange(link) == replies
+        assert link.done
+        assert link.url == 'replay:%s' % path
+        link.close()
+
+    def test_write_mismatch(self, tmpdir):
+        path = tmpdir.join('session.trace')
+        self.record(path)
+        link = ReplayLink(str(path))
+        with pytest.raises(ValueError):
+            link.write('help!')
+        link = ReplayLink(str(path), strict=False)
+        link.write('help!')
+        assert link.read_exactly(5) == 'hello'
+
+    def test_realtime(self, tmpdir):
+        path = tmpdir.join('session.trace')
+        self.record(path, delay=0.2)
+        link = ReplayLink(str(path), realtime=True)
+        begin = time.time()
+        exchange(link)
+        link.write('late')
+        assert link.read(4) == 'late'
+        assert time.time() - begin >= 0.2
+        link = ReplayLink(str(path))
+        begin = time.time()
+        exchange(link)
+        link.write('late')
+        assert link.read(4) == 'late'
+        assert time.time() - begin < 0.1
+
+    def test_gsm(self, tmpdir):
+        path = tmpdir.join('gsm.trace')
+        modem = FakeModem()
+        link = RecordingLink(GSMLink('01', SerialLink(modem.port,
+                                                      timeout=0.1)),
+                             str(path))
+        link.open()
+        link.write('ping')
+        assert link.read(4) == 'ping'
+        link.close()
+        modem.close()
+        link = ReplayLink(str(path))
+        link.write('ping')
+        assert link.read(4) == 'ping'
@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+'''
+    pylink.test_resolver
+    --------------------
+
+    The pylink host resolution test suite.
+
+    :copyright: Copyright 2012 Salem Harrache and contributors, see AUTHORS.
+    :license: BSD.
+
+'''
+from __future__ import unicode_literals
+import pytest
+import socket
+import time
+
+from . import link_from_url
+from .link import TCPLink
+from .resolver import Resolver, connect, _interleave
+from .testing import EchoServer
+
+
+def closed_port():
+    '''Return a local port nobody listens on.'''
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.bind(('127.0.0.1', 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    return port
+
+
+def has_ipv6():
+    try:
+        sock = socket.socket(socket.AF_INET6, socket.SOCK_STREAM)
+        sock.bind(('::1', 0))
+        sock.close()
+        return True
+    except (OSError, AttributeError):
+        return False
+
+
+class TestResolver(object):
+    '''Suite test for Resolver'''
+
+    def count_lookups(self, monkeypatch):
+        lookups = []
+        getaddrinfo = socket.getaddrinfo
+
+        def counted(host, *args):
+            lookups.append(host)
+            if host.endswith('.invalid'):
+                raise socket.gaierror(socket.EAI_NONAME, 'Unknown host')
+            return getaddrinfo(host, *args)
+        monkeypatch.setattr(socket, 'getaddrinfo', counted)
+        return lookups
+
+    def test_cache(self, monkeypatch):
+        lookups = self.count_lookups(monkeypatch)
+        resolver = Resolver(ttl=0.2, max_size=2)
+        first = resolver.resolve('localhost', 7)
+        assert first[0][4][:2] == ('127.0.0.1', 7)
+        assert resolver.resolve('localhost', 7) == first
+        assert lookups == ['localhost']
+        time.sleep(0.25)
+        resolver.resolve('localhost', 7)
+        assert len(lookups) == 2
+        # The least recently used entry is dropped
+        resolver.resolve('127.0.0.1', 7)
+        resolver.resolve('127.0.0.1', 8)
+        resolver.resolve('localhost', 7)
+        assert len(lookups) == 5
+        resolver.forget('127.0.0.1', 8)
+        resolver.resolve('127.0.0.1', 8)
+        assert len(lookups) == 6
+
+    def test_negative_cache(self, monkeypatch):
+        lookups = self.count_lookups(monkeypatch)
+        resolver = Resolver(negative_ttl=60)
+        for _ in range(2):
+            with pytest.raises(socket.gaierror):
+                resolver.resolve('no.such.host.invalid', 7)
+        assert lookups == ['no.such.host.invalid']
+        resolver.clear()
+        with pytest.raises(socket.gaierror):
+            resolver.resolve('no.such.host.invalid', 7)
+        assert len(lookups) == 2
+
+    def test_lazy_link_resolution(self, monkeypatch):
+        lookups = self.count_lookups(monkeypatch)
+        link = TCPLink('no.such.host.invalid', 7)
+        assert lookups == []
+        with pytest.raises(socket.gaierror):
+            link.open()
+
+
+class TestConnect(object):
+    '''Suite test for the happy eyeballs connect'''
+
+    def setup_class(self):
+        self.server = EchoServer(socket.SOCK_STREAM)
+
+    def teardown_class(self):
+        self.server.close()
+
+    def addresses(self, *ports):
+        return [(socket.AF_INET, socket.SOCK_STREAM, 0, '',
+                 ('127.0.0.1', port)) for port in ports]
+
+    def test_interleave(self):
+        v4 = self.addresses(1, 2, 3)
+        v6 = [(socket.AF_INET6, socket.SOCK_STREAM, 0, '', ('::1', port))
+              for port in (4, 5)]
+        assert _interleave(v6 + v4) == [v6[0], v4[0], v6[1], v4[1], v4[2]]
+
+    def test_fallback(self):
+        sock = connect(self.addresses(closed_port(), self.server.port),
+                       timeout=1)
+        assert sock.getpeername() == ('127.0.0.1', self.server.port)
+        sock.close()
+        with pytest.raises(socket.error):
+            connect(self.addresses(closed_port()), timeout=1)
+
+    def test_ipv6(self):
+        if not has_ipv6():
+            pytest.skip('No IPv6 loopback')
+        server = EchoServer(socket.SOCK_STREAM, '::1')
+        link = link_from_url(server.url)
+        assert link.url == 'tcp:[::1]:%d' % server.port
+        link.write('hello')
+        assert link.read(5) == 'hello'
+        link.close()
+        server.close()
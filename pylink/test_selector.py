@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+'''
+    pylink.test_selector
+    --------------------
+
+    The pylink link selector test suite.
+
+    :copyright: Copyright 2012 Salem Harrache and contributors, see AUTHORS.
+    :license: BSD.
+
+'''
+from __future__ import unicode_literals
+import socket
+import threading
+import time
+
+from .link import TCPLink, UDPLink, SerialLink
+from .selector import LinkSelector
+from .testing import EchoServer, SerialPair
+
+
+class TestLinkSelector(object):
+    '''Suite test for LinkSelector'''
+
+    def setup_class(self):
+        self.tcp_server = EchoServer(socket.SOCK_STREAM)
+        self.udp_server = EchoServer(socket.SOCK_DGRAM)
+
+    def teardown_class(self):
+        self.tcp_server.close()
+        self.udp_server.close()
+
+    def test_readable_links(self):
+        selector = LinkSelector()
+        tcp = TCPLink('localhost', self.tcp_server.port)
+        udp = UDPLink('localhost', self.udp_server.port)
+        selector.register(tcp)
+        selector.register(udp)
+        assert selector.select(0) == []
+        udp.write('udp')
+        assert selector.select(1) == [udp]
+        assert udp.read_exactly(3) == 'udp'
+        tcp.write('tcp\nmore')
+        assert selector.select(1) == [tcp]
+        assert tcp.read_until('\n') == 'tcp\n'
+        # Buffered data is reported without waiting
+        assert selector.select(None) == [tcp]
+        selector.unregister(tcp)
+        assert selector.select(0) == []
+        selector.close()
+        tcp.close()
+        udp.close()
+
+    def test_callbacks(self):
+        selector = LinkSelector()
+        received = []
+
+        def callback(link, data):
+            received.append((link, data))
+            if data == 'bye':
+                selector.stop()
+
+        links = [TCPLink('localhost', self.tcp_server.port)
+                 for i in range(3)]
+        thread = threading.Thread(target=selector.run, args=(5,))
+        thread.start()
+        # Register while the selector is running
+        for link in links:
+            selector.register(link, callback)
+        for i, link in enumerate(links):
+            link.write('link %d' % i)
+        time.sleep(0.2)
+        links[0].write('bye')
+        thread.join()
+        assert set(received[:3]) == set((link, 'link %d' % i)
+                                        for i, link in enumerate(links))
+        assert received[3] == (links[0], 'bye')
+        for link in links:
+            link.close()
+        selector.close()
+
+    def test_peer_close(self):
+        selector = LinkSelector()
+        received = []
+        link = TCPLink('localhost', self.tcp_server.port)
+        selector.register(link, lambda link, data: received.append(data))
+        link.write(b'QUIT')
+        for i in range(10):
+            selector.select(0.1)
+        assert received == ['']
+        assert selector.links == []
+        link.close()
+        selector.close()
+
+    def test_run_unregisters_links_without_callback(self):
+        selector = LinkSelector()
+        received = []
+        quiet = TCPLink('localhost', self.tcp_server.port)
+        served = TCPLink('localhost', self.tcp_server.port)
+        selector.register(quiet)
+        selector.register(served, lambda link, data: received.append(data))
+        quiet.write('nobody reads this')
+        served.write('ping')
+        selector.run(0.3)
+        assert received == ['ping']
+        assert selector.links == [served]
+        selector.close()
+        quiet.close()
+        served.close()
+
+    def test_readable_without_data(self):
+        class DeadLink(TCPLink):
+            # Readable for the OS, but no data ever comes out
+            def _recv_chunk(self, size, timeout):
+                return b''
+        selector = LinkSelector()
+        received = []
+        link = DeadLink('localhost', self.tcp_server.port)
+        selector.register(link, lambda link, data: received.append(data))
+        link.write('data')
+        for i in range(LinkSelector.MAX_EMPTY_WAKEUPS - 1):
+            selector.select(1)
+        assert received == [] and selector.links == [link]
+        selector.select(1)
+        assert received == ['']
+        assert selector.links == []
+        selector.close()
+        link.close()
+
+    def test_serial(self):
+        device = SerialPair()
+        selector = LinkSelector()
+        link = SerialLink(device.port, 38400)
+        selector.register(link)
+        device.write(b'data')
+        assert selector.select(1) == [link]
+        assert link.read_exactly(4) == 'data'
+        selector.close()
+        link.close()
+        device.close()
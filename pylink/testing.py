@@ -0,0 +1,218 @@
+# -*- coding: utf-8 -*-
+'''
+    pylink.testing
+    --------------
+
+    Local stand-ins for the remote devices, used by the test suite and the
+    benchmarks: TCP, UDP, Unix socket and in-memory echo servers, a
+    pseudo-terminal pair in place of a serial port and a scripted GSM
+    modem.
+
+    :copyright: Copyright 2012 Salem Harrache and contributors, see AUTHORS.
+    :license: BSD, see LICENSE for details.
+
+'''
+from __future__ import unicode_literals
+import os
+import socket
+import threading
+import time
+
+from .memory import MemoryListener
+
+
+class EchoServer(object):
+    '''Local echo server (TCP or UDP) running in daemon threads. A TCP
+    client sending ``QUIT`` gets disconnected. `host` may be an IPv6
+    address, or the path of a Unix socket (`port` is then ignored).'''
+    def __init__(self, kind=socket.SOCK_STREAM, host='127.0.0.1', port=0):
+        self.kind = kind
+        if host.startswith('/'):
+            self.sock = socket.socket(socket.AF_UNIX, kind)
+            self.sock.bind(host)
+            self.host, self.port = host, None
+        else:
+            family = socket.AF_INET6 if ':' in host else socket.AF_INET
+            self.sock = socket.socket(family, kind)
+            self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            self.sock.bind((host, port))
+            self.host, self.port = self.sock.getsockname()[:2]
+        if kind == socket.SOCK_STREAM:
+            self.sock.listen(128)
+            target = self.serve_tcp
+        else:
+            target = self.serve_udp
+        self.thread = threading.Thread(target=target)
+        self.thread.daemon = True
+        self.thread.start()
+
+    @property
+    def url(self):
+        if self.port is None:
+            if self.kind == socket.SOCK_STREAM:
+                return 'unix:%s' % self.host
+            return 'unix:%s?type=dgram' % self.host
+        scheme = 'tcp' if self.kind == socket.SOCK_STREAM else 'udp'
+        host = '[%s]' % self.host if ':' in self.host else self.host
+        return '%s:%s:%d' % (scheme, host, self.port)
+
+    def serve_tcp(self):
+        while True:
+            try:
+                conn, _ = self.sock.accept()
+            except OSError:
+                return
+            if self.port is not None:
+                conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            thread = threading.Thread(target=self.echo, args=(conn,))
+            thread.daemon = True
+            thread.start()
+
+    def echo(self, conn):
+        while True:
+            try:
+                data = conn.recv(65536)
+            except OSError:
+                break
+            if not data or data == b'QUIT':
+                break
+            conn.sendall(data)
+        conn.close()
+
+    def serve_udp(self):
+        while True:
+            try:
+                data, address = self.sock.recvfrom(65536)
+            except OSError:
+                return
+            self.sock.sendto(data, address)
+
+    def close(self):
+        self.sock.close()
+        if self.port is None and os.path.exists(self.host):
+            os.unlink(self.host)
+
+
+class MemoryEcho(object):
+    '''Echo server listening on ``memory:name``, in daemon threads.'''
+    def __init__(self, name):
+        self.listener = MemoryListener(name, binary=True)
+        self.url = 'memory:%s' % name
+        self.thread = threading.Thread(target=self.serve)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def serve(self):
+        while True:
+            link = self.listener.accept()
+            if link is None:
+                return
+            thread = threading.Thread(target=self.echo, args=(link,))
+            thread.daemon = True
+            thread.start()
+
+    def echo(self, link):
+        for data in link.iter_chunks(reconnect=False):
+            try:
+                link.write(data)
+            except socket.error:
+                break
+        link.close()
+
+    def close(self):
+        self.listener.close()
+
+
+class SerialPair(object):
+    '''Pseudo-terminal pair standing in for a serial line (POSIX only).
+    `port` is the device name to give to `SerialLink`, and the `master`
+    file descriptor is the remote device side.'''
+    def __init__(self):
+        import tty
+        self.master, self.slave = os.openpty()
+        tty.setraw(self.slave)
+        self.port = os.ttyname(self.slave)
+
+    def write(self, data):
+        '''Send `data` from the device side.'''
+        os.write(self.master, data)
+
+    def read(self, size=65536):
+        '''Read what the link sent to the device.'''
+        return os.read(self.master, size)
+
+    def close(self):
+        os.close(self.master)
+        os.close(self.slave)
+
+
+class SerialEcho(SerialPair):
+    '''Serial device echoing everything back, in a daemon thread.'''
+    def __init__(self):
+        super(SerialEcho, self).__init__()
+        self.thread = threading.Thread(target=self.serve)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def serve(self):
+        while True:
+            try:
+                self.write(self.read())
+            except OSError:
+                return
+
+
+class FakeModem(SerialPair):
+    '''Scripted Hayes modem on a pseudo-terminal. In command mode it
+    answers ``ATD<phone>`` after `dial_time` seconds with the result of
+    `results` for this phone (`result` by default), ``ATH`` and the
+    other AT commands with ``OK``. Once connected, the remote station
+    echoes the data, until ``+++`` switches back to command mode.'''
+    def __init__(self, dial_time=0, results=None, result='CONNECT 9600'):
+        super(FakeModem, self).__init__()
+        self.dial_time = dial_time
+        self.results = results or {}
+        self.result = result
+        self.connected = False
+        self.calls = []
+        self.thread = threading.Thread(target=self.serve)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def answer(self, text):
+        self.write(('\r\n%s\r\n' % text).encode('ascii'))
+
+    def serve(self):
+        command = b''
+        while True:
+            try:
+                data = self.read()
+            except OSError:
+                return
+            if self.connected:
+                if data == b'+++':
+                    self.connected = False
+                    self.answer('OK')
+                else:
+                    self.write(data)
+                continue
+            command += data
+            while b'\r' in command:
+                line, command = command.split(b'\r', 1)
+                self.command(line.strip().decode('ascii', 'replace'))
+
+    def command(self, line):
+        if line.upper().startswith('ATD'):
+            phone = line[3:]
+            self.calls.append(phone)
+            time.sleep(self.dial_time)
+            result = self.results.get(phone, self.result)
+            self.connected = result.startswith('CONNECT')
+            self.answer(result)
+        elif line:
+            self.answer('OK')
+
+    def drop_carrier(self):
+        '''Simulate a carrier loss during a data call.'''
+        self.connected = False
+        self.answer('NO CARRIER')
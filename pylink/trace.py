@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+'''
+    pylink.trace
+    ------------
+
+    Binary traffic trace: a compact record of every byte read and written by
+    the links, cheap enough to stay on in production instead of text logs.
+
+    A trace file starts with :data:`MAGIC` and is followed by records made
+    of a :data:`HEADER` (timestamp, kind, link id, payload length) and the
+    payload. The first time a link appears, a ``U`` record maps its id to
+    its url; ``R`` and ``W`` records hold the raw bytes read and written.
+
+    :copyright: Copyright 2012 Salem Harrache and contributors, see AUTHORS.
+    :license: BSD, see LICENSE for details.
+
+'''
+from __future__ import unicode_literals
+import mmap
+import struct
+import threading
+import time
+
+from .compat import str, format_string
+
+MAGIC = b'PYLKTRC1'
+
+#: timestamp (float64), kind (1 byte), link id (uint32), payload length
+HEADER = struct.Struct('<dcII')
+
+READ = b'R'
+WRITE = b'W'
+URL = b'U'
+
+#: Trace used by all links, see :func:`active_trace`.
+TRACE = None
+
+
+class TrafficTrace(object):
+    '''Append traffic records to `output`, a binary file object or a
+    path.'''
+    def __init__(self, output):
+        if hasattr(output, 'write'):
+            self.file = output
+        else:
+            self.file = open(output, 'wb')
+        self.file.write(MAGIC)
+        self._ids = {}
+        self._lock = threading.Lock()
+
+    def record(self, kind, url, data, timestamp=None):
+        '''Write a record of `data` (`READ` or `WRITE`) for the link `url`.'''
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+        if timestamp is None:
+            timestamp = time.time()
+        with self._lock:
+            link_id = self._ids.get(url)
+            if link_id is None:
+                link_id = self._ids[url] = len(self._ids)
+                name = format_string(url)
+                self.file.write(HEADER.pack(timestamp, URL, link_id,
+                                            len(name)) + name)
+            self.file.write(HEADER.pack(timestamp, kind, link_id, len(data)))
+            self.file.write(data)
+
+    def flush(self):
+        with self._lock:
+            self.file.flush()
+
+    def close(self):
+        with self._lock:
+            self.file.close()
+
+
+def iter_records(buffer):
+    '''Yield the (`timestamp`, `kind`, `url`, `data`) records of a trace held
+    in `buffer` (bytes, mmap...). `data` is a memoryview on the buffer, only
+    valid until the next record.'''
+    if bytes(buffer[:len(MAGIC)]) != MAGIC:
+        raise ValueError('Not a pylink trace')
+    urls = {}
+    offset = len(MAGIC)
+    with memoryview(buffer) as view:
+        while offset + HEADER.size <= len(view):
+            timestamp, kind, link_id, size = HEADER.unpack_from(view, offset)
+            offset += HEADER.size
+            data = view[offset:offset + size]
+            offset += size
+            if kind == URL:
+                urls[link_id] = bytes(data).decode('utf-8')
+            else:
+                yield timestamp, kind, urls[link_id], data
+            data.release()
+
+
+def read_trace(path):
+    '''Yield the records of the trace file `path`, see :func:`iter_records`.
+    The file is memory-mapped, and the payloads are copied to bytes.'''
+    with open(path, 'rb') as trace_file:
+        buffer = mmap.mmap(trace_file.fileno(), 0, access=mmap.ACCESS_READ)
+    records = iter_records(buffer)
+    try:
+        for timestamp, kind, url, data in records:
+            data = bytes(data)
+            yield timestamp, kind, url, data
+    finally:
+        records.close()
+        buffer.close()
+
+
+def active_trace(output):
+    '''Record the traffic of all links to `output` (a path or a binary file
+    object). Return the trace, pass None to stop tracing.'''
+    global TRACE
+    if TRACE is not None:
+        TRACE.close()
+    TRACE = None if output is None else TrafficTrace(output)
+    return TRACE